@@ -18,6 +18,102 @@ class Settings(BaseSettings):
     OPENROUTER_BASE_URL: str = "https://openrouter.ai/api/v1"
     OPENROUTER_MODEL: str = "openai/gpt-4o"
 
+    # LLM 连接池
+    LLM_TIMEOUT_SECONDS: float = 60.0
+    LLM_HTTP2: bool = True  # 需安装 httpx[http2]，否则自动退回 HTTP/1.1
+    LLM_MAX_CONNECTIONS: int = 20
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    LLM_KEEPALIVE_EXPIRY: float = 120.0  # 空闲连接保活秒数
+    LLM_WARMUP: bool = True  # 启动时预热连接
+
+    # LLM 容错：重试、对冲请求、熔断与备用模型
+    LLM_MAX_RETRIES: int = 2  # 429/5xx/超时的重试次数
+    LLM_RETRY_BACKOFF_BASE: float = 0.5  # 指数退避基数（秒）
+    LLM_RETRY_BACKOFF_MAX: float = 8.0
+    LLM_HEDGE_ENABLED: bool = True  # 超过近期 p95 耗时未返回时追加一个相同请求
+    LLM_HEDGE_MIN_DELAY: float = 2.0
+    LLM_HEDGE_MAX_DELAY: float = 20.0
+    LLM_CIRCUIT_FAILURE_THRESHOLD: int = 5  # 连续失败次数达到后熔断该模型
+    LLM_CIRCUIT_RESET_SECONDS: float = 30.0
+    LLM_FALLBACK_MODELS: str = ""  # 逗号分隔，按顺序降级；格式 model 或 model@base_url
+    # 其它供应商的秘钥，逗号分隔的 host=key；OPENROUTER_API_KEY 只发给 OPENROUTER_BASE_URL 的 host
+    LLM_ENDPOINT_API_KEYS: str = ""
+
+    # LLM 费用估算（美元 / 百万 token）；上游返回 usage.cost 时以其为准
+    LLM_PROMPT_PRICE_PER_MTOK: float = 0.0
+    LLM_COMPLETION_PRICE_PER_MTOK: float = 0.0
+    # 可查看全局 LLM 统计（所有用户汇总）的用户名，逗号分隔；其他用户只能看到自己的统计
+    METRICS_ADMIN_USERNAMES: str = ""
+
+    # LLM 解析结果缓存
+    PARSE_CACHE_ENABLED: bool = True
+    PARSE_CACHE_MAX_ENTRIES: int = 512
+    PARSE_CACHE_TTL_SECONDS: int = 1800
+    PARSE_CACHE_DB_PATH: str = ""  # 为空则只用内存缓存，如 ./data/parse_cache.db
+
+    # 系统提示词模板热加载检查间隔（秒）
+    PROMPT_RELOAD_INTERVAL_SECONDS: float = 2.0
+
+    # 批量记账（多图/多段文字）
+    RECORD_BATCH_MAX_ITEMS: int = 20
+    RECORD_BATCH_CONCURRENCY: int = 4  # 同时进行的 LLM 解析数
+
+    # 异步解析任务（POST /v1/record?mode=job）
+    PARSE_JOB_WORKERS: int = 2  # 后台工作协程数
+    PARSE_JOB_MAX_ATTEMPTS: int = 3  # 执行中被进程重启打断的最多次数
+    PARSE_JOB_RETENTION_HOURS: int = 24  # 已完成任务的保留时长
+    PARSE_JOB_LEASE_SECONDS: int = 60  # 执行租约时长，执行中每 1/3 租约续约一次
+    PARSE_JOB_POLL_SECONDS: float = 2.0  # SSE 轮询任务状态的间隔（本进程内的状态变化会立即推送）
+
+    # Idempotency-Key：保存响应供客户端重试时重放
+    IDEMPOTENCY_TTL_HOURS: int = 24
+    IDEMPOTENCY_LOCK_SECONDS: int = 300  # 处理中的记录超过该时长视为已中断，允许重试接管
+
+    # 图片预处理
+    IMAGE_WORKERS: int = 4  # 图片处理线程数
+    IMAGE_MAX_UPLOAD_MB: int = 15
+
+    # 截图感知哈希去重（命中则复用上次解析结果，跳过视觉模型调用）
+    IMAGE_DEDUPE_ENABLED: bool = True
+    IMAGE_DEDUPE_MAX_DISTANCE: int = 3  # 256 位 dHash 的汉明距离阈值，仅用于疑似重复提示
+    IMAGE_DEDUPE_MAX_AGE_DAYS: int = 7
+
+    # 账目去重：按用户缓存已入账 hash_id，未命中即判定为新账目，省去 IN 查询
+    # 缓存按用户数据版本校验（每次一次主键查询），其它进程入账或删除后自动重新加载
+    DUPLICATE_FILTER_ENABLED: bool = True
+    DUPLICATE_FILTER_MAX_USERS: int = 1000
+    # 疑似重复：金额相同、日期相近、商户备注相似的已入账账目，结果为 duplicate_score (0~1)
+    DUPLICATE_FUZZY_ENABLED: bool = True
+    DUPLICATE_FUZZY_DAYS: int = 1
+
+    # 分类关键词：每个分类最多保留的学习关键词数（按命中次数、最近使用淘汰），提示词中每类最多列出的关键词数
+    KEYWORD_MAX_PER_CATEGORY: int = 50
+    KEYWORD_PROMPT_LIMIT: int = 8
+
+    # 历史分类频次（商户/备注词/消费人 -> 分类）：置信时预填或覆盖 LLM 分类，并精简文字解析的分类列表
+    CATEGORY_PREDICT_ENABLED: bool = True
+    CATEGORY_PREDICT_MIN_SUPPORT: int = 3  # 特征至少出现该次数才参与预测
+    CATEGORY_PREDICT_CONFIDENCE: float = 0.8  # LLM 未给出分类（或为"其他"）时预填的阈值
+    CATEGORY_OVERRIDE_CONFIDENCE: float = 0.9  # 覆盖 LLM 分类的阈值
+
+    # 统计分析：按用户缓存账目列式快照，账目变动提交后增量并入
+    ANALYTICS_CACHE_MAX_USERS: int = 200
+
+    # 读接口 ETag/304 与进程内响应缓存；每次请求查库取用户数据版本，多进程部署下同样及时失效
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_MAX_ENTRIES: int = 500
+
+    # 账目关键词检索使用 SQLite FTS5 全文索引（trigram），关闭或不可用时使用 LIKE
+    EXPENSE_FTS_ENABLED: bool = True
+
+    # 本地规则快速解析（命中则跳过 LLM）
+    FAST_PARSE_ENABLED: bool = True
+    FAST_PARSE_MIN_CONFIDENCE: float = 0.85
+
+    # 纠错指令本地语法解析（"全部确认" "删除3" "1金额改为80" 等不经过 LLM）
+    INSTRUCTION_GRAMMAR_ENABLED: bool = True
+    INSTRUCTION_CONTEXT_FORMAT: str = "compact"  # compact: 待确认条目紧凑表格；json: 完整批次 JSON（原格式）
+
     # 安全配置
     RATE_LIMIT_PER_MINUTE: int = 60
     API_KEY_LENGTH: int = 32
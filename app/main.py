@@ -4,16 +4,34 @@ from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from app.config import settings
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import auth, config, record, expenses, export
+from app.routers import auth, config, record, expenses, export, metrics, analytics
 from app.middleware.rate_limit import RateLimitMiddleware
 from app.middleware.jwt_refresh import JWTRefreshMiddleware
-from app.utils.scheduler import cleanup_expired_staging
+from app.utils.scheduler import cleanup_expired_staging, cleanup_finished_jobs
+from app.models.database import init_models
+from app.services.category_keywords import migrate_legacy_keywords
+from app.services.expense_rollups import backfill_rollups
+from app.services.llm_client import llm_client_manager
+from app.services.job_queue import parse_job_queue
+from app.utils.image import shutdown_image_executor
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # 补建新增的数据表
+    await init_models()
+    await migrate_legacy_keywords()
+    await backfill_rollups()
     # 启动清理任务
     asyncio.create_task(cleanup_expired_staging())
+    asyncio.create_task(cleanup_finished_jobs())
+    # 建立 LLM 连接池并预热
+    await llm_client_manager.start()
+    # 启动解析任务工作协程，并恢复上次未完成的任务
+    await parse_job_queue.start()
     yield
+    await parse_job_queue.stop()
+    await llm_client_manager.close()
+    shutdown_image_executor()
 
 app = FastAPI(
     title=settings.APP_NAME,
@@ -55,6 +73,8 @@ app.include_router(config.router, prefix="/v1")
 app.include_router(record.router, prefix="/v1")
 app.include_router(expenses.router, prefix="/v1")
 app.include_router(export.router, prefix="/v1")
+app.include_router(metrics.router, prefix="/v1")
+app.include_router(analytics.router, prefix="/v1")
 
 # 挂载前端静态文件
 app.mount("/frontend", StaticFiles(directory="frontend"), name="frontend")
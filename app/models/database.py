@@ -12,3 +12,27 @@ AsyncSessionLocal = async_sessionmaker(
 async def get_db():
     async with AsyncSessionLocal() as session:
         yield session
+
+def _create_missing_indexes(conn):
+    # create_all 不会给已存在的表补建索引，逐个按需创建
+    from app.models.tables import Base
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+async def init_models():
+    """创建缺失的数据表与索引（已有表不受影响），启动时调用，保证新增功能表存在"""
+    from app.models.tables import Base
+    from app.models.search import create_expense_fts
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_create_missing_indexes)
+        await conn.run_sync(create_expense_fts)
+
+def dialect_insert(db: AsyncSession, model):
+    """按数据库方言构造 INSERT，以便使用 ON CONFLICT（SQLite / PostgreSQL 语法一致）"""
+    if db.bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
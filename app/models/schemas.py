@@ -8,6 +8,9 @@ class RecordRequest(BaseModel):
     content: str = Field(..., min_length=1)
     mime_type: Optional[str] = None
 
+class BatchRecordRequest(BaseModel):
+    items: List[RecordRequest] = Field(..., min_length=1)
+
 class StagingItem(BaseModel):
     temp_id: int
     date: str
@@ -20,6 +23,10 @@ class StagingItem(BaseModel):
     is_essential: int = 0
     linked_asset: Optional[str] = None
     is_duplicate: bool = False
+    duplicate_score: float = 0.0  # 与已入账账目的疑似重复程度，1 为完全相同
+    duplicate_of: Optional[int] = None  # 最相似的已入账账目 id
+    category_source: Optional[str] = None  # 分类由历史频次给出时为 "history"
+    category_confidence: Optional[float] = None  # 历史频次预测的置信度
     confidence: float = 1.0
 
 class RecordResponse(BaseModel):
@@ -0,0 +1,68 @@
+import logging
+
+from sqlalchemy import column, literal_column, table, text
+from sqlalchemy.engine import Connection
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 账目全文索引（SQLite FTS5，trigram 分词，中英文子串均可检索）
+# 以 expenses 为外部内容表，只存索引不存正文；由触发器在插入/修改/删除时同步
+FTS_TABLE = "expenses_fts"
+FTS_COLUMNS = ("remark", "payee", "consumer", "main_category", "sub_category")
+
+# trigram 分词至少需要 3 个字符，更短的关键词仍使用 LIKE
+FTS_MIN_LENGTH = 3
+
+expenses_fts = table(FTS_TABLE, column("rowid"), column("rank"))
+
+# 启动时建好索引后置为 True；非 SQLite 或 SQLite 未编译 FTS5 时保持 False，检索回退为 LIKE
+fts_ready = False
+
+def _columns(prefix: str = "") -> str:
+    return ", ".join(prefix + name for name in FTS_COLUMNS)
+
+_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"{_columns()}, content='expenses', content_rowid='id', tokenize='trigram')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON expenses BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, {_columns()}) VALUES (new.id, {_columns('new.')}); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON expenses BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns()}) VALUES ('delete', old.id, {_columns('old.')}); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF {_columns()} ON expenses BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns()}) VALUES ('delete', old.id, {_columns('old.')}); "
+    f"INSERT INTO {FTS_TABLE}(rowid, {_columns()}) VALUES (new.id, {_columns('new.')}); END",
+]
+
+def create_expense_fts(conn: Connection):
+    """创建全文索引表与同步触发器（可重复执行）；索引表是新建的则从现有账目构建"""
+    global fts_ready
+    if not settings.EXPENSE_FTS_ENABLED or conn.dialect.name != "sqlite":
+        return
+    exists = conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+    ).first()
+    try:
+        for ddl in _DDL:
+            conn.exec_driver_sql(ddl)
+    except Exception as e:
+        logger.warning(f"全文索引不可用，关键词检索使用 LIKE: {e}")
+        return
+    if not exists:
+        rebuild_expense_fts(conn)
+    fts_ready = True
+
+def rebuild_expense_fts(conn: Connection):
+    """按 expenses 全量重建全文索引"""
+    conn.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+def fts_query(keyword: str) -> str:
+    """关键词 -> FTS5 短语查询（整体按子串匹配，引号转义）"""
+    return '"' + keyword.replace('"', '""') + '"'
+
+def fts_match(keyword: str):
+    return literal_column(FTS_TABLE).op("MATCH")(fts_query(keyword))
+
+def use_fts(keyword: str) -> bool:
+    return fts_ready and len(keyword) >= FTS_MIN_LENGTH
@@ -27,7 +27,7 @@ class Category(Base):
     user_id: Mapped[str] = mapped_column(String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     main_name: Mapped[str] = mapped_column(String, nullable=False)
     sub_name: Mapped[str] = mapped_column(String, nullable=False)
-    keywords: Mapped[Optional[str]] = mapped_column(String)  # 逗号分隔
+    keywords: Mapped[Optional[str]] = mapped_column(String)  # 旧版逗号分隔关键词，启动时迁移到 category_keywords，不再写入
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
     __table_args__ = (
@@ -35,6 +35,67 @@ class Category(Base):
         Index("idx_categories_user", "user_id"),
     )
 
+class CategoryKeyword(Base):
+    """分类关键词：默认关键词与确认账目时学到的备注，按命中次数与最近使用时间淘汰"""
+    __tablename__ = "category_keywords"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[str] = mapped_column(String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    category_id: Mapped[int] = mapped_column(Integer, ForeignKey("categories.id", ondelete="CASCADE"), nullable=False)
+    keyword: Mapped[str] = mapped_column(String, nullable=False)
+    source: Mapped[str] = mapped_column(String, default="learned")  # default, learned
+    hits: Mapped[int] = mapped_column(Integer, default=0)
+    last_used_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("category_id", "keyword"),
+        Index("idx_category_keywords_user", "user_id", "keyword"),
+    )
+
+class CategoryStat(Base):
+    """已入账账目的分类频次：商户 / 备注词 / 消费人 -> (一级, 二级) 出现次数，入账、修改、删除时增量更新"""
+    __tablename__ = "category_stats"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[str] = mapped_column(String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    feature_type: Mapped[str] = mapped_column(String, nullable=False)  # payee, token, consumer
+    feature: Mapped[str] = mapped_column(String, nullable=False)
+    main_category: Mapped[str] = mapped_column(String, nullable=False)
+    sub_category: Mapped[str] = mapped_column(String, nullable=False, default="")
+    count: Mapped[int] = mapped_column(Integer, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "feature_type", "feature", "main_category", "sub_category"),
+    )
+
+class ExpenseRollup(Base):
+    """按月汇总的支出：(用户, 年月, 一级, 二级, 消费人) -> 金额合计与笔数，与账目写入同一事务增量更新"""
+    __tablename__ = "expense_rollups"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[str] = mapped_column(String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    month: Mapped[str] = mapped_column(String, nullable=False)  # YYYY-MM
+    main_category: Mapped[str] = mapped_column(String, nullable=False)
+    sub_category: Mapped[str] = mapped_column(String, nullable=False, default="")
+    consumer: Mapped[str] = mapped_column(String, nullable=False, default="")
+    total: Mapped[float] = mapped_column(Float, default=0.0)
+    count: Mapped[int] = mapped_column(Integer, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "month", "main_category", "sub_category", "consumer"),
+    )
+
+class UserDataVersion(Base):
+    """用户数据版本：账目或配置每次写入提交时加一，读接口据此生成 ETag 与响应缓存键"""
+    __tablename__ = "user_data_versions"
+
+    user_id: Mapped[str] = mapped_column(String, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
 class Payee(Base):
     __tablename__ = "payees"
 
@@ -80,8 +141,11 @@ class Expense(Base):
 
     __table_args__ = (
         UniqueConstraint("user_id", "hash_id"),
-        Index("idx_expenses_user_date", "user_id", "date"),
+        # 列表按 (date desc, id desc) 排序，游标分页按该索引定位
+        Index("idx_expenses_user_date_id", "user_id", "date", "id"),
         Index("idx_expenses_category", "user_id", "main_category"),
+        # 疑似重复检测的分块键：金额相同 + 日期窗口
+        Index("idx_expenses_user_amount_date", "user_id", "amount", "date"),
     )
 
 class StagingArea(Base):
@@ -93,9 +157,77 @@ class StagingArea(Base):
     temp_id: Mapped[int] = mapped_column(Integer, nullable=False)
     parsed_json: Mapped[str] = mapped_column(Text, nullable=False)
     is_duplicate: Mapped[int] = mapped_column(Integer, default=0)
-    status: Mapped[str] = mapped_column(String, default="pending")  # pending/confirmed/rejected/expired
+    status: Mapped[str] = mapped_column(String, default="pending")  # pending/confirmed/rejected/expired/duplicate
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
     __table_args__ = (
         Index("idx_staging_user_batch", "user_id", "batch_id"),
     )
+
+class ImageFingerprint(Base):
+    """已解析截图的像素摘要与感知哈希：像素完全相同时复用解析结果，哈希相近仅作疑似重复提示"""
+    __tablename__ = "image_fingerprints"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[str] = mapped_column(String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    content_hash: Mapped[str] = mapped_column(String, nullable=False)  # 送给模型的像素的 sha256
+    dhash: Mapped[str] = mapped_column(String, nullable=False)  # 64 位 dHash 的十六进制
+    dhash_fine: Mapped[str] = mapped_column(String, nullable=False)  # 256 位 dHash，用于相似度比对
+    # 64 位 dHash 拆为 4 段 16 位，汉明距离 <= 3 的两个哈希必有一段完全相同，可走索引召回候选
+    band0: Mapped[int] = mapped_column(Integer, nullable=False)
+    band1: Mapped[int] = mapped_column(Integer, nullable=False)
+    band2: Mapped[int] = mapped_column(Integer, nullable=False)
+    band3: Mapped[int] = mapped_column(Integer, nullable=False)
+    items_json: Mapped[str] = mapped_column(Text, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("idx_image_fp_content", "user_id", "content_hash"),
+        Index("idx_image_fp_band0", "user_id", "band0"),
+        Index("idx_image_fp_band1", "user_id", "band1"),
+        Index("idx_image_fp_band2", "user_id", "band2"),
+        Index("idx_image_fp_band3", "user_id", "band3"),
+    )
+
+class ParseJob(Base):
+    """异步解析任务：请求先落库再由后台工作协程处理，进程重启后继续执行"""
+    __tablename__ = "parse_jobs"
+
+    id: Mapped[str] = mapped_column(String, primary_key=True)
+    user_id: Mapped[str] = mapped_column(String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    status: Mapped[str] = mapped_column(String, default="queued")  # queued, running, succeeded, failed
+    input_type: Mapped[str] = mapped_column(String, nullable=False)  # text, image
+    payload: Mapped[str] = mapped_column(Text, nullable=False)  # 文字或图片 base64，完成后清空
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    # running 任务的租约到期时间：执行方定期续约，过期说明执行它的进程已退出，可被重新认领
+    lease_until: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    result_json: Mapped[Optional[str]] = mapped_column(Text)
+    error: Mapped[Optional[str]] = mapped_column(Text)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+
+    __table_args__ = (
+        Index("idx_parse_jobs_status", "status", "created_at"),
+        Index("idx_parse_jobs_user", "user_id", "created_at"),
+    )
+
+class IdempotencyRecord(Base):
+    """Idempotency-Key 对应的请求与已返回的响应，客户端重试时直接重放"""
+    __tablename__ = "idempotency_keys"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[str] = mapped_column(String, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    key: Mapped[str] = mapped_column(String, nullable=False)
+    request_hash: Mapped[str] = mapped_column(String, nullable=False)  # 接口 + 请求体的指纹
+    status: Mapped[str] = mapped_column(String, default="in_progress")  # in_progress, completed
+    status_code: Mapped[Optional[int]] = mapped_column(Integer)
+    response_json: Mapped[Optional[str]] = mapped_column(Text)
+    location: Mapped[Optional[str]] = mapped_column(String)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    completed_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "key"),
+        Index("idx_idempotency_created", "created_at"),
+    )
@@ -0,0 +1,135 @@
+from datetime import datetime
+from typing import Any, Dict, Literal, Optional
+
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.database import get_db
+from app.models.tables import User
+from app.models.schemas import SuccessResponse
+from app.middleware.auth import verify_api_key
+from app.services.analytics import analytics_cache, day_index, month_index, month_key
+from app.services.response_cache import cached
+
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+
+Dimension = Literal["main_category", "sub_category", "consumer", "payee", "is_essential"]
+
+def _filters(main_category: Optional[str], consumer: Optional[str], payee: Optional[str], is_essential: Optional[int]) -> Dict[str, Any]:
+    filters = {"main_category": main_category, "consumer": consumer, "payee": payee, "is_essential": is_essential}
+    return {k: v for k, v in filters.items() if v is not None}
+
+def _delta(current: float, previous: float) -> Dict[str, Any]:
+    change = current - previous
+    return {
+        "previous": round(float(previous), 2),
+        "change": round(float(change), 2),
+        "rate": round(float(change / previous), 4) if previous else None
+    }
+
+def _parse(parser, value: Optional[str], name: str):
+    if value is None:
+        return None
+    try:
+        return parser(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} 格式不正确")
+
+@router.get("/trends", response_model=SuccessResponse)
+async def get_trends(
+    request: Request,
+    response: Response,
+    dimension: Optional[Dimension] = None,  # 不传时只返回总支出
+    months: int = Query(12, ge=1, le=120),
+    end_month: Optional[str] = None,  # YYYY-MM，默认当月
+    top: int = Query(10, ge=1, le=50),  # 最多返回的分组数，其余合并为 others
+    main_category: Optional[str] = None,
+    consumer: Optional[str] = None,
+    payee: Optional[str] = None,
+    is_essential: Optional[int] = Query(None, ge=0, le=1),
+    user: User = Depends(verify_api_key),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    按月支出趋势：每个分组一条月度序列，附最后一个月的环比 (mom) 与同比 (yoy)
+    """
+    async def handler():
+        last = _parse(month_index, end_month, "end_month")
+        if last is None:
+            last = month_index(datetime.now().strftime("%Y-%m"))
+        # 同比需要 12 个月前的数据，矩阵至少覆盖 13 个月
+        window = max(months, 13)
+        first = last - window + 1
+
+        columns = await analytics_cache.get(db, user.id)
+        selected = columns.mask(filters=_filters(main_category, consumer, payee, is_essential))
+        totals, counts = columns.monthly(dimension, selected, first, window)
+
+        def series(values: np.ndarray) -> Dict[str, Any]:
+            return {
+                "values": [round(float(v), 2) for v in values[-months:]],
+                "total": round(float(values[-months:].sum()), 2),
+                "mom": _delta(values[-1], values[-2]),
+                "yoy": _delta(values[-1], values[-13])
+            }
+
+        overall = totals.sum(axis=0)
+        data = {
+            "dimension": dimension,
+            "periods": [month_key(first + i) for i in range(window - months, window)],
+            "total": series(overall)
+        }
+        if dimension is not None:
+            # 按展示窗口内的金额取前 top 个分组
+            window_totals = totals[:, -months:].sum(axis=1)
+            order = [code for code in np.argsort(-window_totals, kind="stable") if counts[code]]
+            data["series"] = [{"key": columns.label(dimension, code), **series(totals[code])} for code in order[:top]]
+            rest = order[top:]
+            data["others"] = {"groups": len(rest), **series(totals[rest].sum(axis=0))} if rest else None
+        return SuccessResponse(data=data)
+
+    return await cached(request, response, user.id, db, handler)
+
+@router.get("/breakdown", response_model=SuccessResponse)
+async def get_breakdown(
+    request: Request,
+    response: Response,
+    dimension: Dimension = "main_category",
+    start_date: Optional[str] = None,  # YYYY-MM-DD，默认当月 1 日
+    end_date: Optional[str] = None,  # YYYY-MM-DD，默认不限
+    top: int = Query(10, ge=1, le=100),
+    main_category: Optional[str] = None,
+    consumer: Optional[str] = None,
+    payee: Optional[str] = None,
+    is_essential: Optional[int] = Query(None, ge=0, le=1),
+    user: User = Depends(verify_api_key),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    区间内按维度的支出构成（金额、笔数、占比），取前 top 项；dimension=payee 即商户排行
+    """
+    async def handler():
+        start_day = _parse(day_index, start_date or datetime.now().strftime("%Y-%m-01"), "start_date")
+        end_day = _parse(day_index, end_date, "end_date")
+
+        columns = await analytics_cache.get(db, user.id)
+        selected = columns.mask(start_day, end_day, _filters(main_category, consumer, payee, is_essential))
+        groups = columns.breakdown(dimension, selected)
+        total_amount = round(float(columns.amount[selected].sum()), 2)
+        for group in groups:
+            group["share"] = round(group["amount"] / total_amount, 4) if total_amount else None
+
+        rest = groups[top:]
+        return SuccessResponse(data={
+            "dimension": dimension,
+            "items": groups[:top],
+            "others": {
+                "groups": len(rest),
+                "amount": round(sum(g["amount"] for g in rest), 2),
+                "count": sum(g["count"] for g in rest)
+            } if rest else None,
+            "total": {"amount": total_amount, "count": int(selected.sum())}
+        })
+
+    return await cached(request, response, user.id, db, handler)
@@ -1,12 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, delete
-from typing import List
+from typing import Dict, List
 
 from app.models.database import get_db
 from app.models.tables import User, Category, Payee, Asset
 from app.models.schemas import SuccessResponse, ConfigItem
 from app.middleware.auth import verify_api_key
+from app.services.prompt_cache import user_context_cache
+from app.services.category_keywords import seed_keywords, split_keywords, load_keywords
+from app.services.data_version import bump_on_commit
+from app.services.response_cache import cached
 
 router = APIRouter(prefix="/config", tags=["config"])
 
@@ -44,22 +48,34 @@ async def init_user_defaults(user_id: str, db: AsyncSession):
         return
 
     categories = [
-        Category(user_id=user_id, main_name=m, sub_name=s, keywords=k)
-        for m, s, k in DEFAULT_CATEGORIES
+        Category(user_id=user_id, main_name=m, sub_name=s)
+        for m, s, _ in DEFAULT_CATEGORIES
     ]
     db.add_all(categories)
+    await db.flush()
+    await seed_keywords(db, user_id, {
+        c.id: split_keywords(k) for c, (_, _, k) in zip(categories, DEFAULT_CATEGORIES)
+    })
+    await bump_on_commit(db, user_id)
     await db.commit()
+    user_context_cache.invalidate(user_id)
 
 @router.get("/categories", response_model=SuccessResponse)
-async def get_categories(user: User = Depends(verify_api_key), db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Category).where(Category.user_id == user.id))
-    items = result.scalars().all()
-    return SuccessResponse(data=[{
-        "id": i.id,
-        "main_name": i.main_name,
-        "sub_name": i.sub_name,
-        "keywords": i.keywords
-    } for i in items])
+async def get_categories(request: Request, response: Response, user: User = Depends(verify_api_key), db: AsyncSession = Depends(get_db)):
+    async def handler():
+        result = await db.execute(select(Category).where(Category.user_id == user.id))
+        items = result.scalars().all()
+        keywords: Dict[int, List[str]] = {}
+        for entry in await load_keywords(db, user.id):
+            keywords.setdefault(entry.category_id, []).append(entry.keyword)
+        return SuccessResponse(data=[{
+            "id": i.id,
+            "main_name": i.main_name,
+            "sub_name": i.sub_name,
+            "keywords": ",".join(keywords.get(i.id, []))
+        } for i in items])
+
+    return await cached(request, response, user.id, db, handler)
 
 @router.post("/categories/init", response_model=SuccessResponse)
 async def force_init_categories(user: User = Depends(verify_api_key), db: AsyncSession = Depends(get_db)):
@@ -68,10 +84,13 @@ async def force_init_categories(user: User = Depends(verify_api_key), db: AsyncS
 
 # 成员管理 (Payees)
 @router.get("/payees", response_model=SuccessResponse)
-async def get_payees(user: User = Depends(verify_api_key), db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Payee).where(Payee.user_id == user.id))
-    items = result.scalars().all()
-    return SuccessResponse(data=[{"id": i.id, "name": i.name} for i in items])
+async def get_payees(request: Request, response: Response, user: User = Depends(verify_api_key), db: AsyncSession = Depends(get_db)):
+    async def handler():
+        result = await db.execute(select(Payee).where(Payee.user_id == user.id))
+        items = result.scalars().all()
+        return SuccessResponse(data=[{"id": i.id, "name": i.name} for i in items])
+
+    return await cached(request, response, user.id, db, handler)
 
 @router.post("/payees", response_model=SuccessResponse)
 async def add_payee(req: ConfigItem, user: User = Depends(verify_api_key), db: AsyncSession = Depends(get_db)):
@@ -82,7 +101,9 @@ async def add_payee(req: ConfigItem, user: User = Depends(verify_api_key), db: A
     
     item = Payee(user_id=user.id, name=req.name)
     db.add(item)
+    await bump_on_commit(db, user.id)
     await db.commit()
+    user_context_cache.invalidate(user.id)
     return SuccessResponse(message="添加成功", data={"id": item.id, "name": item.name})
 
 @router.post("/payees", response_model=SuccessResponse)
@@ -94,21 +115,28 @@ async def add_payee(req: ConfigItem, user: User = Depends(verify_api_key), db: A
     
     item = Payee(user_id=user.id, name=req.name)
     db.add(item)
+    await bump_on_commit(db, user.id)
     await db.commit()
+    user_context_cache.invalidate(user.id)
     return SuccessResponse(message="添加成功", data={"id": item.id, "name": item.name})
 
 @router.delete("/payees/{payee_id}", response_model=SuccessResponse)
 async def delete_payee(payee_id: int, user: User = Depends(verify_api_key), db: AsyncSession = Depends(get_db)):
     await db.execute(delete(Payee).where(Payee.user_id == user.id, Payee.id == payee_id))
+    await bump_on_commit(db, user.id)
     await db.commit()
+    user_context_cache.invalidate(user.id)
     return SuccessResponse(message="已删除")
 
 # 资产管理 (Assets)
 @router.get("/assets", response_model=SuccessResponse)
-async def get_assets(user: User = Depends(verify_api_key), db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Asset).where(Asset.user_id == user.id))
-    items = result.scalars().all()
-    return SuccessResponse(data=[{"id": i.id, "name": i.name} for i in items])
+async def get_assets(request: Request, response: Response, user: User = Depends(verify_api_key), db: AsyncSession = Depends(get_db)):
+    async def handler():
+        result = await db.execute(select(Asset).where(Asset.user_id == user.id))
+        items = result.scalars().all()
+        return SuccessResponse(data=[{"id": i.id, "name": i.name} for i in items])
+
+    return await cached(request, response, user.id, db, handler)
 
 @router.post("/assets", response_model=SuccessResponse)
 async def add_asset(req: ConfigItem, user: User = Depends(verify_api_key), db: AsyncSession = Depends(get_db)):
@@ -118,11 +146,15 @@ async def add_asset(req: ConfigItem, user: User = Depends(verify_api_key), db: A
     
     item = Asset(user_id=user.id, name=req.name)
     db.add(item)
+    await bump_on_commit(db, user.id)
     await db.commit()
+    user_context_cache.invalidate(user.id)
     return SuccessResponse(message="添加成功", data={"id": item.id, "name": item.name})
 
 @router.delete("/assets/{asset_id}", response_model=SuccessResponse)
 async def delete_asset(asset_id: int, user: User = Depends(verify_api_key), db: AsyncSession = Depends(get_db)):
     await db.execute(delete(Asset).where(Asset.user_id == user.id, Asset.id == asset_id))
+    await bump_on_commit(db, user.id)
     await db.commit()
+    user_context_cache.invalidate(user.id)
     return SuccessResponse(message="已删除")
@@ -1,14 +1,21 @@
-from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi import APIRouter, Depends, Query, HTTPException, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_, delete as sql_delete
-from typing import Optional, List
+from sqlalchemy import select, func, and_, or_, tuple_, delete as sql_delete
+from typing import Optional, List, Literal
 from datetime import datetime
 from pydantic import BaseModel
 
 from app.models.database import get_db
 from app.models.tables import User, Expense
+from app.models.search import FTS_COLUMNS, expenses_fts, fts_match, use_fts
 from app.models.schemas import SuccessResponse
 from app.middleware.auth import verify_api_key
+from app.services.expense_hash_index import discard_on_commit
+from app.services.expense_writer import record_expense_changes
+from app.services.expense_rollups import category_totals, period_total
+from app.services.data_version import bump_on_commit
+from app.services.response_cache import cached
+from app.utils.cursor import decode_cursor, encode_cursor
 
 router = APIRouter(prefix="/expenses", tags=["expenses"])
 
@@ -24,36 +31,52 @@ class ExpenseUpdate(BaseModel):
     is_essential: Optional[int] = None
     linked_asset: Optional[str] = None
 
+# 分类频次、月度汇总与统计分析用到的字段
+AGGREGATE_COLUMNS = (
+    Expense.date, Expense.amount, Expense.payee, Expense.remark, Expense.consumer,
+    Expense.main_category, Expense.sub_category, Expense.is_essential
+)
+
+def _aggregate_fields(expense: Expense) -> dict:
+    return {column.key: getattr(expense, column.key) for column in AGGREGATE_COLUMNS}
+
 @router.get("/summary", response_model=SuccessResponse)
 async def get_expenses_summary(
+    request: Request,
+    response: Response,
     user: User = Depends(verify_api_key),
     db: AsyncSession = Depends(get_db)
 ):
-    now = datetime.now()
-    current_month_prefix = now.strftime("%Y-%m-")
-    current_year_prefix = now.strftime("%Y-")
-
-    # 本月支出
-    month_query = select(func.sum(Expense.amount)).where(
-        Expense.user_id == user.id,
-        Expense.date.like(f"{current_month_prefix}%")
-    )
-    # 本年支出
-    year_query = select(func.sum(Expense.amount)).where(
-        Expense.user_id == user.id,
-        Expense.date.like(f"{current_year_prefix}%")
-    )
+    async def handler():
+        # 读月度汇总，不再扫描当月/当年全部账目
+        now = datetime.now()
+        current_month = now.strftime("%Y-%m")
+
+        return SuccessResponse(data={
+            "month_total": await period_total(db, user.id, current_month, current_month),
+            "year_total": await period_total(db, user.id, now.strftime("%Y-01"), now.strftime("%Y-12"))
+        })
 
-    month_result = await db.execute(month_query)
-    year_result = await db.execute(year_query)
+    return await cached(request, response, user.id, db, handler)
 
-    return SuccessResponse(data={
-        "month_total": float(month_result.scalar() or 0.0),
-        "year_total": float(year_result.scalar() or 0.0)
-    })
+def _expense_view(i: Expense) -> dict:
+    return {
+        "id": i.id,
+        "date": i.date,
+        "amount": i.amount,
+        "main_category": i.main_category,
+        "sub_category": i.sub_category,
+        "payee": i.payee,
+        "consumer": i.consumer,
+        "remark": i.remark,
+        "is_essential": i.is_essential,
+        "linked_asset": i.linked_asset
+    }
 
 @router.get("", response_model=SuccessResponse)
 async def list_expenses(
+    request: Request,
+    response: Response,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     main_category: Optional[str] = None,
@@ -61,80 +84,111 @@ async def list_expenses(
     keyword: Optional[str] = None,  # 新增：关键词搜索
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,  # 游标分页：传入上一页返回的 next_cursor / prev_cursor，忽略 page
+    with_total: Optional[bool] = None,  # 是否计算总数，默认仅页码模式计算
+    with_summary: Optional[bool] = None,  # 是否计算分类汇总，默认仅页码模式计算
+    sort: Literal["date", "relevance"] = "date",  # relevance: 按关键词相关度排序（仅页码模式）
     user: User = Depends(verify_api_key),
     db: AsyncSession = Depends(get_db)
 ):
-    # 构建查询
-    query = select(Expense).where(Expense.user_id == user.id)
-    
-    if start_date:
-        query = query.where(Expense.date >= start_date)
-    if end_date:
-        query = query.where(Expense.date <= end_date)
-    if main_category:
-        query = query.where(Expense.main_category == main_category)
-    if payee:
-        query = query.where(Expense.payee == payee)
-    if keyword:
-        # 在备注、商户、消费人中搜索关键词
-        query = query.where(
-            (Expense.remark.like(f"%{keyword}%")) |
-            (Expense.payee.like(f"%{keyword}%")) |
-            (Expense.consumer.like(f"%{keyword}%"))
-        )
-
-    # 计算总数
-    count_query = select(func.count()).select_from(query.subquery())
-    total_count = await db.execute(count_query)
-    total = total_count.scalar()
-
-    # 分页和排序
-    query = query.order_by(Expense.date.desc(), Expense.id.desc())
-    query = query.offset((page - 1) * page_size).limit(page_size)
-    
-    result = await db.execute(query)
-    items = result.scalars().all()
+    try:
+        position = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if position is not None and sort == "relevance":
+        raise HTTPException(status_code=400, detail="按相关度排序不支持游标分页")
+    if with_total is None:
+        with_total = position is None
+    if with_summary is None:
+        with_summary = position is None
+    keyword = (keyword or "").strip()
 
-    # 统计汇总
-    summary_query = select(
-        func.sum(Expense.amount),
-        Expense.main_category
-    ).where(Expense.user_id == user.id).group_by(Expense.main_category)
-    
-    # 同样应用日期过滤
-    if start_date: summary_query = summary_query.where(Expense.date >= start_date)
-    if end_date: summary_query = summary_query.where(Expense.date <= end_date)
-    
-    summary_result = await db.execute(summary_query)
-    category_summary = {row[1]: row[0] for row in summary_result.all()}
-    total_amount = sum(category_summary.values())
-
-    return SuccessResponse(data={
-        "items": [
-            {
-                "id": i.id,
-                "date": i.date,
-                "amount": i.amount,
-                "main_category": i.main_category,
-                "sub_category": i.sub_category,
-                "payee": i.payee,
-                "consumer": i.consumer,
-                "remark": i.remark,
-                "is_essential": i.is_essential,
-                "linked_asset": i.linked_asset
-            } for i in items
-        ],
-        "pagination": {
-            "page": page,
+    async def handler():
+        # 构建查询
+        query = select(Expense).where(Expense.user_id == user.id)
+
+        if start_date:
+            query = query.where(Expense.date >= start_date)
+        if end_date:
+            query = query.where(Expense.date <= end_date)
+        if main_category:
+            query = query.where(Expense.main_category == main_category)
+        if payee:
+            query = query.where(Expense.payee == payee)
+        ranked = sort == "relevance" and use_fts(keyword)
+        if keyword and use_fts(keyword):
+            # 全文索引检索（计数用 IN 子查询，SQLite 对关联写法的计数会逐行 MATCH）
+            query = query.where(Expense.id.in_(select(expenses_fts.c.rowid).where(fts_match(keyword))))
+        elif keyword:
+            # 关键词过短（trigram 至少 3 个字符）或全文索引不可用时逐条匹配
+            query = query.where(or_(*(
+                getattr(Expense, name).like(f"%{keyword}%") for name in FTS_COLUMNS
+            )))
+
+        # 计算总数（可选）
+        total = None
+        if with_total:
+            count_query = select(func.count()).select_from(query.subquery())
+            total = (await db.execute(count_query)).scalar()
+
+        # 分页和排序：游标模式按 (date, id) 在索引上定位，多取一条判断是否还有下一页
+        sort_key = tuple_(Expense.date, Expense.id)
+        if ranked:
+            # 关联索引命中的 rank（bm25）按相关度排序
+            hits = select(expenses_fts.c.rowid, expenses_fts.c.rank).where(fts_match(keyword)).subquery()
+            page_query = (
+                query.join(hits, hits.c.rowid == Expense.id)
+                .order_by(hits.c.rank, Expense.date.desc(), Expense.id.desc())
+                .offset((page - 1) * page_size)
+            )
+        elif position is None:
+            page_query = query.order_by(Expense.date.desc(), Expense.id.desc()).offset((page - 1) * page_size)
+        elif position.direction == "next":
+            page_query = query.where(sort_key < (position.date, position.id)).order_by(Expense.date.desc(), Expense.id.desc())
+        else:
+            page_query = query.where(sort_key > (position.date, position.id)).order_by(Expense.date.asc(), Expense.id.asc())
+
+        result = await db.execute(page_query.limit(page_size + 1))
+        items = list(result.scalars().all())
+        has_more = len(items) > page_size
+        items = items[:page_size]
+        if ranked:
+            # 相关度排序下 (date, id) 游标无意义，只按页码翻页
+            has_newer = has_older = False
+        elif position is None:
+            has_newer, has_older = page > 1, has_more
+        elif position.direction == "next":
+            has_newer, has_older = True, has_more
+        else:
+            items.reverse()
+            has_newer, has_older = has_more, True
+
+        pagination = {
             "page_size": page_size,
-            "total": total,
-            "total_pages": (total + page_size - 1) // page_size
-        },
-        "summary": {
-            "total_amount": float(total_amount),
-            "category_breakdown": {k: float(v) for k, v in category_summary.items()}
+            "next_cursor": encode_cursor(items[-1].date, items[-1].id) if items and has_older else None,
+            "prev_cursor": encode_cursor(items[0].date, items[0].id, "prev") if items and has_newer else None
         }
-    })
+        if position is None:
+            pagination["page"] = page
+            pagination["has_more"] = has_more
+        if total is not None:
+            pagination["total"] = total
+            pagination["total_pages"] = (total + page_size - 1) // page_size
+
+        data = {"items": [_expense_view(i) for i in items], "pagination": pagination}
+
+        # 统计汇总（可选）
+        if with_summary:
+            # 完整月份读月度汇总，只有区间首尾不满一个月的部分扫描账目
+            category_summary = await category_totals(db, user.id, start_date, end_date)
+            data["summary"] = {
+                "total_amount": round(sum(category_summary.values()), 2),
+                "category_breakdown": category_summary
+            }
+
+        return SuccessResponse(data=data)
+
+    return await cached(request, response, user.id, db, handler)
 
 @router.put("/{expense_id}", response_model=SuccessResponse)
 async def update_expense(
@@ -155,26 +209,24 @@ async def update_expense(
     if not expense:
         raise HTTPException(status_code=404, detail="记录不存在")
     
-    # 更新字段
+    # 更新字段；金额、日期、分类等字段变化时同步分类频次、月度汇总与统计分析缓存
     update_data = data.dict(exclude_unset=True)
+    before = _aggregate_fields(expense)
+    changed = any(getattr(expense, key) != value for key, value in update_data.items())
     for key, value in update_data.items():
         setattr(expense, key, value)
+    after = _aggregate_fields(expense)
+    if after != before:
+        await record_expense_changes(db, user.id, [before], -1)
+        await record_expense_changes(db, user.id, [after], 1)
+    elif changed:
+        # 只改了 linked_asset 等不参与统计的字段，列表内容仍然变化
+        await bump_on_commit(db, user.id)
     
     await db.commit()
     await db.refresh(expense)
     
-    return SuccessResponse(message="更新成功", data={
-        "id": expense.id,
-        "date": expense.date,
-        "amount": expense.amount,
-        "main_category": expense.main_category,
-        "sub_category": expense.sub_category,
-        "payee": expense.payee,
-        "consumer": expense.consumer,
-        "remark": expense.remark,
-        "is_essential": expense.is_essential,
-        "linked_asset": expense.linked_asset
-    })
+    return SuccessResponse(message="更新成功", data=_expense_view(expense))
 
 @router.delete("/{expense_id}", response_model=SuccessResponse)
 async def delete_expense(
@@ -187,11 +239,14 @@ async def delete_expense(
     query = sql_delete(Expense).where(
         Expense.id == expense_id,
         Expense.user_id == user.id
-    )
+    ).returning(Expense.hash_id, *AGGREGATE_COLUMNS)
     result = await db.execute(query)
+    deleted = result.all()
+    await record_expense_changes(db, user.id, [row._asdict() for row in deleted], -1)
+    discard_on_commit(db, user.id, [row.hash_id for row in deleted])
     await db.commit()
     
-    if result.rowcount == 0:
+    if not deleted:
         raise HTTPException(status_code=404, detail="记录不存在")
     
     return SuccessResponse(message="删除成功")
@@ -0,0 +1,26 @@
+from fastapi import APIRouter, Depends
+
+from app.config import settings
+
+from app.models.tables import User
+from app.models.schemas import SuccessResponse
+from app.middleware.auth import verify_api_key
+from app.utils.llm_metrics import llm_metrics
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+def is_metrics_admin(user: User) -> bool:
+    return user.username in {name.strip() for name in settings.METRICS_ADMIN_USERNAMES.split(",") if name.strip()}
+
+@router.get("/llm", response_model=SuccessResponse)
+async def get_llm_metrics(user: User = Depends(verify_api_key)):
+    """
+    LLM 调用统计（进程启动以来）
+    - user: 当前用户的调用次数、token 用量、费用、缓存/快速通道命中
+    - global: 按调用类型的延迟/首字节直方图、按模型的计数、各提示词片段的字符数与 token 估算
+      （汇总了所有用户的调用，仅 METRICS_ADMIN_USERNAMES 中的用户可见，其他用户为 null）
+    """
+    return SuccessResponse(data={
+        "user": llm_metrics.user_snapshot(user.id),
+        "global": llm_metrics.snapshot() if is_metrics_admin(user) else None
+    })
@@ -1,73 +1,101 @@
+import asyncio
 import uuid
 import json
-from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi import APIRouter, Depends, HTTPException, Body, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, delete, update
-from typing import List
+from typing import List, Dict, Literal
 
-from app.models.database import get_db
-from app.models.tables import User, StagingArea, Expense, Category, Payee, Asset
-from app.models.schemas import RecordRequest, RecordResponse, SuccessResponse, ConfirmRequest, StagingItem, InteractionRequest
+from app.config import settings
+from app.models.database import get_db, AsyncSessionLocal
+from app.models.tables import User, StagingArea, Category, Payee, Asset, ParseJob
+from app.models.schemas import RecordRequest, BatchRecordRequest, RecordResponse, SuccessResponse, ConfirmRequest, StagingItem, InteractionRequest
 from app.middleware.auth import verify_api_key
-from app.services.llm_parser import LLMParser
+from app.services.llm_parser import LLMParser, get_llm_parser
 from app.services.auditor import Auditor
 from app.services.instruction_parser import InstructionParser
 from app.services.batch_manager import BatchManager
-from app.utils.image import validate_and_resize_image
+from app.services.prompt_cache import user_context_cache
+from app.services.category_stats import category_predictor
+from app.services.image_dedupe import ImageDeduper, mark_similar
+from app.services.record_pipeline import record_inputs
+from app.services.job_queue import parse_job_queue, job_view
+from app.services.idempotency import idempotent
+from app.services.expense_writer import insert_expenses, expense_values
+from app.utils.image import preprocess_image
 
 router = APIRouter(prefix="/record", tags=["record"])
 
+def _ndjson(event: Dict) -> str:
+    return json.dumps(event, ensure_ascii=False) + "\n"
+
+def _sse(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def _iterate(items: List[Dict]):
+    for item in items:
+        yield item
+
 @router.post("", response_model=SuccessResponse)
 async def post_record(
     req: RecordRequest, 
+    request: Request,
+    response: Response,
+    mode: Literal["sync", "job"] = Query("sync", description="job: 异步任务模式，立即返回 202 与任务编号"),
     user: User = Depends(verify_api_key), 
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    parser: LLMParser = Depends(get_llm_parser)
 ):
-    parser = LLMParser()
+    # 任务模式：落库后立即返回，由后台工作协程解析；也可通过 Prefer: respond-async 请求头开启
+    as_job = mode == "job" or "respond-async" in request.headers.get("prefer", "")
+    return await idempotent(
+        request, response, user.id, "record", {"request": req, "job": as_job},
+        lambda: _post_record(req, request, response, as_job, user, db, parser)
+    )
+
+async def _post_record(req: RecordRequest, request: Request, response: Response, as_job: bool, user: User, db: AsyncSession, parser: LLMParser) -> SuccessResponse:
+    if as_job:
+        job = await parse_job_queue.submit(db, user.id, req.type, req.content)
+        status_url = f"{request.url.path}/jobs/{job.id}"
+        response.status_code = 202
+        response.headers["Location"] = status_url
+        return SuccessResponse(message="已提交解析任务", data={
+            **job_view(job),
+            "status_url": status_url,
+            "events_url": f"{status_url}/events"
+        })
+
     auditor = Auditor(db)
     
-    # 1. 获取用户分类以辅助解析
-    cat_result = await db.execute(select(Category).where(Category.user_id == user.id))
-    user_categories = [{"main": c.main_name, "sub": c.sub_name, "keywords": c.keywords} for c in cat_result.scalars().all()]
-    
-    payee_result = await db.execute(select(Payee).where(Payee.user_id == user.id))
-    user_payees = [p.name for p in payee_result.scalars().all()]
-
-    asset_result = await db.execute(select(Asset).where(Asset.user_id == user.id))
-    user_assets = [a.name for a in asset_result.scalars().all()]
+    # 1. 获取用户分类以辅助解析（按用户缓存，配置变更时失效）
+    ctx = await user_context_cache.get(db, user.id)
     
     # 2. 调用 LLM 解析
     if req.type == "text":
-        items = await parser.parse(req.content, user_categories, user_payees=user_payees, user_assets=user_assets, user_id=user.id)
+        category_hint = await category_predictor.prompt_categories(db, user.id, req.content, ctx.categories)
+        items = await parser.parse(req.content, ctx.categories, user_payees=ctx.payees, user_assets=ctx.assets, user_id=user.id, user_context=ctx, category_hint=category_hint)
     else:
-        # 处理图片
-        compressed_b64, mime = validate_and_resize_image(req.content)
-        items = await parser.parse_image(compressed_b64, mime, user_categories, user_payees=user_payees, user_assets=user_assets, user_id=user.id)
+        # 处理图片；近期上传过像素相同的截图则直接复用解析结果，相近的截图照常解析并提示疑似重复
+        prepared = await preprocess_image(req.content)
+        deduper = ImageDeduper(db)
+        items = await deduper.find(user.id, prepared)
+        if items is None:
+            similar = await deduper.similar(user.id, prepared)
+            items = await parser.parse_image(prepared.base64, prepared.mime_type, ctx.categories, user_payees=ctx.payees, user_assets=ctx.assets, user_id=user.id, user_context=ctx)
+            deduper.remember(user.id, prepared, items)
+            if similar:
+                mark_similar(items)
     
     if not items:
         return SuccessResponse(message="未识别到任何消费条目", data={"items": []})
     
-    # 3. 审计去重
+    # 3. 按历史分类频次校正分类，再审计去重
+    await category_predictor.apply(db, user.id, items)
     items_with_meta = await auditor.check_duplicates(user.id, items)
     
     # 4. 写入暂存区
-    batch_id = str(uuid.uuid4())
-    staging_entries = []
-    for idx, item in enumerate(items_with_meta):
-        temp_id = idx + 1
-        entry = StagingArea(
-            user_id=user.id,
-            batch_id=batch_id,
-            temp_id=temp_id,
-            parsed_json=json.dumps(item, ensure_ascii=False),
-            is_duplicate=1 if item.get("is_duplicate") else 0,
-            status="pending"
-        )
-        staging_entries.append(entry)
-        item["temp_id"] = temp_id # 回传给前端
-    
-    db.add_all(staging_entries)
-    await db.commit()
+    batch_id = await BatchManager(db).create_batch(user.id, items_with_meta)
     
     return SuccessResponse(data={
         "batch_id": batch_id,
@@ -75,47 +103,227 @@ async def post_record(
         "summary": f"共识别出 {len(items_with_meta)} 条记录"
     })
 
+@router.post("/batch", response_model=SuccessResponse)
+async def post_record_batch(
+    req: BatchRecordRequest,
+    request: Request,
+    response: Response,
+    user: User = Depends(verify_api_key),
+    db: AsyncSession = Depends(get_db),
+    parser: LLMParser = Depends(get_llm_parser)
+):
+    """批量记账：一次提交多张截图和/或多段文字，合并为同一个暂存批次"""
+    if len(req.items) > settings.RECORD_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"单次最多提交 {settings.RECORD_BATCH_MAX_ITEMS} 条")
+
+    async def run():
+        result = await record_inputs(db, user.id, parser, [(entry.type, entry.content) for entry in req.items])
+        return SuccessResponse(message=result.message, data=result.data)
+
+    return await idempotent(request, response, user.id, "record_batch", req, run)
+
+@router.post("/upload", response_model=SuccessResponse)
+async def upload_record(
+    request: Request,
+    user: User = Depends(verify_api_key),
+    db: AsyncSession = Depends(get_db),
+    parser: LLMParser = Depends(get_llm_parser)
+):
+    """
+    上传原始图片，免去 base64 带来的约 33% 体积膨胀
+    支持 multipart/form-data（file 或 files 字段，可多张）或 Content-Type 为 image/* 的二进制请求体
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        uploads = [f for f in form.getlist("files") + form.getlist("file") if hasattr(f, "read")]
+        images = [await f.read() for f in uploads]
+    elif content_type.startswith("image/") or content_type.startswith("application/octet-stream"):
+        images = [await request.body()]
+    else:
+        raise HTTPException(status_code=415, detail="请使用 multipart/form-data 或 image/* 上传图片")
+
+    images = [data for data in images if data]
+    if not images:
+        raise HTTPException(status_code=400, detail="未收到图片")
+    if len(images) > settings.RECORD_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"单次最多提交 {settings.RECORD_BATCH_MAX_ITEMS} 条")
+    max_bytes = settings.IMAGE_MAX_UPLOAD_MB * 1024 * 1024
+    if any(len(data) > max_bytes for data in images):
+        raise HTTPException(status_code=413, detail=f"单张图片不能超过 {settings.IMAGE_MAX_UPLOAD_MB}MB")
+
+    result = await record_inputs(db, user.id, parser, [("image", data) for data in images])
+    return SuccessResponse(message=result.message, data=result.data)
+
+@router.get("/jobs/{job_id}", response_model=SuccessResponse)
+async def get_record_job(
+    job_id: str,
+    user: User = Depends(verify_api_key),
+    db: AsyncSession = Depends(get_db)
+):
+    """查询解析任务状态；完成后 result 与同步 /v1/record/batch 的 data 相同"""
+    job = await db.get(ParseJob, job_id)
+    if job is None or job.user_id != user.id:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return SuccessResponse(data=job_view(job))
+
+@router.get("/jobs/{job_id}/events")
+async def record_job_events(
+    job_id: str,
+    user: User = Depends(verify_api_key),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    以 SSE 订阅解析任务进度
+    事件：status（queued/running）-> result（成功）或 error（失败），任务结束后关闭连接
+    """
+    job = await db.get(ParseJob, job_id)
+    if job is None or job.user_id != user.id:
+        raise HTTPException(status_code=404, detail="任务不存在")
+
+    async def event_stream():
+        # 任务可能由另一个 worker 进程执行：以任务表为准定期轮询，本进程内的状态变化只用于立即唤醒
+        # 先订阅再读取当前状态，避免两者之间的状态变化丢失
+        listener = parse_job_queue.subscribe(job_id)
+        loop = asyncio.get_running_loop()
+        last_status = None
+        last_sent = loop.time()
+        try:
+            while True:
+                async with AsyncSessionLocal() as session:
+                    job = await session.get(ParseJob, job_id)
+                    current = job_view(job) if job is not None else {"status": "failed", "error": "任务已删除"}
+                if current["status"] == "succeeded":
+                    yield _sse("result", {"status": "succeeded", "result": current["result"], "message": current.get("message")})
+                    return
+                if current["status"] == "failed":
+                    yield _sse("error", {"status": "failed", "error": current.get("error")})
+                    return
+                if current["status"] != last_status:
+                    last_status = current["status"]
+                    last_sent = loop.time()
+                    yield _sse("status", {"status": last_status})
+                elif loop.time() - last_sent >= 15:
+                    # 保活，防止反向代理断开空闲连接
+                    last_sent = loop.time()
+                    yield ": keep-alive\n\n"
+
+                try:
+                    await asyncio.wait_for(listener.get(), timeout=settings.PARSE_JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            parse_job_queue.unsubscribe(job_id, listener)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/stream")
+async def stream_record(
+    req: RecordRequest,
+    user: User = Depends(verify_api_key),
+    parser: LLMParser = Depends(get_llm_parser)
+):
+    """
+    流式记账：每解析出一个完整条目即去重、写入暂存区，并以 NDJSON 推送给客户端
+    事件依次为 batch -> item (多条) -> done，出错时推送 error
+    """
+    user_id = user.id
+    if req.type == "image":
+        try:
+            prepared = await preprocess_image(req.content)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    async def event_stream():
+        # 响应流可能晚于请求依赖的生命周期，这里使用独立会话
+        async with AsyncSessionLocal() as db:
+            ctx = await user_context_cache.get(db, user_id)
+            auditor = Auditor(db)
+            batch_id = str(uuid.uuid4())
+            yield _ndjson({"event": "batch", "batch_id": batch_id})
+
+            deduper = ImageDeduper(db)
+            reused = None
+            similar = False
+            if req.type == "text":
+                category_hint = await category_predictor.prompt_categories(db, user_id, req.content, ctx.categories)
+                items = parser.stream_parse(req.content, ctx.categories, user_payees=ctx.payees, user_assets=ctx.assets, user_id=user_id, user_context=ctx, category_hint=category_hint)
+            else:
+                reused = await deduper.find(user_id, prepared)
+                if reused is not None:
+                    items = _iterate(reused)
+                else:
+                    similar = await deduper.similar(user_id, prepared)
+                    items = parser.stream_parse_image(prepared.base64, prepared.mime_type, ctx.categories, user_payees=ctx.payees, user_assets=ctx.assets, user_id=user_id, user_context=ctx)
+
+            count = 0
+            parsed_items = []
+            try:
+                async for item in items:
+                    parsed_items.append(dict(item))
+                    if similar:
+                        mark_similar([item])
+                    await category_predictor.apply(db, user_id, [item])
+                    item = (await auditor.check_duplicates(user_id, [item]))[0]
+                    count += 1
+                    db.add(BatchManager.staging_entry(user_id, batch_id, count, item))
+                    await db.commit()
+                    item["temp_id"] = count # 回传给前端
+                    yield _ndjson({"event": "item", "item": item})
+            except Exception as e:
+                yield _ndjson({"event": "error", "message": f"解析中断: {e}"})
+            else:
+                if req.type == "image" and reused is None:
+                    deduper.remember(user_id, prepared, parsed_items)
+                    await db.commit()
+
+            summary = f"共识别出 {count} 条记录" if count else "未识别到任何消费条目"
+            yield _ndjson({"event": "done", "batch_id": batch_id, "count": count, "summary": summary})
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
 @router.post("/confirm", response_model=SuccessResponse)
 async def confirm_record(
     req: ConfirmRequest,
+    request: Request,
+    response: Response,
     user: User = Depends(verify_api_key),
     db: AsyncSession = Depends(get_db)
 ):
+    return await idempotent(request, response, user.id, "record_confirm", req, lambda: _confirm_record(req, user, db))
+
+async def _confirm_record(req: ConfirmRequest, user: User, db: AsyncSession) -> SuccessResponse:
     if req.action == "confirm_all":
         # 批量入库
         result = await db.execute(
-            select(StagingArea).where(
+            select(StagingArea.id, StagingArea.temp_id, StagingArea.parsed_json).where(
                 StagingArea.user_id == user.id,
                 StagingArea.batch_id == req.batch_id,
                 StagingArea.status == "pending"
             )
         )
-        entries = result.scalars().all()
-        confirmed_count = 0
-        for entry in entries:
-            item_data = json.loads(entry.parsed_json)
-            # 写入正式表
-            expense = Expense(
-                user_id=user.id,
-                date=item_data.get("date"),
-                amount=item_data.get("amount"),
-                main_category=item_data.get("main_category"),
-                sub_category=item_data.get("sub_category"),
-                payee=item_data.get("payee"),
-                remark=item_data.get("remark"),
-                consumer=item_data.get("consumer"),
-                is_essential=item_data.get("is_essential", 0),
-                linked_asset=item_data.get("linked_asset"),
-                hash_id=item_data.get("hash_id"),
-                source_channel="api",
-                original_input=None
-            )
-            db.add(expense)
-            entry.status = "confirmed"
-            confirmed_count += 1
+        entries = result.all()
+        # 写入正式表；已存在的账目（重复确认、并发请求）跳过，不影响其它条目
+        written = await insert_expenses(db, user.id, [
+            expense_values(user.id, json.loads(entry.parsed_json), "api") for entry in entries
+        ])
+        for indexes, status in ((written.inserted, "confirmed"), (written.skipped, "duplicate")):
+            if indexes:
+                await db.execute(
+                    update(StagingArea)
+                    .where(StagingArea.id.in_([entries[i].id for i in indexes]), StagingArea.status == "pending")
+                    .values(status=status)
+                )
         
         await db.commit()
-        return SuccessResponse(data={"confirmed_count": confirmed_count})
+        return SuccessResponse(data={
+            "confirmed_count": len(written.inserted),
+            "skipped_duplicates": [entries[i].temp_id for i in written.skipped]
+        })
 
     elif req.action == "reject_all":
         await db.execute(
@@ -130,20 +338,19 @@ async def confirm_record(
 async def interact_record(
     req: InteractionRequest,
     user: User = Depends(verify_api_key),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    parser: LLMParser = Depends(get_llm_parser)
 ):
-    parser = LLMParser()
     instr_parser = InstructionParser(parser)
     batch_manager = BatchManager(db)
     
     # 1. 获取上下文
     context = await batch_manager.get_batch_context(user.id, req.batch_id)
     
-    payee_result = await db.execute(select(Payee).where(Payee.user_id == user.id))
-    context["user_payees"] = [p.name for p in payee_result.scalars().all()]
-
-    asset_result = await db.execute(select(Asset).where(Asset.user_id == user.id))
-    context["user_assets"] = [a.name for a in asset_result.scalars().all()]
+    ctx = await user_context_cache.get(db, user.id)
+    context["user_payees"] = ctx.payees
+    context["user_assets"] = ctx.assets
+    context["user_context"] = ctx
     
     context["user_id"] = user.id
     
@@ -153,15 +360,12 @@ async def interact_record(
     if not actions:
         return SuccessResponse(message="未能理解您的指令，请换种说法试试", success=False)
     
-    # 3. 执行操作
-    await batch_manager.apply_actions(user.id, req.batch_id, actions)
-    
-    # 4. 返回最新状态
-    new_context = await batch_manager.get_batch_context(user.id, req.batch_id)
-    pending_count = len([i for i in new_context["items"] if i["status"] == "pending"])
+    # 3. 执行操作，返回最新状态
+    items = await batch_manager.apply_actions(user.id, req.batch_id, actions)
+    pending_count = len([i for i in items if i["status"] == "pending"])
     
     return SuccessResponse(data={
         "actions_executed": [a["type"] for a in actions],
         "remaining_pending": pending_count,
-        "items": new_context["items"]
+        "items": items
     }, message="指令执行成功")
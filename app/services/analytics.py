@@ -0,0 +1,251 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.tables import Expense
+from app.services.data_version import get_data_version, pending_version
+
+# 可分组的维度；is_essential 按 0/1 分组，其余为字典编码的字符串列
+DIMENSIONS = ("main_category", "sub_category", "consumer", "payee", "is_essential")
+TEXT_DIMENSIONS = ("main_category", "sub_category", "consumer", "payee")
+# 快照每行的字段顺序（加载查询与变更记录都按此顺序组成元组）
+FIELDS = ("date", "amount") + DIMENSIONS
+
+Row = Tuple[Any, ...]
+# 一次事务提交的账目变动：(提交后的数据版本, [(行, delta)])；版本未知为 None
+ChangeSet = Tuple[Optional[int], List[Tuple[Row, int]]]
+
+def _to_days(dates: List[str]) -> np.ndarray:
+    """YYYY-MM-DD -> datetime64[D]；无法解析的日期为 NaT"""
+    try:
+        return np.array(dates, dtype="datetime64[D]")
+    except ValueError:
+        days = []
+        for d in dates:
+            try:
+                days.append(np.datetime64(d, "D"))
+            except ValueError:
+                days.append(np.datetime64("NaT"))
+        return np.array(days, dtype="datetime64[D]")
+
+def month_key(index: int) -> str:
+    """月序号（自 1970-01 起的月数）-> YYYY-MM"""
+    return str(np.datetime64(index, "M"))
+
+def month_index(month: str) -> int:
+    return int(np.datetime64(month, "M").astype(np.int64))
+
+def day_index(date: str) -> int:
+    return int(np.datetime64(date, "D").astype(np.int64))
+
+class ExpenseColumns:
+    """
+    单个用户账目的列式快照：日序号、月序号、金额为 NumPy 数组，分类/消费人/商户为字典编码
+    只保存聚合需要的列；账目增删以待应用变更的形式累积，下次读取时批量并入
+    version 为快照对应的用户数据版本，变更按版本逐个并入，缺了中间的版本即放弃增量
+    """
+
+    def __init__(self, rows: List[Row], version: int = 0):
+        self.version = version
+        self.labels: Dict[str, List[Optional[str]]] = {name: [] for name in TEXT_DIMENSIONS}
+        self._codes: Dict[str, Dict[Optional[str], int]] = {name: {} for name in TEXT_DIMENSIONS}
+        self.day = np.empty(0, dtype=np.int64)
+        self.month = np.empty(0, dtype=np.int64)
+        self.amount = np.empty(0, dtype=np.float64)
+        self.columns: Dict[str, np.ndarray] = {name: np.empty(0, dtype=np.int64) for name in DIMENSIONS}
+        self.pending: List[ChangeSet] = []
+        self._append(rows)
+
+    def __len__(self) -> int:
+        return len(self.amount)
+
+    def _encode(self, name: str, value: Optional[str]) -> int:
+        codes = self._codes[name]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(self.labels[name])
+            self.labels[name].append(value)
+        return code
+
+    def _encode_rows(self, rows: List[Row]) -> Dict[str, np.ndarray]:
+        values = dict(zip(FIELDS, zip(*rows)))
+        days = _to_days([d or "" for d in values["date"]])
+        valid = ~np.isnat(days)
+        encoded = {
+            "day": days[valid].astype(np.int64),
+            "month": days[valid].astype("datetime64[M]").astype(np.int64),
+            "amount": np.array([a or 0 for a in values["amount"]], dtype=np.float64)[valid],
+            "is_essential": np.array([1 if e else 0 for e in values["is_essential"]], dtype=np.int64)[valid]
+        }
+        for name in TEXT_DIMENSIONS:
+            encoded[name] = np.array([self._encode(name, v or None) for v in values[name]], dtype=np.int64)[valid]
+        return encoded
+
+    def _append(self, rows: List[Row]):
+        if not rows:
+            return
+        encoded = self._encode_rows(rows)
+        self.day = np.concatenate([self.day, encoded["day"]])
+        self.month = np.concatenate([self.month, encoded["month"]])
+        self.amount = np.concatenate([self.amount, encoded["amount"]])
+        for name in DIMENSIONS:
+            self.columns[name] = np.concatenate([self.columns[name], encoded[name]])
+
+    def _remove(self, rows: List[Row]) -> bool:
+        """按各列取值删除对应行（取值相同的行对聚合等价，删哪一条都一样）；找不到时返回 False"""
+        if not rows:
+            return True
+        encoded = self._encode_rows(rows)
+        if len(encoded["day"]) != len(rows):
+            return False
+        keep = np.ones(len(self), dtype=bool)
+        for i in range(len(rows)):
+            match = keep & (self.day == encoded["day"][i]) & (self.amount == encoded["amount"][i])
+            for name in DIMENSIONS:
+                match &= self.columns[name] == encoded[name][i]
+            hits = np.flatnonzero(match)
+            if not len(hits):
+                return False
+            keep[hits[0]] = False
+        self.day, self.month, self.amount = self.day[keep], self.month[keep], self.amount[keep]
+        for name in DIMENSIONS:
+            self.columns[name] = self.columns[name][keep]
+        return True
+
+    def apply_pending(self) -> bool:
+        """按版本顺序并入已提交的账目变动；与快照对不上（版本不连续或找不到要删除的行）时返回 False，由调用方重新加载"""
+        pending, self.pending = sorted(self.pending, key=lambda c: c[0] or 0), []
+        for version, changes in pending:
+            if version is not None and version <= self.version:
+                continue  # 快照加载时已包含
+            if version != self.version + 1:
+                return False
+            if not self._apply(changes):
+                return False
+            self.version = version
+        return True
+
+    def _apply(self, changes: List[Tuple[Row, int]]) -> bool:
+        added: List[Row] = []
+        for expense, delta in changes:
+            if delta > 0:
+                added.append(expense)
+                continue
+            # 连续的新增合并为一次拼接；删除前先并入，删除的可能正是刚新增的行
+            self._append(added)
+            added = []
+            if not self._remove([expense]):
+                return False
+        self._append(added)
+        return True
+
+    def label(self, dimension: str, code: int):
+        if dimension == "is_essential":
+            return int(code)
+        return self.labels[dimension][code]
+
+    def mask(self, start_day: Optional[int] = None, end_day: Optional[int] = None, filters: Optional[Dict[str, Any]] = None) -> np.ndarray:
+        selected = np.ones(len(self), dtype=bool)
+        if start_day is not None:
+            selected &= self.day >= start_day
+        if end_day is not None:
+            selected &= self.day <= end_day
+        for name, value in (filters or {}).items():
+            if name == "is_essential":
+                selected &= self.columns[name] == (1 if value else 0)
+            else:
+                code = self._codes[name].get(value)
+                if code is None:
+                    return np.zeros(len(self), dtype=bool)
+                selected &= self.columns[name] == code
+        return selected
+
+    def group_codes(self, dimension: Optional[str]) -> Tuple[np.ndarray, int]:
+        """维度 -> (每行的分组编号, 分组数)；不分组时全部为 0"""
+        if dimension is None:
+            return np.zeros(len(self), dtype=np.int64), 1
+        if dimension == "is_essential":
+            return self.columns[dimension], 2
+        return self.columns[dimension], max(len(self.labels[dimension]), 1)
+
+    def breakdown(self, dimension: str, selected: np.ndarray) -> List[Dict[str, Any]]:
+        """按维度汇总金额与笔数，按金额降序"""
+        codes, size = self.group_codes(dimension)
+        totals = np.bincount(codes[selected], weights=self.amount[selected], minlength=size)
+        counts = np.bincount(codes[selected], minlength=size)
+        order = np.argsort(-totals, kind="stable")
+        return [
+            {"key": self.label(dimension, code), "amount": round(float(totals[code]), 2), "count": int(counts[code])}
+            for code in order if counts[code]
+        ]
+
+    def monthly(self, dimension: Optional[str], selected: np.ndarray, first_month: int, months: int) -> Tuple[np.ndarray, np.ndarray]:
+        """按 (分组, 月) 汇总为二维矩阵，返回 (金额矩阵[分组, 月], 各分组笔数)"""
+        codes, size = self.group_codes(dimension)
+        offset = self.month - first_month
+        selected = selected & (offset >= 0) & (offset < months)
+        flat = codes[selected] * months + offset[selected]
+        totals = np.bincount(flat, weights=self.amount[selected], minlength=size * months).reshape(size, months)
+        counts = np.bincount(codes[selected], minlength=size)
+        return totals, counts
+
+class AnalyticsCache:
+    """
+    按用户缓存账目列式快照（LRU，最多 ANALYTICS_CACHE_MAX_USERS 个用户）
+    本进程的账目变动随事务提交按版本并入已缓存的快照（增量）；每次读取前与数据库中的用户数据版本比对，
+    并入后仍不一致（其它进程有写入）或加载过程中有变动提交时重新加载
+    """
+
+    def __init__(self):
+        self._entries: "OrderedDict[str, ExpenseColumns]" = OrderedDict()
+
+    async def get(self, db: AsyncSession, user_id: str) -> ExpenseColumns:
+        version = await get_data_version(db, user_id)
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            self._entries.move_to_end(user_id)
+            if entry.apply_pending() and entry.version == version:
+                return entry
+            self._entries.pop(user_id, None)
+
+        result = await db.execute(
+            select(*(getattr(Expense, name) for name in FIELDS)).where(Expense.user_id == user_id)
+        )
+        entry = ExpenseColumns(result.tuples().all(), version)
+        if await get_data_version(db, user_id) == version:
+            self._entries[user_id] = entry
+            while len(self._entries) > settings.ANALYTICS_CACHE_MAX_USERS:
+                self._entries.popitem(last=False)
+        return entry
+
+    def apply(self, user_id: str, version: Optional[int], changes: List[Tuple[Row, int]]):
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            entry.pending.append((version, changes))
+
+    def invalidate(self, user_id: str):
+        self._entries.pop(user_id, None)
+
+analytics_cache = AnalyticsCache()
+
+def record_on_commit(db: AsyncSession, user_id: str, expenses: List[Dict[str, Any]], delta: int):
+    """登记本事务的账目变动，提交后并入分析缓存；调用方应先 bump_on_commit，变动按本事务的新版本并入"""
+    if not expenses:
+        return
+    pending = db.info.setdefault("analytics_changes", {}).setdefault(user_id, {"version": None, "changes": []})
+    pending["version"] = pending_version(db, user_id)
+    pending["changes"].extend((tuple(e.get(name) for name in FIELDS), delta) for e in expenses)
+
+@event.listens_for(Session, "after_commit")
+def _apply_after_commit(session: Session):
+    for user_id, pending in session.info.pop("analytics_changes", {}).items():
+        analytics_cache.apply(user_id, pending["version"], pending["changes"])
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session):
+    session.info.pop("analytics_changes", None)
@@ -1,38 +1,117 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from typing import List, Dict, Any
+from datetime import date, timedelta
+from collections import Counter
+from typing import List, Dict, Any, Optional, Set
+from app.config import settings
 from app.models.tables import Expense
+from app.services.expense_hash_index import expense_hash_index
 from app.utils.hash import generate_hash_id
 
+def _parse_date(value: Any) -> Optional[date]:
+    try:
+        return date.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+def _text(payee: Optional[str], remark: Optional[str]) -> str:
+    return "".join(f"{payee or ''}{remark or ''}".split())
+
+def _text_similarity(a: str, b: str) -> float:
+    """
+    商户+备注的字符重叠系数：共有字符数 / 较短一方的长度
+    不受词序影响，一方包含另一方（"买菜" 与 "买菜物美"）即为 1
+    """
+    if not a or not b:
+        return 0.5  # 缺少文字信息，不作为证据
+    common = sum((Counter(a) & Counter(b)).values())
+    return common / min(len(a), len(b))
+
+def duplicate_score(item: Dict[str, Any], expense: Any) -> float:
+    """金额相同前提下的疑似重复程度：日期越近、商户备注越像，分数越高（0~1）"""
+    item_date = _parse_date(item.get("date"))
+    expense_date = _parse_date(expense.date)
+    if item_date is None or expense_date is None:
+        return 0.0
+    days = abs((item_date - expense_date).days)
+    if days > settings.DUPLICATE_FUZZY_DAYS:
+        return 0.0
+    date_score = 1 - days / (settings.DUPLICATE_FUZZY_DAYS + 1)
+    text_score = _text_similarity(_text(item.get("payee"), item.get("remark")), _text(expense.payee, expense.remark))
+    return round(0.4 * date_score + 0.6 * text_score, 2)
+
 class Auditor:
     def __init__(self, db: AsyncSession):
         self.db = db
+        # 本实例已检查过的 hash_id，用于发现同一批次内的重复条目（流式记账会逐条调用）
+        self._seen: Set[str] = set()
 
     async def check_duplicates(self, user_id: str, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """
         批量检查条目是否重复
-        为每个条目添加 is_duplicate 标志和 hash_id
+        为每个条目添加 is_duplicate 标志、duplicate_score 疑似重复分数和 hash_id
+        先算出全部 hash_id，经内存索引排除肯定是新账目的，剩余的用一次 IN 查询确认
         """
         for item in items:
-            h_id = generate_hash_id(
+            item["hash_id"] = generate_hash_id(
                 user_id=user_id,
                 date=item.get("date"),
                 amount=item.get("amount"),
                 remark=item.get("remark"),
                 payee=item.get("payee")
             )
-            item["hash_id"] = h_id
-            
-            # 检查数据库中是否存在该 hash_id
+
+        candidates = await expense_hash_index.maybe_existing(self.db, user_id, (i["hash_id"] for i in items))
+        existing = set()
+        if candidates:
             result = await self.db.execute(
-                select(Expense).where(
+                select(Expense.hash_id).where(
                     Expense.user_id == user_id,
-                    Expense.hash_id == h_id
+                    Expense.hash_id.in_(candidates)
                 )
             )
-            if result.scalar_one_or_none():
-                item["is_duplicate"] = True
-            else:
-                item["is_duplicate"] = False
-        
+            existing = set(result.scalars().all())
+
+        for item in items:
+            h_id = item["hash_id"]
+            # 已入账，或与同批次前面的条目相同
+            item["is_duplicate"] = h_id in existing or h_id in self._seen
+            item["duplicate_score"] = 1.0 if item["is_duplicate"] else 0.0
+            self._seen.add(h_id)
+
+        if settings.DUPLICATE_FUZZY_ENABLED:
+            await self._score_near_duplicates(user_id, [i for i in items if not i["is_duplicate"]])
         return items
+
+    async def _score_near_duplicates(self, user_id: str, items: List[Dict[str, Any]]):
+        """
+        疑似重复：金额相同、日期相差不超过 DUPLICATE_FUZZY_DAYS 天的已入账账目
+        按 (user_id, amount, date) 索引一次查出所有候选，不随账目总数扫描
+        """
+        dated = [(item, _parse_date(item.get("date"))) for item in items if item.get("amount") is not None]
+        dated = [(item, d) for item, d in dated if d is not None]
+        if not dated:
+            return
+
+        window = timedelta(days=settings.DUPLICATE_FUZZY_DAYS)
+        result = await self.db.execute(
+            select(Expense.id, Expense.amount, Expense.date, Expense.payee, Expense.remark).where(
+                Expense.user_id == user_id,
+                Expense.amount.in_({float(item["amount"]) for item, _ in dated}),
+                Expense.date >= (min(d for _, d in dated) - window).isoformat(),
+                Expense.date <= (max(d for _, d in dated) + window).isoformat()
+            )
+        )
+        by_amount: Dict[float, List[Any]] = {}
+        for expense in result.all():
+            by_amount.setdefault(expense.amount, []).append(expense)
+
+        for item, _ in dated:
+            best, best_score = None, 0.0
+            for expense in by_amount.get(float(item["amount"]), ()):
+                score = duplicate_score(item, expense)
+                if score > best_score:
+                    best, best_score = expense, score
+            if best is not None:
+                item["duplicate_score"] = best_score
+                item["duplicate_of"] = best.id
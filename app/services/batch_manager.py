@@ -1,15 +1,42 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, delete
+from sqlalchemy import select, update
 from typing import Dict, Any, List
 import json
+import uuid
 
-from app.models.tables import StagingArea, Expense, Category
+from app.models.tables import StagingArea, Category
+from app.services.prompt_cache import user_context_cache
+from app.services.expense_writer import insert_expenses, expense_values
 from app.utils.hash import generate_hash_id
 
 class BatchManager:
     def __init__(self, db: AsyncSession):
         self.db = db
 
+    @staticmethod
+    def staging_entry(user_id: str, batch_id: str, temp_id: int, item: Dict[str, Any]) -> StagingArea:
+        return StagingArea(
+            user_id=user_id,
+            batch_id=batch_id,
+            temp_id=temp_id,
+            parsed_json=json.dumps(item, ensure_ascii=False),
+            is_duplicate=1 if item.get("is_duplicate") else 0,
+            status="pending"
+        )
+
+    async def create_batch(self, user_id: str, items: List[Dict[str, Any]]) -> str:
+        """将解析结果写入暂存区，按列表顺序分配 temp_id（从 1 开始），返回 batch_id"""
+        batch_id = str(uuid.uuid4())
+        staging_entries = []
+        for idx, item in enumerate(items):
+            temp_id = idx + 1
+            staging_entries.append(self.staging_entry(user_id, batch_id, temp_id, item))
+            item["temp_id"] = temp_id # 回传给前端
+
+        self.db.add_all(staging_entries)
+        await self.db.commit()
+        return batch_id
+
     async def get_batch_context(self, user_id: str, batch_id: str) -> Dict[str, Any]:
         """获取用于 LLM 解析的批次上下文"""
         # 获取暂存条目
@@ -21,11 +48,9 @@ class BatchManager:
         )
         entries = result.scalars().all()
         
-        # 获取用户分类
-        cat_result = await self.db.execute(
-            select(Category).where(Category.user_id == user_id)
-        )
-        categories = [{"main": c.main_name, "sub": c.sub_name} for c in cat_result.scalars().all()]
+        # 获取用户分类（走用户上下文缓存）
+        ctx = await user_context_cache.get(self.db, user_id)
+        categories = [{"main": c["main"], "sub": c["sub"]} for c in ctx.categories]
 
         return {
             "batch_id": batch_id,
@@ -39,93 +64,81 @@ class BatchManager:
             "categories": categories
         }
 
-    async def apply_actions(self, user_id: str, batch_id: str, actions: List[Dict[str, Any]]):
-        """执行解析后的操作序列"""
+    async def apply_actions(self, user_id: str, batch_id: str, actions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        执行解析后的操作序列，返回执行后的批次条目（与 get_batch_context 的 items 相同）
+        先一次取出整个批次，在内存中按顺序应用全部操作得到每条的最终状态，
+        再把最终为 confirmed 的条目批量写入账目、批量更新暂存状态，同一事务提交
+        删除/取消只作用于待确认的条目，本次已确认的条目不会被同一序列里后面的删除撤销
+        """
+        result = await self.db.execute(
+            select(StagingArea.id, StagingArea.temp_id, StagingArea.status, StagingArea.parsed_json)
+            .where(StagingArea.user_id == user_id, StagingArea.batch_id == batch_id)
+            .order_by(StagingArea.temp_id)
+        )
+        rows = [
+            {"id": r.id, "temp_id": r.temp_id, "status": r.status, "data": json.loads(r.parsed_json)}
+            for r in result.all()
+        ]
+        by_temp_id = {row["temp_id"]: row for row in rows}
+        dirty: Dict[int, Dict[str, Any]] = {}
+        newly_confirmed: Dict[int, Dict[str, Any]] = {}
+
         for action in actions:
             action_type = action.get("type")
-            targets = action.get("targets", [])
+            if action_type == "cancel_all":
+                targets = list(rows)
+            else:
+                targets = [by_temp_id[tid] for tid in action.get("targets", []) if tid in by_temp_id]
 
-            if action_type == "confirm":
-                await self._confirm_items(user_id, batch_id, targets)
-            elif action_type == "modify":
-                await self._modify_items(user_id, batch_id, targets, action.get("modifications", {}))
-            elif action_type == "delete":
-                await self._delete_items(user_id, batch_id, targets)
-            elif action_type == "cancel_all":
-                await self._cancel_batch(user_id, batch_id)
-        
-        await self.db.commit()
+            for row in targets:
+                if action_type == "confirm":
+                    if row["status"] != "pending":
+                        continue
+                    row["status"] = "confirmed"
+                    newly_confirmed[row["id"]] = row
+                elif action_type == "modify":
+                    # 之前已入账或已删除的条目不再修改，避免暂存数据与账目不一致
+                    if row["status"] != "pending" and row["id"] not in newly_confirmed:
+                        continue
+                    data = row["data"]
+                    data.update(action.get("modifications", {}))
+                    # 重新计算 hash_id 以防修改了核心字段
+                    data["hash_id"] = generate_hash_id(user_id, data.get("date"), data.get("amount"), data.get("remark"), data.get("payee"))
+                elif action_type in ("delete", "cancel_all"):
+                    if row["status"] != "pending":
+                        continue
+                    row["status"] = "rejected"
+                else:
+                    continue
+                dirty[row["id"]] = row
 
-    async def _confirm_items(self, user_id: str, batch_id: str, temp_ids: List[int]):
-        from app.services.category_learner import CategoryLearner
-        learner = CategoryLearner(self.db)
-        
-        for tid in temp_ids:
-            res = await self.db.execute(
-                select(StagingArea).where(
-                    StagingArea.user_id == user_id,
-                    StagingArea.batch_id == batch_id,
-                    StagingArea.temp_id == tid,
-                    StagingArea.status == "pending"
-                )
+        # 按最终状态入账，写入的是全部操作执行完之后的数据
+        confirmed = [row for row in newly_confirmed.values() if row["status"] == "confirmed"]
+        if confirmed:
+            await self._confirm_rows(user_id, confirmed)
+        if dirty:
+            await self.db.execute(
+                update(StagingArea),
+                [
+                    {"id": row["id"], "status": row["status"], "parsed_json": json.dumps(row["data"], ensure_ascii=False)}
+                    for row in dirty.values()
+                ]
             )
-            entry = res.scalar_one_or_none()
-            if entry:
-                data = json.loads(entry.parsed_json)
-                
-                # 只有当置信度低或者标记为已修改时，我们才触发强烈倾向的学习（这里简化为全部确认即学习）
-                if data.get("remark") and data.get("main_category"):
-                    await learner.learn_from_correction(
-                        user_id, 
-                        data["remark"], 
-                        data["main_category"], 
-                        data.get("sub_category")
-                    )
+        await self.db.commit()
 
-                expense = Expense(
-                    user_id=user_id,
-                    date=data.get("date"),
-                    amount=data.get("amount"),
-                    main_category=data.get("main_category"),
-                    sub_category=data.get("sub_category"),
-                    payee=data.get("payee"),
-                    remark=data.get("remark"),
-                    consumer=data.get("consumer"),
-                    is_essential=data.get("is_essential", 0),
-                    linked_asset=data.get("linked_asset"),
-                    hash_id=data.get("hash_id") or generate_hash_id(user_id, data.get("date"), data.get("amount"), data.get("remark"), data.get("payee")),
-                    source_channel="interact"
-                )
-                self.db.add(expense)
-                entry.status = "confirmed"
+        return [{"temp_id": row["temp_id"], "status": row["status"], "data": row["data"]} for row in rows]
 
-    async def _modify_items(self, user_id: str, batch_id: str, temp_ids: List[int], mods: Dict[str, Any]):
-        for tid in temp_ids:
-            res = await self.db.execute(
-                select(StagingArea).where(
-                    StagingArea.user_id == user_id,
-                    StagingArea.batch_id == batch_id,
-                    StagingArea.temp_id == tid
-                )
-            )
-            entry = res.scalar_one_or_none()
-            if entry:
-                data = json.loads(entry.parsed_json)
-                data.update(mods)
-                # 重新计算 hash_id 以防修改了核心字段
-                data["hash_id"] = generate_hash_id(user_id, data.get("date"), data.get("amount"), data.get("remark"), data.get("payee"))
-                entry.parsed_json = json.dumps(data, ensure_ascii=False)
+    async def _confirm_rows(self, user_id: str, rows: List[Dict[str, Any]]):
+        """确认的条目一次性写入账目表，并批量学习备注关键词；已入账的重复条目标记为 duplicate"""
+        from app.services.category_learner import CategoryLearner
 
-    async def _delete_items(self, user_id: str, batch_id: str, temp_ids: List[int]):
-        await self.db.execute(
-            update(StagingArea)
-            .where(StagingArea.user_id == user_id, StagingArea.batch_id == batch_id, StagingArea.temp_id.in_(temp_ids))
-            .values(status="rejected")
-        )
+        written = await insert_expenses(self.db, user_id, [expense_values(user_id, row["data"], "interact") for row in rows])
+        for idx in written.skipped:
+            rows[idx]["status"] = "duplicate"
 
-    async def _cancel_batch(self, user_id: str, batch_id: str):
-        await self.db.execute(
-            update(StagingArea)
-            .where(StagingArea.user_id == user_id, StagingArea.batch_id == batch_id)
-            .values(status="rejected")
-        )
+        # 只有当置信度低或者标记为已修改时，我们才触发强烈倾向的学习（这里简化为全部确认即学习）
+        await CategoryLearner(self.db).learn_many(user_id, [
+            (rows[idx]["data"].get("remark"), rows[idx]["data"].get("main_category"), rows[idx]["data"].get("sub_category"))
+            for idx in written.inserted
+        ])
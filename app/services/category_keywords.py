@@ -0,0 +1,128 @@
+import unicodedata
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select, func, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.database import AsyncSessionLocal, dialect_insert
+from app.models.tables import Category, CategoryKeyword
+from app.services.data_version import bump_on_commit
+from app.utils.aho_corasick import AhoCorasick
+
+# 超过该长度的备注不作为关键词学习（多半是整句描述，泛化不了）
+MAX_KEYWORD_LENGTH = 20
+
+class KeywordEntry(NamedTuple):
+    keyword: str
+    category_id: int
+    main: str
+    sub: str
+    hits: int
+
+def normalize_keyword(text: Optional[str]) -> str:
+    return unicodedata.normalize("NFKC", text or "").strip()
+
+def split_keywords(text: Optional[str]) -> List[str]:
+    """旧版逗号分隔格式 -> 去重后的关键词列表"""
+    seen: List[str] = []
+    for kw in (text or "").split(","):
+        kw = normalize_keyword(kw)
+        if kw and kw not in seen:
+            seen.append(kw)
+    return seen
+
+def build_automaton(entries: Iterable[KeywordEntry]) -> AhoCorasick[KeywordEntry]:
+    automaton: AhoCorasick[KeywordEntry] = AhoCorasick()
+    for entry in entries:
+        automaton.add(entry.keyword, entry)
+    return automaton.build()
+
+async def load_keywords(db: AsyncSession, user_id: str) -> List[KeywordEntry]:
+    """用户全部关键词，按分类内命中次数、最近使用排序"""
+    result = await db.execute(
+        select(CategoryKeyword.keyword, CategoryKeyword.category_id, Category.main_name, Category.sub_name, CategoryKeyword.hits)
+        .join(Category, Category.id == CategoryKeyword.category_id)
+        .where(CategoryKeyword.user_id == user_id)
+        .order_by(CategoryKeyword.category_id, CategoryKeyword.hits.desc(), CategoryKeyword.last_used_at.desc(), CategoryKeyword.id)
+    )
+    return [KeywordEntry(*row) for row in result.all()]
+
+async def seed_keywords(db: AsyncSession, user_id: str, keywords: Dict[int, List[str]], source: str = "default"):
+    """批量写入分类关键词（已存在的跳过），随调用方事务提交"""
+    rows = [
+        {"user_id": user_id, "category_id": category_id, "keyword": kw, "source": source, "hits": 0, "created_at": datetime.utcnow()}
+        for category_id, kws in keywords.items() for kw in kws
+    ]
+    if rows:
+        await db.execute(
+            dialect_insert(db, CategoryKeyword).values(rows).on_conflict_do_nothing(index_elements=["category_id", "keyword"])
+        )
+
+async def record_keyword_hits(db: AsyncSession, user_id: str, hits: Dict[Tuple[int, str], int]):
+    """
+    一条 upsert 记录 (分类, 关键词) 的命中：新关键词插入，已有的累加 hits 并刷新 last_used_at
+    之后把超出 KEYWORD_MAX_PER_CATEGORY 的学习关键词按 (hits, last_used_at) 淘汰
+    """
+    if not hits:
+        return
+    now = datetime.utcnow()
+    stmt = dialect_insert(db, CategoryKeyword).values([
+        {"user_id": user_id, "category_id": category_id, "keyword": kw, "source": "learned", "hits": n, "last_used_at": now, "created_at": now}
+        for (category_id, kw), n in hits.items()
+    ])
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=["category_id", "keyword"],
+        set_={"hits": CategoryKeyword.hits + stmt.excluded.hits, "last_used_at": stmt.excluded.last_used_at}
+    ))
+
+    ranked = (
+        select(
+            CategoryKeyword.id,
+            func.row_number().over(
+                partition_by=CategoryKeyword.category_id,
+                order_by=(CategoryKeyword.hits.desc(), CategoryKeyword.last_used_at.desc(), CategoryKeyword.id.desc())
+            ).label("rank")
+        )
+        .where(
+            CategoryKeyword.user_id == user_id,
+            CategoryKeyword.category_id.in_({category_id for category_id, _ in hits}),
+            CategoryKeyword.source == "learned"
+        )
+        .subquery()
+    )
+    await db.execute(
+        delete(CategoryKeyword).where(
+            CategoryKeyword.id.in_(select(ranked.c.id).where(ranked.c.rank > settings.KEYWORD_MAX_PER_CATEGORY))
+        )
+    )
+    # 分类列表会返回关键词
+    await bump_on_commit(db, user_id)
+
+async def migrate_legacy_keywords():
+    """把 categories.keywords 中尚未迁移的逗号分隔关键词导入 category_keywords（启动时执行，可重复执行）"""
+    async with AsyncSessionLocal() as db:
+        migrated = select(CategoryKeyword.category_id).distinct()
+        result = await db.execute(
+            select(Category).where(
+                Category.keywords.is_not(None),
+                Category.keywords != "",
+                Category.id.not_in(migrated)
+            )
+        )
+        by_user: Dict[str, Dict[int, List[str]]] = {}
+        for category in result.scalars().all():
+            by_user.setdefault(category.user_id, {})[category.id] = split_keywords(category.keywords)
+        for user_id, keywords in by_user.items():
+            await seed_keywords(db, user_id, keywords)
+        await db.commit()
+
+def top_keywords(entries: List[KeywordEntry], limit: int) -> Dict[int, str]:
+    """每个分类命中最多的前 limit 个关键词（逗号分隔），用于提示词，避免关键词列表撑大 Prompt"""
+    grouped: Dict[int, List[str]] = {}
+    for entry in entries:
+        kws = grouped.setdefault(entry.category_id, [])
+        if len(kws) < limit:
+            kws.append(entry.keyword)
+    return {category_id: ",".join(kws) for category_id, kws in grouped.items()}
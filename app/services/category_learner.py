@@ -1,8 +1,10 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update
-from typing import Dict, Any
+from sqlalchemy import select
+from typing import Dict, List, Optional, Tuple
 
 from app.models.tables import Category
+from app.services.category_keywords import MAX_KEYWORD_LENGTH, normalize_keyword, record_keyword_hits
+from app.services.prompt_cache import invalidate_on_commit, user_context_cache
 
 class CategoryLearner:
     def __init__(self, db: AsyncSession):
@@ -12,23 +14,45 @@ class CategoryLearner:
         """
         当用户修改分类时，将备注作为关键词学习，提高下次识别准确率
         """
-        if not remark or not main_name:
+        await self.learn_many(user_id, [(remark, main_name, sub_name)])
+
+    async def learn_many(self, user_id: str, corrections: List[Tuple[str, str, Optional[str]]]):
+        """
+        批量学习 (备注, 一级分类, 二级分类)，随调用方事务提交：
+        备注已命中该分类的关键词时只累加这些关键词的命中次数，否则把备注作为新关键词
+        同一批内重复的 (分类, 关键词) 合并为一次写入
+        """
+        corrections = [(normalize_keyword(r), m, s) for r, m, s in corrections if m]
+        corrections = [c for c in corrections if c[0]]
+        if not corrections:
             return
 
         # 查找对应分类
         result = await self.db.execute(
-            select(Category).where(
+            select(Category.id, Category.main_name, Category.sub_name).where(
                 Category.user_id == user_id,
-                Category.main_name == main_name,
-                Category.sub_name == sub_name
+                Category.main_name.in_({m for _, m, _ in corrections})
             )
         )
-        category = result.scalar_one_or_none()
-        
-        if category:
-            keywords = category.keywords.split(",") if category.keywords else []
-            clean_remark = remark.strip()
-            if clean_remark not in keywords:
-                keywords.append(clean_remark)
-                category.keywords = ",".join(keywords)
-                # 标记已修改，后续 commit
+        category_ids = {(row.main_name, row.sub_name): row.id for row in result.all()}
+        automaton = (await user_context_cache.get(self.db, user_id)).keyword_automaton
+
+        hits: Dict[Tuple[int, str], int] = {}
+        added = False
+        for remark, main_name, sub_name in corrections:
+            category_id = category_ids.get((main_name, sub_name))
+            if category_id is None:
+                continue
+            matched = {kw for _, kw, entry in automaton.iter(remark) if entry.category_id == category_id}
+            if not matched:
+                if len(remark) > MAX_KEYWORD_LENGTH:
+                    continue
+                matched = {remark}
+                added = True
+            for kw in matched:
+                hits[(category_id, kw)] = hits.get((category_id, kw), 0) + 1
+
+        await record_keyword_hits(self.db, user_id, hits)
+        if added:
+            # 新增关键词后刷新用户解析上下文（提交后生效）；仅命中次数变化时沿用缓存，排序在下次刷新时更新
+            invalidate_on_commit(self.db, user_id)
@@ -0,0 +1,229 @@
+import re
+import unicodedata
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import delete, event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.database import dialect_insert
+from app.models.tables import CategoryStat
+from app.services.data_version import get_data_version
+from app.services.category_keywords import MAX_KEYWORD_LENGTH
+from app.services.fast_parser import SEGMENT_SPLIT
+from app.utils.aho_corasick import AhoCorasick
+
+# 备注分词：空白与常见分隔符；中文备注通常整体作为一个词
+TOKEN_SPLIT = re.compile(r"[\s,，、;；/|·+]+")
+
+# 各类特征的投票权重：商户最能说明分类，消费人只作为先验
+FEATURE_WEIGHTS = {"payee": 3.0, "token": 1.0, "consumer": 0.5}
+
+Category = Tuple[str, str]
+
+class Prediction(NamedTuple):
+    main: str
+    sub: Optional[str]
+    confidence: float
+
+def _normalize(text: Optional[str]) -> str:
+    return unicodedata.normalize("NFKC", text or "").strip().lower()
+
+def remark_tokens(remark: Optional[str]) -> List[str]:
+    tokens = []
+    for token in TOKEN_SPLIT.split(_normalize(remark)):
+        if 2 <= len(token) <= MAX_KEYWORD_LENGTH and token not in tokens:
+            tokens.append(token)
+    return tokens
+
+def expense_features(payee: Optional[str], remark: Optional[str], consumer: Optional[str]) -> List[Tuple[str, str]]:
+    """账目 -> [(特征类型, 特征值)]"""
+    features = []
+    if _normalize(payee):
+        features.append(("payee", _normalize(payee)))
+    features.extend(("token", token) for token in remark_tokens(remark))
+    if _normalize(consumer):
+        features.append(("consumer", _normalize(consumer)))
+    return features
+
+async def update_category_stats(db: AsyncSession, user_id: str, expenses: Iterable[Dict[str, Any]], delta: int):
+    """
+    按账目增量更新分类频次（入账 +1，删除 -1，修改为先 -1 后 +1），一条 upsert 完成，随调用方事务提交
+    expenses 为带 payee/remark/consumer/main_category/sub_category 的字典
+    """
+    counts: Counter = Counter()
+    for expense in expenses:
+        if not expense.get("main_category"):
+            continue
+        category = (expense["main_category"], expense.get("sub_category") or "")
+        for feature_type, feature in expense_features(expense.get("payee"), expense.get("remark"), expense.get("consumer")):
+            counts[(feature_type, feature) + category] += delta
+    counts = Counter({k: v for k, v in counts.items() if v})
+    if not counts:
+        return
+
+    now = datetime.utcnow()
+    stmt = dialect_insert(db, CategoryStat).values([
+        {
+            "user_id": user_id, "feature_type": feature_type, "feature": feature,
+            "main_category": main, "sub_category": sub, "count": n, "updated_at": now
+        }
+        for (feature_type, feature, main, sub), n in counts.items()
+    ])
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=["user_id", "feature_type", "feature", "main_category", "sub_category"],
+        set_={"count": CategoryStat.count + stmt.excluded.count, "updated_at": stmt.excluded.updated_at}
+    ))
+    if delta < 0:
+        await db.execute(delete(CategoryStat).where(CategoryStat.user_id == user_id, CategoryStat.count <= 0))
+    invalidate_model_on_commit(db, user_id)
+
+class UserCategoryModel:
+    """单个用户的分类频次模型：特征 -> 各分类出现次数，外加用于扫描原始输入的特征自动机"""
+
+    def __init__(self, rows: Iterable[Tuple[str, str, str, str, int]]):
+        self.stats: Dict[Tuple[str, str], Counter] = {}
+        for feature_type, feature, main, sub, count in rows:
+            self.stats.setdefault((feature_type, feature), Counter())[(main, sub)] += count
+        self._automaton: Optional[AhoCorasick] = None
+
+    def _vote(self, features: Iterable[Tuple[str, str]]) -> Optional[Prediction]:
+        """
+        出现次数 n 不少于 CATEGORY_PREDICT_MIN_SUPPORT 的特征参与投票，票数 = 权重 × count / (n + 1)
+        （加一平滑：同一商户 4 次全为某分类时约 0.8，9 次时 0.9，样本越多越可信）
+        置信度 = 最高得票 / 参与投票特征的权重和
+        """
+        scores: Counter = Counter()
+        total_weight = 0.0
+        for feature in features:
+            dist = self.stats.get(feature)
+            if not dist:
+                continue
+            n = sum(dist.values())
+            if n < settings.CATEGORY_PREDICT_MIN_SUPPORT:
+                continue
+            weight = FEATURE_WEIGHTS[feature[0]]
+            total_weight += weight
+            for category, count in dist.items():
+                scores[category] += weight * count / (n + 1)
+        if not scores:
+            return None
+        (main, sub), score = scores.most_common(1)[0]
+        return Prediction(main, sub or None, round(score / total_weight, 3))
+
+    def predict(self, payee: Optional[str], remark: Optional[str], consumer: Optional[str]) -> Optional[Prediction]:
+        return self._vote(expense_features(payee, remark, consumer))
+
+    def hint(self, text: str) -> Optional[List[Category]]:
+        """
+        扫描原始文字输入：每一段都命中置信的商户/备注词时，返回这些分类，供提示词只列出它们
+        任一段没有把握时返回 None（使用完整分类列表）
+        """
+        if self._automaton is None:
+            automaton = AhoCorasick()
+            for feature in self.stats:
+                if feature[0] != "consumer":
+                    automaton.add(feature[1], feature)
+            self._automaton = automaton.build()
+
+        categories: List[Category] = []
+        for segment in SEGMENT_SPLIT.split(_normalize(text)):
+            if not segment.strip():
+                continue
+            features = {feature for _, _, feature in self._automaton.iter(segment)}
+            prediction = self._vote(features)
+            if prediction is None or prediction.confidence < settings.CATEGORY_PREDICT_CONFIDENCE:
+                return None
+            category = (prediction.main, prediction.sub)
+            if category not in categories:
+                categories.append(category)
+        return categories or None
+
+    def prompt_categories(self, text: str, user_categories: List[Dict]) -> Optional[List[Dict]]:
+        """有把握时返回只含预测分类的精简分类列表（用于文字解析提示词），否则返回 None"""
+        hint = self.hint(text)
+        if hint is None:
+            return None
+        reduced = [c for c in user_categories if (c["main"], c["sub"]) in hint]
+        return reduced or None
+
+class CategoryPredictor:
+    """
+    按用户缓存分类频次模型，缓存记录加载时的用户数据版本
+    每次取用前与数据库中的版本比对，不一致（含其它进程入账、修改、删除）即重新加载；本进程的变动另在提交后直接失效
+    """
+
+    def __init__(self):
+        self._models: Dict[str, Tuple[int, UserCategoryModel]] = {}
+
+    async def get(self, db: AsyncSession, user_id: str) -> UserCategoryModel:
+        version = await get_data_version(db, user_id)
+        entry = self._models.get(user_id)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        result = await db.execute(
+            select(CategoryStat.feature_type, CategoryStat.feature, CategoryStat.main_category, CategoryStat.sub_category, CategoryStat.count)
+            .where(CategoryStat.user_id == user_id, CategoryStat.count > 0)
+        )
+        model = UserCategoryModel(result.all())
+        # 加载期间版本变化（有账目变动提交）则不缓存
+        if await get_data_version(db, user_id) == version:
+            self._models[user_id] = (version, model)
+        else:
+            self._models.pop(user_id, None)
+        return model
+
+    def invalidate(self, user_id: str):
+        self._models.pop(user_id, None)
+
+    async def prompt_categories(self, db: AsyncSession, user_id: str, text: str, user_categories: List[Dict]) -> Optional[List[Dict]]:
+        """有把握时返回只含预测分类的精简分类列表（用于文字解析提示词），否则返回 None"""
+        if not settings.CATEGORY_PREDICT_ENABLED:
+            return None
+        return (await self.get(db, user_id)).prompt_categories(text, user_categories)
+
+    async def apply(self, db: AsyncSession, user_id: str, items: List[Dict[str, Any]]):
+        """
+        用历史频次校正 LLM 给出的分类：
+        - 置信度 >= CATEGORY_OVERRIDE_CONFIDENCE 且与 LLM 不同时覆盖
+        - LLM 未给出分类或给出"其他"时，置信度 >= CATEGORY_PREDICT_CONFIDENCE 即填入
+        被采用的条目带 category_source=history 与 category_confidence
+        """
+        if not settings.CATEGORY_PREDICT_ENABLED or not items:
+            return
+        model = await self.get(db, user_id)
+        if not model.stats:
+            return
+        for item in items:
+            prediction = model.predict(item.get("payee"), item.get("remark"), item.get("consumer"))
+            if prediction is None:
+                continue
+            current = (item.get("main_category"), item.get("sub_category"))
+            if current == (prediction.main, prediction.sub):
+                item["category_confidence"] = prediction.confidence
+                continue
+            threshold = settings.CATEGORY_OVERRIDE_CONFIDENCE
+            if not current[0] or current[0] == "其他":
+                threshold = settings.CATEGORY_PREDICT_CONFIDENCE
+            if prediction.confidence >= threshold:
+                item["main_category"] = prediction.main
+                item["sub_category"] = prediction.sub
+                item["category_source"] = "history"
+                item["category_confidence"] = prediction.confidence
+
+category_predictor = CategoryPredictor()
+
+def invalidate_model_on_commit(db: AsyncSession, user_id: str):
+    db.info.setdefault("invalidate_category_model", set()).add(user_id)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session):
+    for user_id in session.info.pop("invalidate_category_model", ()):
+        category_predictor.invalidate(user_id)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session):
+    session.info.pop("invalidate_category_model", None)
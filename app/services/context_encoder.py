@@ -0,0 +1,59 @@
+import json
+from typing import Any, Dict, List, Tuple
+
+# 表格列：列名 -> 取值函数；只包含用户可通过指令修改的字段
+ITEM_COLUMNS = [
+    ("日期", lambda d: d.get("date")),
+    ("金额", lambda d: _format_amount(d.get("amount"))),
+    ("分类", lambda d: "/".join(p for p in (d.get("main_category"), d.get("sub_category")) if p)),
+    ("商户", lambda d: d.get("payee")),
+    ("备注", lambda d: d.get("remark")),
+    ("消费人", lambda d: d.get("consumer")),
+    ("必需", lambda d: d.get("is_essential")),
+    ("资产", lambda d: d.get("linked_asset")),
+]
+
+EMPTY_CELL = "-"
+
+def _format_amount(amount: Any) -> Any:
+    # 80.0 -> 80，省去无意义的小数位
+    if isinstance(amount, float) and amount.is_integer():
+        return int(amount)
+    return amount
+
+def _cell(value: Any) -> str:
+    if value is None or value == "":
+        return EMPTY_CELL
+    return str(value).replace("|", "/").replace("\n", " ")
+
+def encode_items_table(items: List[Dict[str, Any]]) -> Tuple[str, Dict[str, int]]:
+    """
+    将批次条目编码为紧凑表格：只保留待确认条目与可编辑字段
+    返回 (表格文本, 各状态条目数)，已确认/已删除的条目只以数量出现
+    """
+    counts: Dict[str, int] = {}
+    rows = ["编号|" + "|".join(name for name, _ in ITEM_COLUMNS)]
+    for item in items:
+        status = item.get("status", "pending")
+        counts[status] = counts.get(status, 0) + 1
+        if status != "pending":
+            continue
+        data = item.get("data", {})
+        rows.append("|".join([str(item["temp_id"])] + [_cell(get(data)) for _, get in ITEM_COLUMNS]))
+    return "\n".join(rows), counts
+
+def encode_items_json(items: List[Dict[str, Any]]) -> str:
+    """原有格式：完整批次 JSON（含全部状态与内部字段）"""
+    return json.dumps(items, ensure_ascii=False, indent=2)
+
+def encode_categories(categories: List[Dict[str, Any]]) -> str:
+    """按一级分类分组：每行 "一级: 二级1、二级2"，代替逐条的 {"main", "sub"} 对象"""
+    grouped: Dict[str, List[str]] = {}
+    for c in categories:
+        subs = grouped.setdefault(c["main"], [])
+        if c.get("sub") and c["sub"] not in subs:
+            subs.append(c["sub"])
+    return "\n".join(f"{main}: {'、'.join(subs)}" if subs else main for main, subs in grouped.items())
+
+def encode_names(names: List[str]) -> str:
+    return "、".join(names) if names else "（无）"
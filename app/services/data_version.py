@@ -0,0 +1,41 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models.database import dialect_insert
+from app.models.tables import UserDataVersion
+
+# 用户数据版本号（单调递增）：写入随事务在 user_data_versions 中加一
+# 读取总是查库（主键查询），多进程部署下各进程看到的版本一致；进程内缓存都以它校验是否过期
+
+async def get_data_version(db: AsyncSession, user_id: str) -> int:
+    return await db.scalar(select(UserDataVersion.version).where(UserDataVersion.user_id == user_id)) or 0
+
+async def bump_on_commit(db: AsyncSession, user_id: str):
+    """本事务内该用户的数据版本加一（同一事务多次调用只加一次），随调用方事务提交"""
+    pending = db.info.setdefault("data_versions", {})
+    if user_id in pending:
+        return
+    stmt = dialect_insert(db, UserDataVersion).values(user_id=user_id, version=1, updated_at=datetime.utcnow())
+    result = await db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["user_id"],
+            set_={"version": UserDataVersion.version + 1, "updated_at": stmt.excluded.updated_at}
+        ).returning(UserDataVersion.version)
+    )
+    pending[user_id] = result.scalar_one()
+
+def pending_version(db: AsyncSession, user_id: str) -> Optional[int]:
+    """本事务提交后该用户的数据版本；尚未调用 bump_on_commit 时为 None"""
+    return db.info.get("data_versions", {}).get(user_id)
+
+@event.listens_for(Session, "after_commit")
+def _reset_after_commit(session: Session):
+    session.info.pop("data_versions", None)
+
+@event.listens_for(Session, "after_rollback")
+def _reset_after_rollback(session: Session):
+    session.info.pop("data_versions", None)
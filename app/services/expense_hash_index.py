@@ -0,0 +1,99 @@
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.tables import Expense
+from app.services.data_version import get_data_version, pending_version
+
+def _key(hash_id: str) -> int:
+    # 只保留 md5 前 64 位：内存占用约为字符串的 1/3，前缀碰撞只会多一次数据库确认
+    return int(hash_id[:16], 16)
+
+class ExpenseHashIndex:
+    """
+    按用户缓存已入账账目的 hash_id，用于去重时快速判定"肯定是新账目"
+    每条缓存记录加载时的用户数据版本，查询前与数据库中的版本比对，不一致（含其它进程的写入）即重新加载
+    本进程的入账/删除在事务提交后按新版本增量更新；集合里有的 hash_id 仍需数据库确认（可能是前缀碰撞）
+    """
+
+    def __init__(self):
+        self._users: "OrderedDict[str, Tuple[int, Set[int]]]" = OrderedDict()
+
+    async def maybe_existing(self, db: AsyncSession, user_id: str, hash_ids: Iterable[str]) -> Set[str]:
+        """返回可能已入账的 hash_id；未启用时原样返回，全部交给数据库判断"""
+        hash_ids = set(hash_ids)
+        if not settings.DUPLICATE_FILTER_ENABLED or not hash_ids:
+            return hash_ids
+        keys = await self._get(db, user_id)
+        return {h for h in hash_ids if _key(h) in keys}
+
+    async def _get(self, db: AsyncSession, user_id: str) -> Set[int]:
+        version = await get_data_version(db, user_id)
+        entry = self._users.get(user_id)
+        if entry is not None and entry[0] == version:
+            self._users.move_to_end(user_id)
+            return entry[1]
+
+        result = await db.execute(select(Expense.hash_id).where(Expense.user_id == user_id))
+        keys = {_key(h) for h in result.scalars().all()}
+        # 加载期间版本变化（有写入提交）则不缓存，下次重新加载
+        if await get_data_version(db, user_id) == version:
+            self._users[user_id] = (version, keys)
+            self._users.move_to_end(user_id)
+            while len(self._users) > settings.DUPLICATE_FILTER_MAX_USERS:
+                self._users.popitem(last=False)
+        else:
+            self._users.pop(user_id, None)
+        return keys
+
+    def apply(self, user_id: str, version: Optional[int], added: Iterable[str], removed: Iterable[str]):
+        """
+        本进程提交的变动：缓存恰好是上一个版本时增量更新，否则（中间有其它写入或版本未知）丢弃缓存
+        """
+        entry = self._users.get(user_id)
+        if entry is None:
+            return
+        if version is None or entry[0] != version - 1:
+            self._users.pop(user_id)
+            return
+        keys = entry[1]
+        keys.update(_key(h) for h in added if h)
+        keys.difference_update(_key(h) for h in removed if h)
+        self._users[user_id] = (version, keys)
+
+    def invalidate(self, user_id: str):
+        self._users.pop(user_id, None)
+
+expense_hash_index = ExpenseHashIndex()
+
+def _pending(db: AsyncSession, user_id: str) -> Dict[str, Any]:
+    changes = db.info.setdefault("expense_hash_changes", {})
+    pending = changes.setdefault(user_id, {"version": None, "added": [], "removed": []})
+    # 调用方应先 bump_on_commit；同一事务内版本只加一次
+    pending["version"] = pending_version(db, user_id)
+    return pending
+
+def add_on_commit(db: AsyncSession, user_id: str, hash_ids: Iterable[str]):
+    """当前事务提交后把新入账的 hash_id 加入索引"""
+    hash_ids = list(hash_ids)
+    if hash_ids:
+        _pending(db, user_id)["added"].extend(hash_ids)
+
+def discard_on_commit(db: AsyncSession, user_id: str, hash_ids: Iterable[str]):
+    """当前事务提交后把已删除账目的 hash_id 移出索引"""
+    hash_ids = list(hash_ids)
+    if hash_ids:
+        _pending(db, user_id)["removed"].extend(hash_ids)
+
+@event.listens_for(Session, "after_commit")
+def _apply_after_commit(session: Session):
+    for user_id, pending in session.info.pop("expense_hash_changes", {}).items():
+        expense_hash_index.apply(user_id, pending["version"], pending["added"], pending["removed"])
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session):
+    session.info.pop("expense_hash_changes", None)
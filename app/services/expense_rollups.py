@@ -0,0 +1,183 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.database import AsyncSessionLocal, dialect_insert
+from app.models.tables import Expense, ExpenseRollup
+
+# 汇总金额按分累加后的浮点误差，读取时四舍五入到分
+ROUND_DIGITS = 2
+
+RollupKey = Tuple[str, str, str, str]  # (年月, 一级, 二级, 消费人)
+
+def rollup_key(expense: Dict[str, Any]) -> Optional[RollupKey]:
+    if not expense.get("date") or not expense.get("main_category"):
+        return None
+    return (expense["date"][:7], expense["main_category"], expense.get("sub_category") or "", expense.get("consumer") or "")
+
+async def update_rollups(db: AsyncSession, user_id: str, expenses: Iterable[Dict[str, Any]], delta: int):
+    """
+    按账目增量更新月度汇总（入账 +1，删除 -1，修改为先 -1 后 +1），一条 upsert 完成，随调用方事务提交
+    expenses 为带 date/amount/main_category/sub_category/consumer 的字典
+    """
+    totals: Dict[RollupKey, List] = defaultdict(lambda: [0.0, 0])
+    for expense in expenses:
+        key = rollup_key(expense)
+        if key is None:
+            continue
+        totals[key][0] += delta * float(expense.get("amount") or 0)
+        totals[key][1] += delta
+    totals = {k: v for k, v in totals.items() if v[1]}
+    if not totals:
+        return
+
+    now = datetime.utcnow()
+    stmt = dialect_insert(db, ExpenseRollup).values([
+        {
+            "user_id": user_id, "month": month, "main_category": main, "sub_category": sub, "consumer": consumer,
+            "total": total, "count": count, "updated_at": now
+        }
+        for (month, main, sub, consumer), (total, count) in totals.items()
+    ])
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=["user_id", "month", "main_category", "sub_category", "consumer"],
+        set_={
+            "total": ExpenseRollup.total + stmt.excluded.total,
+            "count": ExpenseRollup.count + stmt.excluded.count,
+            "updated_at": stmt.excluded.updated_at
+        }
+    ))
+    if delta < 0:
+        await db.execute(delete(ExpenseRollup).where(ExpenseRollup.user_id == user_id, ExpenseRollup.count <= 0))
+
+def _shift_month(month: str, step: int) -> str:
+    year, mon = int(month[:4]), int(month[5:7])
+    index = year * 12 + mon - 1 + step
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+def _full_months(start_date: Optional[str], end_date: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """
+    日期区间内完整覆盖的首尾月份（None 表示不设界）；区间两端不足一个月的部分由调用方从 expenses 补算
+    日期格式不是 YYYY-MM-DD 时抛出 ValueError
+    """
+    first = last = None
+    if start_date:
+        start = datetime.strptime(start_date, "%Y-%m-%d")
+        first = start_date[:7] if start.day == 1 else _shift_month(start_date[:7], 1)
+    if end_date:
+        end = datetime.strptime(end_date, "%Y-%m-%d")
+        last = end_date[:7] if (end + timedelta(days=1)).day == 1 else _shift_month(end_date[:7], -1)
+    return first, last
+
+async def category_totals(db: AsyncSession, user_id: str, start_date: Optional[str] = None, end_date: Optional[str] = None) -> Dict[str, float]:
+    """
+    日期区间内各一级分类的支出合计
+    完整的月份读月度汇总，区间两端不满一个月的部分按日期索引从 expenses 聚合
+    """
+    edge = select(Expense.main_category, func.sum(Expense.amount)).where(Expense.user_id == user_id)
+    if start_date:
+        edge = edge.where(Expense.date >= start_date)
+    if end_date:
+        edge = edge.where(Expense.date <= end_date)
+
+    totals: Dict[str, float] = defaultdict(float)
+    try:
+        first, last = _full_months(start_date, end_date)
+    except ValueError:
+        first = last = None
+        has_full = False  # 非标准日期格式：全部从 expenses 聚合
+    else:
+        has_full = not (first and last and first > last)
+
+    if has_full:
+        query = select(ExpenseRollup.main_category, func.sum(ExpenseRollup.total)).where(ExpenseRollup.user_id == user_id)
+        if first:
+            query = query.where(ExpenseRollup.month >= first)
+        if last:
+            query = query.where(ExpenseRollup.month <= last)
+        for main, total in (await db.execute(query.group_by(ExpenseRollup.main_category))).all():
+            totals[main] += total
+
+        # 只剩首尾不完整的月份需要从 expenses 聚合
+        outside = []
+        if first:
+            outside.append(Expense.date < first)
+        if last:
+            outside.append(Expense.date >= _shift_month(last, 1))
+        edge = edge.where(or_(*outside)) if outside else None
+
+    if edge is not None:
+        for main, total in (await db.execute(edge.group_by(Expense.main_category))).all():
+            totals[main] += total
+
+    return {main: round(total, ROUND_DIGITS) for main, total in totals.items()}
+
+async def period_total(db: AsyncSession, user_id: str, first_month: str, last_month: str) -> float:
+    """首尾年月（YYYY-MM，含）之间的支出合计"""
+    total = await db.scalar(
+        select(func.sum(ExpenseRollup.total)).where(
+            ExpenseRollup.user_id == user_id,
+            ExpenseRollup.month >= first_month,
+            ExpenseRollup.month <= last_month
+        )
+    )
+    return round(total or 0.0, ROUND_DIGITS)
+
+def _aggregate_expenses(user_id: Optional[str] = None):
+    """从 expenses 直接聚合出月度汇总（重建与校验用）"""
+    query = select(
+        Expense.user_id,
+        func.substr(Expense.date, 1, 7).label("month"),
+        Expense.main_category,
+        func.coalesce(Expense.sub_category, "").label("sub_category"),
+        func.coalesce(Expense.consumer, "").label("consumer"),
+        func.sum(Expense.amount).label("total"),
+        func.count().label("count"),
+        func.max(Expense.created_at).label("updated_at")
+    )
+    if user_id:
+        query = query.where(Expense.user_id == user_id)
+    return query.group_by(
+        Expense.user_id, func.substr(Expense.date, 1, 7), Expense.main_category,
+        func.coalesce(Expense.sub_category, ""), func.coalesce(Expense.consumer, "")
+    )
+
+async def rebuild_rollups(db: AsyncSession, user_id: Optional[str] = None):
+    """清空并按 expenses 一条 INSERT ... SELECT 重建月度汇总，随调用方事务提交"""
+    clear = delete(ExpenseRollup)
+    if user_id:
+        clear = clear.where(ExpenseRollup.user_id == user_id)
+    await db.execute(clear)
+    columns = ["user_id", "month", "main_category", "sub_category", "consumer", "total", "count", "updated_at"]
+    await db.execute(insert(ExpenseRollup).from_select(columns, _aggregate_expenses(user_id)))
+
+async def verify_rollups(db: AsyncSession, user_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """对比月度汇总与 expenses 实际聚合，返回不一致的条目"""
+    expected = {
+        (r.user_id, r.month, r.main_category, r.sub_category, r.consumer): (round(r.total, ROUND_DIGITS), r.count)
+        for r in (await db.execute(_aggregate_expenses(user_id))).all()
+    }
+    query = select(ExpenseRollup)
+    if user_id:
+        query = query.where(ExpenseRollup.user_id == user_id)
+    actual = {
+        (r.user_id, r.month, r.main_category, r.sub_category, r.consumer): (round(r.total, ROUND_DIGITS), r.count)
+        for r in (await db.execute(query)).scalars()
+    }
+    return [
+        {"key": key, "expected": expected.get(key), "actual": actual.get(key)}
+        for key in sorted(expected.keys() | actual.keys())
+        if expected.get(key) != actual.get(key)
+    ]
+
+async def backfill_rollups():
+    """为有账目但还没有月度汇总的用户构建汇总（启动时执行，可重复执行）"""
+    async with AsyncSessionLocal() as db:
+        rolled = select(ExpenseRollup.user_id).distinct()
+        result = await db.execute(select(Expense.user_id).distinct().where(Expense.user_id.not_in(rolled)))
+        for user_id in result.scalars().all():
+            await rebuild_rollups(db, user_id)
+        await db.commit()
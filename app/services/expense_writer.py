@@ -0,0 +1,74 @@
+from typing import Any, Dict, List, NamedTuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.database import dialect_insert
+from app.models.tables import Expense
+from app.services.expense_hash_index import add_on_commit
+from app.services.category_stats import update_category_stats
+from app.services.expense_rollups import update_rollups
+from app.services.analytics import record_on_commit as record_analytics_on_commit
+from app.services.data_version import bump_on_commit
+from app.utils.hash import generate_hash_id
+
+class WriteResult(NamedTuple):
+    inserted: List[int]  # 写入成功的条目下标
+    skipped: List[int]  # 因 (user_id, hash_id) 已存在而跳过的条目下标
+
+def expense_values(user_id: str, data: Dict[str, Any], source_channel: str) -> Dict[str, Any]:
+    """暂存区条目 -> expenses 表字段"""
+    return {
+        "user_id": user_id,
+        "date": data.get("date"),
+        "amount": data.get("amount"),
+        "main_category": data.get("main_category"),
+        "sub_category": data.get("sub_category"),
+        "payee": data.get("payee"),
+        "remark": data.get("remark"),
+        "consumer": data.get("consumer"),
+        "is_essential": data.get("is_essential", 0),
+        "linked_asset": data.get("linked_asset"),
+        "hash_id": data.get("hash_id") or generate_hash_id(user_id, data.get("date"), data.get("amount"), data.get("remark"), data.get("payee")),
+        "source_channel": source_channel
+    }
+
+async def record_expense_changes(db: AsyncSession, user_id: str, expenses: List[Dict[str, Any]], delta: int):
+    """
+    账目变动后同步派生数据（数据版本、分类频次、月度汇总、统计分析缓存），随调用方事务提交
+    入账 delta=1，删除 delta=-1，修改为旧值 -1、新值 +1
+    版本先加一：进程内缓存的增量更新按本事务的新版本校验
+    """
+    if expenses:
+        await bump_on_commit(db, user_id)
+    await update_category_stats(db, user_id, expenses, delta)
+    await update_rollups(db, user_id, expenses, delta)
+    record_analytics_on_commit(db, user_id, expenses, delta)
+
+async def insert_expenses(db: AsyncSession, user_id: str, rows: List[Dict[str, Any]]) -> WriteResult:
+    """
+    所有账目写入的统一入口：一条 INSERT ... ON CONFLICT DO NOTHING RETURNING hash_id
+    重复的账目（已入账、并发确认或重试）被跳过而不是让整个事务失败，随调用方事务提交
+    """
+    if not rows:
+        return WriteResult([], [])
+
+    stmt = (
+        dialect_insert(db, Expense)
+        .on_conflict_do_nothing(index_elements=["user_id", "hash_id"])
+        .returning(Expense.hash_id)
+    )
+    result = await db.execute(stmt.values(rows))
+    written = set(result.scalars().all())
+
+    inserted, skipped = [], []
+    for idx, row in enumerate(rows):
+        # 同一次写入里重复的 hash_id 只有第一条生效
+        if row["hash_id"] in written:
+            written.discard(row["hash_id"])
+            inserted.append(idx)
+        else:
+            skipped.append(idx)
+
+    await record_expense_changes(db, user_id, [rows[idx] for idx in inserted], 1)
+    add_on_commit(db, user_id, [rows[idx]["hash_id"] for idx in inserted])
+    return WriteResult(inserted, skipped)
@@ -0,0 +1,151 @@
+import re
+import unicodedata
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services.category_keywords import KeywordEntry, build_automaton
+from app.utils.aho_corasick import AhoCorasick
+
+# 相对日期词 -> 距今天数（长词在前，避免"大前天"被"前天"截断）
+RELATIVE_DAYS = [("大前天", 3), ("前天", 2), ("昨天", 1), ("昨日", 1), ("今天", 0), ("今日", 0)]
+
+# 描述中可忽略的口语填充词
+FILLER_WORDS = ["一共花了", "一共", "总共", "花了", "用了", "付了", "支付", "消费", "花", "共"]
+
+# 按常识视为固定支出的二级分类
+ESSENTIAL_SUBS = {"食材采购", "生活缴费", "交通工具", "学杂费", "医疗健康", "通讯费"}
+
+# 分段：中英文标点与换行
+SEGMENT_SPLIT = re.compile(r"[，,；;。\n、]+")
+
+# 描述 + 金额 (+ 可选货币单位)
+ITEM_PATTERN = re.compile(
+    r"(?P<desc>[^\d¥￥]*?)\s*[¥￥]?\s*(?P<amount>\d+(?:\.\d{1,2})?)\s*(?P<unit>元|块钱|块|rmb|RMB)?"
+)
+
+# 数字后紧跟这些字时，数字不是金额（日期、数量、时间等），交给 LLM
+NON_AMOUNT_SUFFIX = re.compile(r"^\s*(月|号|日|点|时|分|个|斤|次|人|折|份|件|杯|瓶|%|/|-|:|年|天|公里|km|万|千|百)")
+
+class FastParser:
+    """
+    本地规则解析器（LLM 前置快速通道）
+    基于分类关键词 + 金额 + 相对日期做确定性解析，只处理"买菜55""打车15，话费100"这类简单输入
+    无法完整覆盖或置信度不足时返回 None，由 LLM 兜底
+    """
+
+    def __init__(self, user_categories: Optional[List[Dict]] = None, automaton: Optional[AhoCorasick] = None):
+        """automaton 为用户全部关键词的自动机（UserContext.keyword_automaton）；未提供时由分类列表中的关键词构建"""
+        if automaton is None:
+            automaton = build_automaton(
+                KeywordEntry(kw.strip(), 0, cat.get("main"), cat.get("sub"), 0)
+                for cat in user_categories or []
+                for kw in (cat.get("keywords") or "").split(",")
+                if kw.strip()
+            )
+        self.automaton = automaton
+
+    def parse(self, content: str, today: Optional[datetime] = None) -> Optional[Tuple[List[Dict[str, Any]], float]]:
+        """
+        返回 (items, 整体置信度)；任一片段无法识别时返回 None
+        """
+        if not len(self.automaton):
+            return None
+
+        text = unicodedata.normalize("NFKC", content).strip()
+        if not text:
+            return None
+
+        base_date = today or datetime.now()
+        current_date = base_date.strftime("%Y-%m-%d")
+        items: List[Dict[str, Any]] = []
+
+        for segment in SEGMENT_SPLIT.split(text):
+            segment = segment.strip()
+            if not segment:
+                continue
+
+            # 相对日期对本段及后续片段生效（"昨天买菜55，打车15"）
+            segment, days = self._extract_relative_day(segment)
+            if days is not None:
+                current_date = (base_date - timedelta(days=days)).strftime("%Y-%m-%d")
+
+            parsed = self._parse_segment(segment, current_date)
+            if parsed is None:
+                return None
+            items.extend(parsed)
+
+        if not items:
+            return None
+        return items, min(i["confidence"] for i in items)
+
+    def _extract_relative_day(self, segment: str) -> Tuple[str, Optional[int]]:
+        for word, days in RELATIVE_DAYS:
+            if word in segment:
+                return segment.replace(word, "", 1).strip(), days
+        return segment, None
+
+    def _parse_segment(self, segment: str, date: str) -> Optional[List[Dict[str, Any]]]:
+        items = []
+        pos = 0
+        for match in ITEM_PATTERN.finditer(segment):
+            if match.start() != pos or not match.group("amount"):
+                return None
+            pos = match.end()
+            if NON_AMOUNT_SUFFIX.match(segment[pos:]):
+                return None
+
+            item = self._build_item(match.group("desc"), float(match.group("amount")), date)
+            if item is None:
+                return None
+            items.append(item)
+
+        # 金额之后仍有未解析的文字（如"55买菜"、数量单位），覆盖不完整
+        if segment[pos:].strip():
+            return None
+        return items
+
+    def _build_item(self, desc: str, amount: float, date: str) -> Optional[Dict[str, Any]]:
+        remark = desc.strip()
+        for filler in FILLER_WORDS:
+            remark = remark.replace(filler, "")
+        remark = remark.strip()
+        if not remark or amount <= 0:
+            return None
+
+        category, keyword = self._match_category(remark)
+        if category is None:
+            return None
+
+        main, sub = category
+        return {
+            "date": date,
+            "amount": amount,
+            "main_category": main,
+            "sub_category": sub,
+            "payee": None,
+            "remark": remark,
+            "consumer": None,
+            "is_essential": 1 if sub in ESSENTIAL_SUBS else 0,
+            "linked_asset": None,
+            "confidence": self._confidence(remark, keyword)
+        }
+
+    def _match_category(self, remark: str) -> Tuple[Optional[Tuple[str, str]], str]:
+        """一次扫描找出所有命中的关键词，取最长者；最长关键词对应多个分类（如"话费"）视为歧义"""
+        best_kw = ""
+        candidates = set()
+        for _, kw, entry in self.automaton.iter(remark):
+            category = (entry.main, entry.sub)
+            if len(kw) > len(best_kw):
+                best_kw, candidates = kw, {category}
+            elif len(kw) == len(best_kw):
+                candidates.add(category)
+        if not best_kw or len(candidates) != 1:
+            return None, ""
+        return next(iter(candidates)), best_kw
+
+    @staticmethod
+    def _confidence(remark: str, keyword: str) -> float:
+        """关键词覆盖描述的比例越高越可信；描述中的其它信息（人、商户）留给 LLM"""
+        coverage = len(keyword) / len(remark)
+        return round(0.6 + 0.35 * coverage, 2)
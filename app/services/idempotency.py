@@ -0,0 +1,115 @@
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi import HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, select, update
+
+from app.config import settings
+from app.models.database import AsyncSessionLocal, dialect_insert
+from app.models.tables import IdempotencyRecord
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+def request_fingerprint(scope: str, body: Any) -> str:
+    raw = json.dumps(jsonable_encoder(body), ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(f"{scope}|{raw}".encode("utf-8")).hexdigest()
+
+class IdempotencyStore:
+    """
+    Idempotency-Key 处理：首个请求占位 (in_progress)，完成后保存响应
+    同一用户以相同 Key 重试时直接重放保存的响应，不会再次调用 LLM 或重复入账
+    记录使用独立会话读写，不受接口自身事务提交/回滚的影响
+    """
+
+    async def begin(self, user_id: str, key: str, request_hash: str) -> Optional[JSONResponse]:
+        """占用 Key；已有完成的记录时返回可重放的响应，否则返回 None 由调用方继续处理"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                dialect_insert(db, IdempotencyRecord)
+                .values(user_id=user_id, key=key, request_hash=request_hash, status="in_progress", created_at=datetime.utcnow())
+                .on_conflict_do_nothing(index_elements=["user_id", "key"])
+                .returning(IdempotencyRecord.id)
+            )
+            claimed = result.scalar_one_or_none() is not None
+            await db.commit()
+            if claimed:
+                return None
+
+            record = (await db.execute(
+                select(IdempotencyRecord).where(IdempotencyRecord.user_id == user_id, IdempotencyRecord.key == key)
+            )).scalar_one()
+            if record.request_hash != request_hash:
+                raise HTTPException(status_code=422, detail=f"{IDEMPOTENCY_HEADER} 已用于另一个请求")
+            if record.status == "completed":
+                headers = {"Idempotent-Replayed": "true"}
+                if record.location:
+                    headers["Location"] = record.location
+                return JSONResponse(json.loads(record.response_json), status_code=record.status_code, headers=headers)
+
+            # 处理中：超过锁定时长视为上次请求已中断（如进程重启），由本次请求接管
+            stale_before = datetime.utcnow() - timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS)
+            result = await db.execute(
+                update(IdempotencyRecord)
+                .where(IdempotencyRecord.id == record.id, IdempotencyRecord.status == "in_progress", IdempotencyRecord.created_at < stale_before)
+                .values(created_at=datetime.utcnow())
+            )
+            await db.commit()
+            if result.rowcount == 0:
+                raise HTTPException(status_code=409, detail="相同 Idempotency-Key 的请求正在处理中，请稍后重试")
+            return None
+
+    async def complete(self, user_id: str, key: str, status_code: int, body: Any, location: Optional[str] = None):
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(IdempotencyRecord)
+                .where(IdempotencyRecord.user_id == user_id, IdempotencyRecord.key == key)
+                .values(
+                    status="completed",
+                    status_code=status_code,
+                    response_json=json.dumps(jsonable_encoder(body), ensure_ascii=False),
+                    location=location,
+                    completed_at=datetime.utcnow()
+                )
+            )
+            await db.commit()
+
+    async def release(self, user_id: str, key: str):
+        """请求失败时释放 Key，允许客户端用同一个 Key 重试"""
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                delete(IdempotencyRecord).where(
+                    IdempotencyRecord.user_id == user_id,
+                    IdempotencyRecord.key == key,
+                    IdempotencyRecord.status == "in_progress"
+                )
+            )
+            await db.commit()
+
+idempotency_store = IdempotencyStore()
+
+async def idempotent(request: Request, response: Response, user_id: str, scope: str, body: Any, handler: Callable[[], Awaitable[Any]]) -> Any:
+    """带 Idempotency-Key 请求头时按 Key 去重执行 handler，否则直接执行"""
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if not key:
+        return await handler()
+    if len(key) > 255:
+        raise HTTPException(status_code=400, detail=f"{IDEMPOTENCY_HEADER} 过长")
+
+    replay = await idempotency_store.begin(user_id, key, request_fingerprint(scope, body))
+    if replay is not None:
+        return replay
+    stored = False
+    try:
+        result = await handler()
+        await idempotency_store.complete(user_id, key, response.status_code or 200, result, response.headers.get("Location"))
+        stored = True
+    finally:
+        # 出错、客户端断开（CancelledError）等未保存响应的情况都释放 Key；shield 保证再次取消时释放仍会完成
+        if not stored:
+            await asyncio.shield(idempotency_store.release(user_id, key))
+    return result
@@ -0,0 +1,98 @@
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import select, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.tables import ImageFingerprint
+from app.utils.image import PreparedImage, hamming_distance
+
+def _bands(dhash: int) -> List[int]:
+    return [(dhash >> shift) & 0xFFFF for shift in (48, 32, 16, 0)]
+
+def _since() -> datetime:
+    return datetime.utcnow() - timedelta(days=settings.IMAGE_DEDUPE_MAX_AGE_DAYS)
+
+def mark_similar(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """标记疑似重复截图解析出的条目，由用户在暂存区自行判断"""
+    for item in items:
+        item["similar_image"] = True
+    return items
+
+class ImageDeduper:
+    """
+    截图去重：与 generate_hash_id 的账目去重思路一致，但发生在调用视觉模型之前
+    同一用户近期上传过像素完全相同的截图时直接复用上次的解析结果；
+    感知哈希相近的截图可能只是金额、日期不同的另一笔账，仍需解析，只作疑似重复提示
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def find(self, user_id: str, image: PreparedImage) -> Optional[List[Dict[str, Any]]]:
+        """按像素摘要精确查找近期解析过的同一张截图"""
+        if not settings.IMAGE_DEDUPE_ENABLED:
+            return None
+
+        fp = await self.db.scalar(
+            select(ImageFingerprint)
+            .where(
+                ImageFingerprint.user_id == user_id,
+                ImageFingerprint.content_hash == image.content_hash,
+                ImageFingerprint.created_at >= _since()
+            )
+            .order_by(ImageFingerprint.created_at.desc())
+            .limit(1)
+        )
+        if fp is None:
+            return None
+
+        items = json.loads(fp.items_json)
+        for item in items:
+            item["reused_from_image"] = True
+        return items
+
+    async def similar(self, user_id: str, image: PreparedImage) -> bool:
+        """按 64 位哈希分段走索引召回候选，再用 256 位哈希的汉明距离判断是否相近"""
+        if not settings.IMAGE_DEDUPE_ENABLED:
+            return False
+
+        b0, b1, b2, b3 = _bands(image.dhash)
+        result = await self.db.execute(
+            select(ImageFingerprint.dhash_fine)
+            .where(
+                ImageFingerprint.user_id == user_id,
+                or_(
+                    ImageFingerprint.band0 == b0,
+                    ImageFingerprint.band1 == b1,
+                    ImageFingerprint.band2 == b2,
+                    ImageFingerprint.band3 == b3
+                ),
+                ImageFingerprint.created_at >= _since()
+            )
+            .order_by(ImageFingerprint.created_at.desc())
+            .limit(50)
+        )
+        return any(
+            hamming_distance(image.dhash_fine, int(dhash_fine, 16)) <= settings.IMAGE_DEDUPE_MAX_DISTANCE
+            for dhash_fine in result.scalars()
+        )
+
+    def remember(self, user_id: str, image: PreparedImage, items: List[Dict[str, Any]]):
+        """记录解析成功的截图，随调用方事务一起提交"""
+        if not settings.IMAGE_DEDUPE_ENABLED or not items:
+            return
+        b0, b1, b2, b3 = _bands(image.dhash)
+        self.db.add(ImageFingerprint(
+            user_id=user_id,
+            content_hash=image.content_hash,
+            dhash=f"{image.dhash:016x}",
+            dhash_fine=f"{image.dhash_fine:064x}",
+            band0=b0,
+            band1=b1,
+            band2=b2,
+            band3=b3,
+            items_json=json.dumps(items, ensure_ascii=False)
+        ))
@@ -0,0 +1,274 @@
+import re
+import unicodedata
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+# 相对日期词 -> 距今天数
+RELATIVE_DAYS = {"今天": 0, "今日": 0, "昨天": 1, "昨日": 1, "前天": 2, "大前天": 3}
+
+CN_DIGITS = {"零": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+
+# 子句分隔：标点与"然后"
+CLAUSE_SPLIT = re.compile(r"[，,；;。！!\n]+|然后")
+
+# 编号：3 / 第3条 / 3号；范围：1-3 / 1到3 / 第1至3条
+_ITEM = r"第?\d+(?:条|项|笔|个|号)?"
+_RANGE = rf"{_ITEM}(?:-|~|～|到|至){_ITEM}"
+TARGETS = rf"(?:{_RANGE}|{_ITEM})(?:(?:和|与|跟|及|、|/)?(?:{_RANGE}|{_ITEM}))*"
+TARGET_TOKEN = re.compile(r"(\d+)(?:条|项|笔|个|号)?(?:(?:-|~|～|到|至)第?(\d+))?")
+
+ALL = r"(?:全部|全都|都|所有|一起|统统|剩下|其余|其他)"
+CONFIRM = r"(?:确认|入库|保存|记账|记上|没问题|可以|正确|对的|ok|OK|好的)了?"
+DELETE = r"(?:删除|删掉|删去|删|去掉|去除|移除|不要|作废)了?"
+CANCEL = r"(?:取消|清空|作废)了?"
+ASSIGN = r"(?:改为|改成|换成|变成|设为|设置为|设成|改|为|是|=|:)"
+
+# 字段别名 -> 修改项
+FIELD_ALIASES = [
+    ("金额", "amount"), ("价格", "amount"), ("钱", "amount"),
+    ("主分类", "main_category"), ("一级分类", "main_category"), ("大类", "main_category"),
+    ("子分类", "sub_category"), ("二级分类", "sub_category"), ("小类", "sub_category"),
+    ("分类", "category"), ("类别", "category"), ("类型", "category"),
+    ("消费人", "consumer"), ("参与人", "consumer"), ("成员", "consumer"), ("付款人", "consumer"),
+    ("日期", "date"), ("时间", "date"),
+    ("备注", "remark"), ("商户", "payee"), ("商家", "payee"),
+]
+FIELD = "|".join(sorted((re.escape(alias) for alias, _ in FIELD_ALIASES), key=len, reverse=True))
+FIELD_MAP = dict(FIELD_ALIASES)
+
+EMPTY_VALUES = {"无", "空", "没有", "null", "None", "清空"}
+
+LEADING_FILLER = re.compile(r"^(?:请|帮我|麻烦|把|将)+")
+TRAILING_FILLER = re.compile(r"(?:吧|一下|啊|呀|哦|即可|就行|就好|~)+$")
+
+AMOUNT_VALUE = re.compile(r"^[¥￥]?(\d+(?:\.\d{1,2})?)(?:元|块钱|块|rmb|RMB)?$")
+
+PATTERNS = {
+    "confirm_all": re.compile(rf"^{ALL}?的?{CONFIRM}{ALL}?$"),
+    "cancel_all": re.compile(rf"^(?:{ALL}的?{DELETE}|{DELETE}{ALL}|{ALL}?{CANCEL}{ALL}?)$"),
+    "except": re.compile(rf"^除了?(?P<targets>{TARGETS})(?:以外|之外|外)?{ALL}?的?{ALL}?(?P<verb>{CONFIRM}|{DELETE})$"),
+    "targets_verb": re.compile(rf"^(?P<targets>{TARGETS}){ALL}?(?P<verb>{CONFIRM}|{DELETE})$"),
+    "verb_targets": re.compile(rf"^(?P<verb>{CONFIRM}|{DELETE})(?P<targets>{TARGETS})$"),
+    "assign": re.compile(rf"^(?P<targets>{TARGETS})?的?(?P<field>{FIELD}){ASSIGN}(?P<value>.+)$"),
+    "shorthand": re.compile(rf"^(?P<targets>{TARGETS})(?:改为|改成|换成|变成|改)(?P<value>.+)$"),
+    "targets": re.compile(rf"^(?P<targets>{TARGETS})$"),
+}
+
+class InstructionGrammar:
+    """
+    暂存区纠错指令的本地确定性解析（LLM 前置快速通道）
+    覆盖 "全部确认" "删除3" "1和2确认，3删掉" "1金额改为80" "2分类改成交通" 等常用说法，
+    输出与 LLM 相同的 actions 结构；任一子句无法识别时返回 None，由 LLM 兜底
+    """
+
+    def __init__(self, batch_context: Dict[str, Any], today: Optional[datetime] = None):
+        items = batch_context.get("items", [])
+        self.all_ids = [i["temp_id"] for i in items]
+        self.pending_ids = [i["temp_id"] for i in items if i.get("status") == "pending"]
+        self.categories = batch_context.get("categories", [])
+        self.mains = {c["main"] for c in self.categories}
+        self.today = today or datetime.now()
+
+    def parse(self, instruction: str) -> Optional[List[Dict[str, Any]]]:
+        text = self._normalize(instruction)
+        if not text:
+            return None
+
+        actions: List[Dict[str, Any]] = []
+        carried: List[int] = []
+        for clause in CLAUSE_SPLIT.split(text):
+            clause = TRAILING_FILLER.sub("", LEADING_FILLER.sub("", clause))
+            if not clause:
+                continue
+
+            # 只有编号的子句（"1，2确认" 中的 "1"）并入下一个子句
+            match = PATTERNS["targets"].match(clause)
+            if match:
+                targets = self._targets(match.group("targets"))
+                if targets is None:
+                    return None
+                carried.extend(targets)
+                continue
+
+            action = self._parse_clause(clause, carried)
+            if action is None:
+                return None
+            actions.append(action)
+            carried = []
+
+        if carried or not actions:
+            return None
+        return self._resolve_rest(actions)
+
+    def _normalize(self, text: str) -> str:
+        text = unicodedata.normalize("NFKC", text).strip()
+        # 中文序号："第三条" "两条" -> 数字
+        text = re.sub(r"(?<=第)([一二两三四五六七八九十]+)|([一二两三四五六七八九十]+)(?=条|项|笔)", self._cn_number, text)
+        # 数字之间的空白视为编号分隔，其余空白去掉
+        text = re.sub(r"(?<=\d)\s+(?=\d)", "、", text)
+        return re.sub(r"\s+", "", text)
+
+    @staticmethod
+    def _cn_number(match: re.Match) -> str:
+        word = match.group(0)
+        if "十" in word:
+            tens, _, ones = word.partition("十")
+            return str((CN_DIGITS.get(tens, 1) if tens else 1) * 10 + (CN_DIGITS.get(ones, 0) if ones else 0))
+        return "".join(str(CN_DIGITS[ch]) for ch in word)
+
+    def _parse_clause(self, clause: str, carried: List[int]) -> Optional[Dict[str, Any]]:
+        # "全部/其他/剩下" 的目标要等所有子句解析完，由 _resolve_rest 按其余子句点名的编号确定
+        if PATTERNS["confirm_all"].match(clause) and not carried:
+            return {"type": "confirm", "rest": True}
+        if PATTERNS["cancel_all"].match(clause) and not carried:
+            return {"type": "cancel_all", "rest": True}
+
+        match = PATTERNS["except"].match(clause)
+        if match:
+            excluded = self._targets(match.group("targets"))
+            if excluded is None:
+                return None
+            targets = [tid for tid in self.pending_ids if tid not in set(excluded) | set(carried)]
+            return {"type": self._verb_type(match.group("verb")), "targets": targets}
+
+        for name in ("targets_verb", "verb_targets"):
+            match = PATTERNS[name].match(clause)
+            if match:
+                targets = self._targets(match.group("targets"))
+                if targets is None:
+                    return None
+                return {"type": self._verb_type(match.group("verb")), "targets": carried + targets}
+
+        # 无编号的"删除"：仅在只剩一条待确认时可确定目标
+        if re.fullmatch(DELETE, clause):
+            targets = carried or self._single_pending()
+            return {"type": "delete", "targets": targets} if targets else None
+
+        match = PATTERNS["assign"].match(clause)
+        if match:
+            return self._assign(match.group("targets"), match.group("field"), match.group("value"), carried)
+
+        match = PATTERNS["shorthand"].match(clause)
+        if match:
+            # "1改成80" 视为改金额，"2改成交通" 视为改分类
+            value = match.group("value")
+            field = "金额" if AMOUNT_VALUE.match(value) else "分类"
+            return self._assign(match.group("targets"), field, value, carried)
+        return None
+
+    def _resolve_rest(self, actions: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """
+        "全部/其他/剩下" 指待确认条目中其余子句没有点名确认或删除的部分：
+        "1确认，其他删除" 只删除 1 以外的条目；同一条目被要求既确认又删除时返回 None 交给 LLM
+        """
+        verbs: Dict[int, str] = {}
+        for action in actions:
+            if action.get("rest") or action["type"] not in ("confirm", "delete"):
+                continue
+            for tid in action["targets"]:
+                if verbs.setdefault(tid, action["type"]) != action["type"]:
+                    return None
+        if len({action["type"] for action in actions if action.get("rest")}) > 1:
+            return None
+
+        rest = [tid for tid in self.pending_ids if tid not in verbs]
+        resolved = []
+        for action in actions:
+            if not action.get("rest"):
+                resolved.append(action)
+            elif action["type"] == "confirm":
+                resolved.append({"type": "confirm", "targets": rest})
+            elif verbs:
+                resolved.append({"type": "delete", "targets": rest})
+            else:
+                resolved.append({"type": "cancel_all"})
+        return resolved
+
+    def _assign(self, targets_text: Optional[str], field: str, value: str, carried: List[int]) -> Optional[Dict[str, Any]]:
+        if targets_text:
+            targets = self._targets(targets_text)
+            if targets is None:
+                return None
+            targets = carried + targets
+        else:
+            targets = carried or self._single_pending()
+        if not targets:
+            return None
+
+        modifications = self._modifications(FIELD_MAP[field], value)
+        if modifications is None:
+            return None
+        return {"type": "modify", "targets": targets, "modifications": modifications}
+
+    def _modifications(self, field: str, value: str) -> Optional[Dict[str, Any]]:
+        if field == "amount":
+            match = AMOUNT_VALUE.match(value)
+            return {"amount": float(match.group(1))} if match else None
+        if field == "date":
+            date = self._parse_date(value)
+            return {"date": date} if date else None
+        if field in ("main_category", "sub_category", "category"):
+            return self._resolve_category(field, value)
+        # 自由文本字段
+        return {field: None if value in EMPTY_VALUES else value}
+
+    def _resolve_category(self, field: str, value: str) -> Optional[Dict[str, Any]]:
+        """分类必须能在用户分类表中唯一确定，否则交给 LLM"""
+        parts = re.split(r"[/\-—>·]", value)
+        if len(parts) == 2 and field == "category":
+            main, sub = parts[0].strip(), parts[1].strip()
+            if any(c["main"] == main and c["sub"] == sub for c in self.categories):
+                return {"main_category": main, "sub_category": sub}
+            return None
+
+        if field in ("main_category", "category") and value in self.mains:
+            # 更换一级分类后原二级分类不再适用
+            return {"main_category": value, "sub_category": None}
+        if field in ("sub_category", "category"):
+            mains = {c["main"] for c in self.categories if c["sub"] == value}
+            if len(mains) == 1:
+                return {"main_category": mains.pop(), "sub_category": value}
+        return None
+
+    def _parse_date(self, value: str) -> Optional[str]:
+        if value in RELATIVE_DAYS:
+            return (self.today - timedelta(days=RELATIVE_DAYS[value])).strftime("%Y-%m-%d")
+
+        year, month, day = self.today.year, self.today.month, None
+        match = re.fullmatch(r"(\d{4})[-/.年](\d{1,2})[-/.月](\d{1,2})[日号]?", value)
+        if match:
+            year, month, day = (int(g) for g in match.groups())
+        else:
+            match = re.fullmatch(r"(\d{1,2})[-/.月](\d{1,2})[日号]?", value)
+            if match:
+                month, day = (int(g) for g in match.groups())
+            else:
+                match = re.fullmatch(r"(\d{1,2})[日号]", value)
+                if match:
+                    day = int(match.group(1))
+        if day is None:
+            return None
+        try:
+            return datetime(year, month, day).strftime("%Y-%m-%d")
+        except ValueError:
+            return None
+
+    def _targets(self, text: str) -> Optional[List[int]]:
+        """解析编号列表/范围，任一编号不在本批次中则返回 None"""
+        targets: List[int] = []
+        for start, end in TARGET_TOKEN.findall(text):
+            first = int(start)
+            last = int(end) if end else first
+            if last < first or last - first > 100:
+                return None
+            targets.extend(range(first, last + 1))
+        if not targets or any(tid not in self.all_ids for tid in targets):
+            return None
+        return list(dict.fromkeys(targets))
+
+    def _single_pending(self) -> List[int]:
+        return list(self.pending_ids) if len(self.pending_ids) == 1 else []
+
+    @staticmethod
+    def _verb_type(verb: str) -> str:
+        return "delete" if re.fullmatch(DELETE, verb) else "confirm"
@@ -1,43 +1,33 @@
 import json
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from app.services.llm_parser import LLMParser
+from app.services.instruction_grammar import InstructionGrammar
+from app.services.context_encoder import encode_items_table, encode_items_json, encode_categories, encode_names
+from app.services.prompt_cache import UserContext
 from app.config import settings
 from app.utils.audit_logger import log_llm_conversation
+from app.utils.llm_metrics import LLMCallMetrics, llm_metrics
 
-class InstructionParser:
-    def __init__(self, llm_parser: LLMParser):
-        self.llm = llm_parser
-
-    async def parse_instruction(self, user_input: str, batch_context: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """
-        使用 LLM 解析用户对暂存条目的操作意图
-        """
-        if self.llm.is_mock:
-            if "全部确认" in user_input:
-                tids = [i["temp_id"] for i in batch_context["items"] if i["status"] == "pending"]
-                return [{"type": "confirm", "targets": tids}]
-            if "1和2确认" in user_input:
-                return [
-                    {"type": "confirm", "targets": [1, 2]},
-                    {"type": "modify", "targets": [3], "modifications": {"amount": 120.0, "main_category": "交通", "sub_category": "充值"}}
-                ]
-            return []
-        system_prompt = f"""
+INSTRUCTION_PROMPT_HEAD = """
 你是一个记账指令解析助手。用户正在查看一个包含多个待确认账单条目的批次。
 你的任务是解析用户的自然语言指令，并将其转换为结构化的操作序列。
 
-## 当前批次内容 (batch_id: {batch_context['batch_id']}):
-{json.dumps(batch_context['items'], ensure_ascii=False, indent=2)}
+## 当前批次内容 (batch_id: {batch_id}):
+{items_json}
+"""
 
+INSTRUCTION_PROMPT_CONFIG = """
 ## 用户的分类列表:
-{json.dumps(batch_context['categories'], ensure_ascii=False)}
+{categories_json}
 
 ## 用户的家庭成员 (消费人):
-{json.dumps(batch_context.get('user_payees', []), ensure_ascii=False)}
+{payees_json}
 
 ## 用户的资产账户:
-{json.dumps(batch_context.get('user_assets', []), ensure_ascii=False)}
+{assets_json}
+"""
 
+INSTRUCTION_PROMPT_OUTPUT = """
 ## 输出要求
 必须返回一个 JSON 对象，包含 `actions` 列表：
 ```json
@@ -73,23 +63,145 @@ class InstructionParser:
 3. 如果用户提到一个不存在的分类，请在 modifications 中如实记录，由业务逻辑判断是否需要创建。
 4. 如果指令模糊，请尝试给出最可能的解析。
 """
-        try:
-            response = await self.llm.client.post(
-                "/chat/completions",
-                json={
-                    "model": settings.OPENROUTER_MODEL,
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_input}
-                    ],
-                    "response_format": {"type": "json_object"},
-                    "temperature": 0.0
+
+INSTRUCTION_PROMPT_TAIL = INSTRUCTION_PROMPT_CONFIG + INSTRUCTION_PROMPT_OUTPUT
+
+# 紧凑格式：只列待确认条目的可编辑字段，分类按一级分组
+COMPACT_PROMPT_HEAD = """
+你是一个记账指令解析助手。用户正在查看一个包含多个待确认账单条目的批次。
+你的任务是解析用户的自然语言指令，并将其转换为结构化的操作序列。
+
+## 当前批次待确认条目 (batch_id: {batch_id}{status_note}):
+每行一条，列以 | 分隔，"-" 表示空，分类为 "一级分类/二级分类"；修改分类时 main_category 与 sub_category 分别填写名称
+{items_table}
+"""
+
+COMPACT_PROMPT_CONFIG = """
+## 用户的分类列表 (一级分类: 二级分类):
+{categories}
+
+## 用户的家庭成员 (消费人):
+{payees}
+
+## 用户的资产账户:
+{assets}
+"""
+
+STATUS_LABELS = {"confirmed": "已确认", "rejected": "已删除", "duplicate": "重复未入账"}
+
+def _build_prompt_tail(ctx: UserContext) -> str:
+    return INSTRUCTION_PROMPT_TAIL.format(
+        categories_json=ctx.instruction_categories_json,
+        payees_json=ctx.payees_json,
+        assets_json=ctx.assets_json
+    )
+
+def _build_compact_tail(ctx: UserContext) -> str:
+    return COMPACT_PROMPT_CONFIG.format(
+        categories=encode_categories(ctx.categories),
+        payees=encode_names(ctx.payees),
+        assets=encode_names(ctx.assets)
+    ) + INSTRUCTION_PROMPT_OUTPUT.format()
+
+def _status_note(counts: Dict[str, int]) -> str:
+    others = [f"{STATUS_LABELS.get(status, status)} {n} 条" for status, n in counts.items() if status != "pending"]
+    return f"，另有{'、'.join(others)}未列出" if others else ""
+
+class InstructionParser:
+    def __init__(self, llm_parser: LLMParser):
+        self.llm = llm_parser
+
+    def _build_system_prompt(self, batch_context: Dict[str, Any], sections: Optional[Dict[str, int]] = None) -> str:
+        """
+        批次内容每次不同；分类/成员/资产部分按用户缓存（batch_context 带 user_context 时）
+        INSTRUCTION_CONTEXT_FORMAT=compact 时使用紧凑表格，json 为原有完整 JSON 格式
+        传入 sections 时记录各片段字符数，用于调用观测
+        """
+        if settings.INSTRUCTION_CONTEXT_FORMAT == "json":
+            items_text = encode_items_json(batch_context['items'])
+            head = INSTRUCTION_PROMPT_HEAD.format(batch_id=batch_context['batch_id'], items_json=items_text)
+        else:
+            items_text, counts = encode_items_table(batch_context['items'])
+            head = COMPACT_PROMPT_HEAD.format(
+                batch_id=batch_context['batch_id'],
+                status_note=_status_note(counts),
+                items_table=items_text
+            )
+        tail, config_chars = self._build_prompt_tail(batch_context)
+        if sections is not None:
+            sections["items"] = len(items_text)
+            sections.update(config_chars)
+            sections["template"] = max(len(head) + len(tail) - sum(sections.values()), 0)
+        return head + tail
+
+    def _build_prompt_tail(self, batch_context: Dict[str, Any]) -> Tuple[str, Dict[str, int]]:
+        """分类/成员/资产与输出要求部分，返回 (文本, 各片段字符数)"""
+        compact = settings.INSTRUCTION_CONTEXT_FORMAT != "json"
+        ctx = batch_context.get("user_context")
+        if ctx is not None:
+            if compact:
+                tail = ctx.memoize("instruction_prompt_tail_compact", _build_compact_tail)
+                categories = ctx.memoize("instruction_categories_compact", lambda c: encode_categories(c.categories))
+                return tail, {
+                    "categories": len(categories),
+                    "payees": len(encode_names(ctx.payees)),
+                    "assets": len(encode_names(ctx.assets))
                 }
+            tail = ctx.memoize("instruction_prompt_tail", _build_prompt_tail)
+            return tail, {
+                "categories": len(ctx.instruction_categories_json),
+                "payees": len(ctx.payees_json),
+                "assets": len(ctx.assets_json)
+            }
+
+        if compact:
+            categories = encode_categories(batch_context['categories'])
+            payees = encode_names(batch_context.get('user_payees', []))
+            assets = encode_names(batch_context.get('user_assets', []))
+            tail = COMPACT_PROMPT_CONFIG.format(
+                categories=categories, payees=payees, assets=assets
+            ) + INSTRUCTION_PROMPT_OUTPUT.format()
+        else:
+            categories = json.dumps(batch_context['categories'], ensure_ascii=False)
+            payees = json.dumps(batch_context.get('user_payees', []), ensure_ascii=False)
+            assets = json.dumps(batch_context.get('user_assets', []), ensure_ascii=False)
+            tail = INSTRUCTION_PROMPT_TAIL.format(
+                categories_json=categories, payees_json=payees, assets_json=assets
+            )
+        return tail, {"categories": len(categories), "payees": len(payees), "assets": len(assets)}
+
+    async def parse_instruction(self, user_input: str, batch_context: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        解析用户对暂存条目的操作意图：常用说法走本地语法，其余交给 LLM
+        """
+        if settings.INSTRUCTION_GRAMMAR_ENABLED:
+            actions = InstructionGrammar(batch_context).parse(user_input)
+            if actions is not None:
+                llm_metrics.record_skip("instruction_parse", batch_context.get("user_id", "unknown"), "fast_path")
+                return actions
+
+        if self.llm.is_mock:
+            if "全部确认" in user_input:
+                tids = [i["temp_id"] for i in batch_context["items"] if i["status"] == "pending"]
+                return [{"type": "confirm", "targets": tids}]
+            if "1和2确认" in user_input:
+                return [
+                    {"type": "confirm", "targets": [1, 2]},
+                    {"type": "modify", "targets": [3], "modifications": {"amount": 120.0, "main_category": "交通", "sub_category": "充值"}}
+                ]
+            return []
+        metrics = LLMCallMetrics("instruction_parse", batch_context.get("user_id", "unknown"))
+        system_prompt = self._build_system_prompt(batch_context, metrics.prompt_sections)
+        metrics.prompt_sections["user_input"] = len(user_input)
+        try:
+            parsed = await self.llm.chat_json(
+                [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_input}
+                ],
+                temperature=0.0,
+                metrics=metrics
             )
-            response.raise_for_status()
-            result = response.json()
-            content_str = result.get("choices", [{}])[0].get("message", {}).get("content", "{{}}")
-            parsed = json.loads(content_str)
             
             # 记录审计日志
             await log_llm_conversation(
@@ -98,7 +210,8 @@ class InstructionParser:
                 batch_id=batch_context.get("batch_id"),
                 system_prompt=system_prompt,
                 user_input=user_input,
-                response=parsed
+                response=parsed,
+                metrics=metrics.to_dict()
             )
             
             return parsed.get("actions", [])
@@ -0,0 +1,221 @@
+import asyncio
+import json
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models.database import AsyncSessionLocal
+from app.models.tables import ParseJob
+from app.services.llm_parser import get_llm_parser
+from app.services.record_pipeline import record_inputs
+
+logger = logging.getLogger(__name__)
+
+FINAL_STATUSES = {"succeeded", "failed"}
+
+def job_view(job: ParseJob) -> Dict[str, Any]:
+    """任务对外展示的字段"""
+    view = {
+        "job_id": job.id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+    if job.result_json:
+        result = json.loads(job.result_json)
+        view["result"] = result["data"]
+        view["message"] = result.get("message")
+    if job.error:
+        view["error"] = job.error
+    return view
+
+class ParseJobQueue:
+    """
+    异步解析任务队列
+    任务先写入 parse_jobs 表再进入内存队列，由固定数量的工作协程执行（解析 -> 截图去重 -> 审计 -> 写入暂存区）
+    多个 worker 进程共用任务表：按 status='queued' 条件更新认领，只有一个进程能执行；执行中定期续约租约，
+    租约过期的任务（执行它的进程已退出）由任一进程重新入队；多次执行都被中断的任务判为失败，避免反复拖垮进程
+    """
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._queued_ids: Set[str] = set()
+        self._workers: List[asyncio.Task] = []
+        # job_id -> 订阅该任务进度的 SSE 连接（只用于及时唤醒，状态以任务表为准）
+        self._listeners: Dict[str, Set[asyncio.Queue]] = {}
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        await self._resume()
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"parse-job-{i}")
+            for i in range(settings.PARSE_JOB_WORKERS)
+        ]
+        self._workers.append(asyncio.create_task(self._reaper(), name="parse-job-reaper"))
+
+    async def stop(self):
+        # 执行中的任务保持 running 状态，租约过期后由其它进程或下次启动时恢复
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _resume(self):
+        """把租约过期的 running 任务放回 queued，并把尚未入队的 queued 任务放入本进程队列"""
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(ParseJob)
+                .where(
+                    ParseJob.status == "running",
+                    or_(ParseJob.lease_until.is_(None), ParseJob.lease_until < datetime.utcnow())
+                )
+                .values(status="queued", lease_until=None)
+            )
+            await db.commit()
+            result = await db.execute(
+                select(ParseJob.id).where(ParseJob.status == "queued").order_by(ParseJob.created_at)
+            )
+            job_ids = [job_id for job_id in result.scalars().all() if job_id not in self._queued_ids]
+        for job_id in job_ids:
+            self._enqueue(job_id)
+        if job_ids:
+            logger.info(f"恢复 {len(job_ids)} 个未完成的解析任务")
+
+    async def _reaper(self):
+        while True:
+            await asyncio.sleep(settings.PARSE_JOB_LEASE_SECONDS)
+            try:
+                await self._resume()
+            except Exception as e:
+                logger.warning(f"恢复解析任务失败: {e}")
+
+    def _enqueue(self, job_id: str):
+        self._queued_ids.add(job_id)
+        self._queue.put_nowait(job_id)
+
+    async def submit(self, db: AsyncSession, user_id: str, input_type: str, payload: str) -> ParseJob:
+        """持久化任务后入队，立即返回"""
+        job = ParseJob(
+            id=str(uuid.uuid4()),
+            user_id=user_id,
+            status="queued",
+            input_type=input_type,
+            payload=payload,
+            attempts=0
+        )
+        db.add(job)
+        await db.commit()
+        # 队列未启动（如脚本环境）时任务已落库，下次启动时执行
+        if self._queue is not None:
+            self._enqueue(job.id)
+        return job
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            self._queued_ids.discard(job_id)
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                logger.exception(f"解析任务 {job_id} 执行异常: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _claim(self, db: AsyncSession, job_id: str) -> bool:
+        """原子认领：只有把 queued 改为 running 的那个进程/协程执行该任务"""
+        result = await db.execute(
+            update(ParseJob)
+            .where(ParseJob.id == job_id, ParseJob.status == "queued")
+            .values(
+                status="running",
+                attempts=ParseJob.attempts + 1,
+                lease_until=datetime.utcnow() + timedelta(seconds=settings.PARSE_JOB_LEASE_SECONDS)
+            )
+        )
+        await db.commit()
+        return result.rowcount == 1
+
+    async def _heartbeat(self, job_id: str):
+        """执行期间定期续约，使其它进程不会把仍在执行的任务当作中断任务"""
+        while True:
+            await asyncio.sleep(settings.PARSE_JOB_LEASE_SECONDS / 3)
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(
+                        update(ParseJob)
+                        .where(ParseJob.id == job_id, ParseJob.status == "running")
+                        .values(lease_until=datetime.utcnow() + timedelta(seconds=settings.PARSE_JOB_LEASE_SECONDS))
+                    )
+                    await db.commit()
+            except Exception as e:
+                logger.warning(f"解析任务 {job_id} 续约失败: {e}")
+
+    async def _run(self, job_id: str):
+        async with AsyncSessionLocal() as db:
+            job = await db.get(ParseJob, job_id)
+            if job is None or job.status != "queued":
+                return
+            if job.attempts >= settings.PARSE_JOB_MAX_ATTEMPTS:
+                await self._finish(db, job_id, "failed", error="任务多次执行被中断，已放弃")
+                return
+
+            if not await self._claim(db, job_id):
+                return
+            self._publish(job_id)
+
+            heartbeat = asyncio.create_task(self._heartbeat(job_id))
+            try:
+                result = await record_inputs(db, job.user_id, get_llm_parser(), [(job.input_type, job.payload)])
+            except Exception as e:
+                await db.rollback()
+                await self._finish(db, job_id, "failed", error=str(e))
+                return
+            finally:
+                heartbeat.cancel()
+
+            if "batch_id" not in result.data and result.data.get("errors"):
+                await self._finish(db, job_id, "failed", error=result.data["errors"][0]["message"])
+                return
+            await self._finish(db, job_id, "succeeded", result={"data": result.data, "message": result.message})
+
+    async def _finish(self, db: AsyncSession, job_id: str, status: str, result: Optional[Dict] = None, error: Optional[str] = None):
+        # 完成后清空原始输入（图片 base64 体积大），结果已单独保存
+        await db.execute(
+            update(ParseJob)
+            .where(ParseJob.id == job_id)
+            .values(
+                status=status,
+                payload="",
+                result_json=json.dumps(result, ensure_ascii=False) if result is not None else None,
+                error=error,
+                lease_until=None,
+                finished_at=datetime.utcnow()
+            )
+        )
+        await db.commit()
+        self._publish(job_id)
+
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        listener: asyncio.Queue = asyncio.Queue()
+        self._listeners.setdefault(job_id, set()).add(listener)
+        return listener
+
+    def unsubscribe(self, job_id: str, listener: asyncio.Queue):
+        listeners = self._listeners.get(job_id)
+        if listeners is not None:
+            listeners.discard(listener)
+            if not listeners:
+                self._listeners.pop(job_id, None)
+
+    def _publish(self, job_id: str):
+        """通知本进程内的订阅者任务状态已变化，订阅者据此立即重新读取任务"""
+        for listener in self._listeners.get(job_id, ()):
+            listener.put_nowait(None)
+
+parse_job_queue = ParseJobQueue()
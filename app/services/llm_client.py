@@ -0,0 +1,107 @@
+import logging
+from typing import Dict, Optional
+
+import httpx
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+def _http2_available() -> bool:
+    """HTTP/2 依赖 h2 包 (httpx[http2])，未安装时退回 HTTP/1.1"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def api_key_for(base_url: str) -> Optional[str]:
+    """
+    按 host 选择秘钥：OPENROUTER_API_KEY 只发给 OPENROUTER_BASE_URL 所在的 host，
+    其它 host 使用 LLM_ENDPOINT_API_KEYS 中配置的秘钥，未配置则不带秘钥
+    """
+    host = httpx.URL(base_url).host
+    if host == httpx.URL(settings.OPENROUTER_BASE_URL).host:
+        return settings.OPENROUTER_API_KEY
+    for entry in settings.LLM_ENDPOINT_API_KEYS.split(","):
+        key_host, _, key = entry.strip().partition("=")
+        if key_host.strip() == host and key.strip():
+            return key.strip()
+    return None
+
+class LLMClientManager:
+    """
+    进程级 LLM HTTP 客户端管理器
+    生命周期由 app.main 的 lifespan 负责：启动时建立连接池并预热，关闭时释放连接
+    """
+
+    def __init__(self):
+        # base_url -> 连接池；主模型与备用供应商各自一个
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def _build_client(self, base_url: str) -> httpx.AsyncClient:
+        http2 = settings.LLM_HTTP2 and _http2_available()
+        if settings.LLM_HTTP2 and not http2:
+            logger.info("未安装 h2，LLM 客户端使用 HTTP/1.1 keep-alive")
+
+        headers = {
+            "HTTP-Referer": "https://family-accounting.app",
+            "X-Title": settings.APP_NAME
+        }
+        api_key = api_key_for(base_url)
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
+        else:
+            logger.warning(f"未配置 {httpx.URL(base_url).host} 的秘钥（LLM_ENDPOINT_API_KEYS），请求不带 Authorization")
+
+        return httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=settings.LLM_TIMEOUT_SECONDS,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=settings.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY
+            )
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """主供应商 (OPENROUTER_BASE_URL) 的连接池"""
+        return self.client_for(settings.OPENROUTER_BASE_URL)
+
+    def client_for(self, base_url: str) -> httpx.AsyncClient:
+        # 脚本等未经过 lifespan 的场景下按需创建
+        client = self._clients.get(base_url)
+        if client is None or client.is_closed:
+            client = self._build_client(base_url)
+            self._clients[base_url] = client
+        return client
+
+    async def start(self):
+        """创建连接池，并按配置预热连接"""
+        client = self.client
+        if settings.LLM_WARMUP and not is_mock_mode():
+            await self.warmup(client)
+
+    async def warmup(self, client: httpx.AsyncClient):
+        """提前完成 DNS / TLS 握手，让第一笔记账请求复用已建立的连接"""
+        try:
+            await client.get("/models", timeout=10.0)
+            logger.info("LLM 连接预热完成")
+        except Exception as e:
+            # 预热失败不影响启动，首个请求时再建立连接
+            logger.warning(f"LLM 连接预热失败: {e}")
+
+    async def close(self):
+        for client in self._clients.values():
+            if not client.is_closed:
+                await client.aclose()
+        self._clients.clear()
+
+def is_mock_mode() -> bool:
+    """未配置真实秘钥时走本地模拟解析"""
+    return "xxxxx" in settings.OPENROUTER_API_KEY or not settings.OPENROUTER_API_KEY
+
+llm_client_manager = LLMClientManager()
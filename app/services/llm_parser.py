@@ -2,36 +2,33 @@ import httpx
 import json
 import logging
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, Callable, Awaitable, AsyncIterator
 from app.config import settings
+from app.services.llm_client import is_mock_mode
+from app.services.llm_transport import LLMTransport, llm_transport
+from app.services.fast_parser import FastParser
+from app.services.parse_cache import parse_cache, make_cache_key, fingerprint
+from app.services.prompt_cache import prompt_template, UserContext
 from app.utils.audit_logger import log_llm_conversation
+from app.utils.json_stream import IncrementalItemsParser
+from app.utils.llm_metrics import LLMCallMetrics, llm_metrics
 
 logger = logging.getLogger(__name__)
 
 class LLMParser:
-    def __init__(self):
-        self.client = httpx.AsyncClient(
-            base_url=settings.OPENROUTER_BASE_URL,
-            headers={
-                "Authorization": f"Bearer {settings.OPENROUTER_API_KEY}",
-                "HTTP-Referer": "https://family-accounting.app",
-                "X-Title": settings.APP_NAME
-            },
-            timeout=60.0
-        )
-        self._prompt_template = self._load_prompt_template()
-        self.is_mock = "xxxxx" in settings.OPENROUTER_API_KEY or not settings.OPENROUTER_API_KEY
-
-    def _load_prompt_template(self) -> str:
-        try:
-            with open("prompts/system_prompt.md", "r", encoding="utf-8") as f:
-                return f.read()
-        except FileNotFoundError:
-            # 兜底 Prompt
-            return "你是一个记账助手，请将用户输入解析为 JSON 格式的 items 列表。"
+    def __init__(self, client: Optional[httpx.AsyncClient] = None):
+        # 默认走进程级连接池 + 共享的重试/熔断状态；传入 client 时单独构造调用层
+        self.transport = llm_transport if client is None else LLMTransport(client)
+        self._prompt_template = prompt_template.get()
+        self.is_mock = is_mock_mode()
 
     async def parse(self, content: str, user_categories: Optional[List[Dict]] = None, **kwargs) -> List[Dict[str, Any]]:
         """解析文字内容"""
+        fast_items = self._fast_parse(content, user_categories, kwargs.get("user_context"))
+        if fast_items is not None:
+            llm_metrics.record_skip("text_parse", kwargs.get("user_id", "unknown"), "fast_path")
+            return fast_items
+
         if self.is_mock:
             # 简单的模拟解析逻辑
             if "麦当劳" in content:
@@ -44,115 +41,342 @@ class LLMParser:
                 return [{"date": "2025-12-26", "amount": 50.5, "main_category": "餐饮", "sub_category": "食材采购", "remark": "买菜", "confidence": 1.0}]
             return self._create_manual_item(content)
 
-        current_date = datetime.now().strftime("%Y-%m-%d")
-        categories_json = json.dumps(user_categories, ensure_ascii=False) if user_categories else "[]"
-        payees_json = json.dumps(kwargs.get("user_payees", []), ensure_ascii=False)
-        assets_json = json.dumps(kwargs.get("user_assets", []), ensure_ascii=False)
-        
-        system_prompt = self._prompt_template.format(
-            current_date=current_date,
-            user_categories_json=categories_json,
-            user_payees_json=payees_json,
-            user_assets_json=assets_json
-        )
+        system_prompt, current_date = self._build_system_prompt(user_categories, **kwargs)
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": content}
+        ]
 
-        try:
-            response = await self.client.post(
-                "/chat/completions",
-                json={
-                    "model": settings.OPENROUTER_MODEL,
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": content}
-                    ],
-                    "response_format": {"type": "json_object"},
-                    "temperature": 0.1
-                }
-            )
-            response.raise_for_status()
-            result = response.json()
-            
-            # 兼容不同厂商返回格式
-            content_str = result.get("choices", [{}])[0].get("message", {}).get("content", "{}")
-            parsed_data = json.loads(content_str)
-            
+        async def call_llm() -> List[Dict[str, Any]]:
+            metrics = self._new_metrics("text_parse", system_prompt, content, user_categories, **kwargs)
+            parsed_data = await self.chat_json(messages, temperature=0.1, metrics=metrics)
             # 记录审计日志
             await log_llm_conversation(
                 type="text_parse",
                 user_id=kwargs.get("user_id", "unknown"),
                 system_prompt=system_prompt,
                 user_input=content,
-                response=parsed_data
+                response=parsed_data,
+                metrics=metrics.to_dict()
             )
-            
             return parsed_data.get("items", [])
 
+        try:
+            return await self._cached(
+                "text", content, call_llm, current_date, user_categories, **kwargs
+            )
         except Exception as e:
             logger.error(f"LLM 解析异常: {e}")
             return self._create_manual_item(content)
 
     async def parse_image(self, image_base64: str, mime_type: str, user_categories: Optional[List[Dict]] = None, **kwargs) -> List[Dict[str, Any]]:
         """解析图片内容"""
+        system_prompt, current_date = self._build_system_prompt(user_categories, **kwargs)
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": "请解析这张账单截图中的所有消费记录。"
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:{mime_type};base64,{image_base64}"
+                        }
+                    }
+                ]
+            }
+        ]
+
+        async def call_llm() -> List[Dict[str, Any]]:
+            metrics = self._new_metrics("image_parse", system_prompt, "", user_categories, **kwargs)
+            parsed_data = await self.chat_json(messages, temperature=0.0, metrics=metrics)
+            # 记录审计日志
+            await log_llm_conversation(
+                type="image_parse",
+                user_id=kwargs.get("user_id", "unknown"),
+                system_prompt=system_prompt,
+                user_input="[IMAGE_BASE64_TRUNCATED]",
+                response=parsed_data,
+                metrics=metrics.to_dict()
+            )
+            return parsed_data.get("items", [])
+
+        try:
+            return await self._cached(
+                "image", image_base64, call_llm, current_date, user_categories, **kwargs
+            )
+        except Exception as e:
+            logger.error(f"LLM 图片解析异常: {e}")
+            # 图片失败不返回人工条目，因为备注无法捕获内容
+            return []
+
+    def _fast_parse(self, content: str, user_categories: Optional[List[Dict]], user_context: Optional[UserContext] = None) -> Optional[List[Dict[str, Any]]]:
+        """本地规则快速通道，覆盖完整且置信度达标时跳过 LLM；有用户上下文时复用其关键词自动机"""
+        if not settings.FAST_PARSE_ENABLED:
+            return None
+        automaton = user_context.keyword_automaton if user_context is not None else None
+        result = FastParser(user_categories, automaton).parse(content)
+        if result is None:
+            return None
+        items, confidence = result
+        if confidence < settings.FAST_PARSE_MIN_CONFIDENCE:
+            return None
+        return items
+
+    def _build_system_prompt(self, user_categories: Optional[List[Dict]] = None, **kwargs) -> Tuple[str, str]:
+        """填充系统提示词，返回 (prompt, 参考日期)；传入 user_context 时复用其编译缓存"""
         current_date = datetime.now().strftime("%Y-%m-%d")
+        user_context = kwargs.get("user_context")
+        # 历史频次有把握时只列出预测的分类，缩短提示词
+        category_hint = kwargs.get("category_hint")
+        if user_context is not None:
+            return user_context.system_prompt(current_date, category_hint), current_date
+
+        if category_hint is not None:
+            user_categories = category_hint
         categories_json = json.dumps(user_categories, ensure_ascii=False) if user_categories else "[]"
         payees_json = json.dumps(kwargs.get("user_payees", []), ensure_ascii=False)
         assets_json = json.dumps(kwargs.get("user_assets", []), ensure_ascii=False)
-        
+
         system_prompt = self._prompt_template.format(
             current_date=current_date,
             user_categories_json=categories_json,
             user_payees_json=payees_json,
             user_assets_json=assets_json
         )
+        return system_prompt, current_date
 
+    async def chat_json(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float,
+        metrics: Optional[LLMCallMetrics] = None
+    ) -> Dict[str, Any]:
+        """调用 chat completions 并解析 JSON 内容（含重试/降级），失败时抛出异常；调用结果计入 llm_metrics"""
+        metrics = metrics or LLMCallMetrics("chat")
         try:
-            response = await self.client.post(
-                "/chat/completions",
-                json={
-                    "model": settings.OPENROUTER_MODEL,
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {
-                            "role": "user",
-                            "content": [
-                                {
-                                    "type": "text",
-                                    "text": "请解析这张账单截图中的所有消费记录。"
-                                },
-                                {
-                                    "type": "image_url",
-                                    "image_url": {
-                                        "url": f"data:{mime_type};base64,{image_base64}"
-                                    }
-                                }
-                            ]
-                        }
-                    ],
-                    "response_format": {"type": "json_object"},
-                    "temperature": 0.0
-                }
-            )
-            response.raise_for_status()
-            result = response.json()
-            
+            result = await self.transport.chat({
+                "messages": messages,
+                "response_format": {"type": "json_object"},
+                "temperature": temperature
+            }, metrics)
+            metrics.set_usage(result.get("usage"))
+
+            # 兼容不同厂商返回格式
             content_str = result.get("choices", [{}])[0].get("message", {}).get("content", "{}")
-            parsed_data = json.loads(content_str)
-            
-            # 记录审计日志
-            await log_llm_conversation(
-                type="image_parse",
-                user_id=kwargs.get("user_id", "unknown"),
-                system_prompt=system_prompt,
-                user_input="[IMAGE_BASE64_TRUNCATED]",
-                response=parsed_data
+            parsed = json.loads(content_str)
+        except Exception:
+            metrics.finish("error")
+            llm_metrics.record(metrics)
+            raise
+        metrics.finish()
+        llm_metrics.record(metrics)
+        return parsed
+
+    def _new_metrics(self, kind: str, system_prompt: str, user_input: str, user_categories: Optional[List[Dict]] = None, **kwargs) -> LLMCallMetrics:
+        """创建调用观测对象，并记录系统提示词各片段的字符数"""
+        metrics = LLMCallMetrics(kind, kwargs.get("user_id", "unknown"))
+        user_context = kwargs.get("user_context")
+        category_hint = kwargs.get("category_hint")
+        if user_context is not None:
+            sections = {
+                "categories": len(user_context.categories_json) if category_hint is None
+                else len(json.dumps(category_hint, ensure_ascii=False)),
+                "payees": len(user_context.payees_json),
+                "assets": len(user_context.assets_json)
+            }
+        else:
+            sections = {
+                "categories": len(json.dumps(category_hint if category_hint is not None else user_categories or [], ensure_ascii=False)),
+                "payees": len(json.dumps(kwargs.get("user_payees", []), ensure_ascii=False)),
+                "assets": len(json.dumps(kwargs.get("user_assets", []), ensure_ascii=False))
+            }
+        sections["template"] = max(len(system_prompt) - sum(sections.values()), 0)
+        sections["user_input"] = len(user_input)
+        metrics.prompt_sections = sections
+        return metrics
+
+    async def _cached(
+        self,
+        kind: str,
+        content: str,
+        call_llm: Callable[[], Awaitable[List[Dict[str, Any]]]],
+        current_date: str,
+        user_categories: Optional[List[Dict]] = None,
+        **kwargs
+    ) -> List[Dict[str, Any]]:
+        """经解析缓存调用 LLM；相同输入 + 相同用户配置 + 相同模型直接复用结果"""
+        if not settings.PARSE_CACHE_ENABLED:
+            return await call_llm()
+
+        computed = False
+
+        async def compute() -> List[Dict[str, Any]]:
+            nonlocal computed
+            computed = True
+            return await call_llm()
+
+        key = self._cache_key(kind, content, current_date, user_categories, **kwargs)
+        items = await parse_cache.get_or_compute(key, compute)
+        if not computed:
+            # 缓存命中或与并发的相同请求合并
+            llm_metrics.record_skip(f"{kind}_parse", kwargs.get("user_id", "unknown"), "cache")
+        return items
+
+    def _cache_key(self, kind: str, content: str, current_date: str, user_categories: Optional[List[Dict]] = None, **kwargs) -> str:
+        user_context = kwargs.get("user_context")
+        if user_context is not None:
+            config_fp = fingerprint(user_context.fingerprint, prompt_template.digest, kwargs.get("category_hint"))
+        else:
+            config_fp = fingerprint(
+                kwargs.get("user_id"),
+                user_categories or [],
+                kwargs.get("user_payees", []),
+                kwargs.get("user_assets", []),
+                prompt_template.digest,
+                kwargs.get("category_hint")
             )
-            
-            return parsed_data.get("items", [])
+        return make_cache_key(kind, content, config_fp, settings.OPENROUTER_MODEL, current_date)
 
+    async def stream_parse(self, content: str, user_categories: Optional[List[Dict]] = None, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """流式解析文字内容，每解析出一个完整条目立即产出"""
+        fast_items = self._fast_parse(content, user_categories, kwargs.get("user_context"))
+        if fast_items is not None:
+            llm_metrics.record_skip("text_parse_stream", kwargs.get("user_id", "unknown"), "fast_path")
+            for item in fast_items:
+                yield item
+            return
+
+        if self.is_mock:
+            for item in await self.parse(content, user_categories, **kwargs):
+                yield item
+            return
+
+        system_prompt, current_date = self._build_system_prompt(user_categories, **kwargs)
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": content}
+        ]
+        emitted = 0
+        try:
+            async for item in self._stream_cached(
+                "text", content, messages, 0.1, system_prompt, content, current_date, user_categories, **kwargs
+            ):
+                emitted += 1
+                yield item
         except Exception as e:
-            logger.error(f"LLM 图片解析异常: {e}")
-            # 图片失败不返回人工条目，因为备注无法捕获内容
-            return []
+            logger.error(f"LLM 流式解析异常: {e}")
+            if emitted == 0:
+                for item in self._create_manual_item(content):
+                    yield item
+
+    async def stream_parse_image(self, image_base64: str, mime_type: str, user_categories: Optional[List[Dict]] = None, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """流式解析图片内容"""
+        system_prompt, current_date = self._build_system_prompt(user_categories, **kwargs)
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": "请解析这张账单截图中的所有消费记录。"},
+                    {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{image_base64}"}}
+                ]
+            }
+        ]
+        try:
+            async for item in self._stream_cached(
+                "image", image_base64, messages, 0.0, system_prompt, "[IMAGE_BASE64_TRUNCATED]", current_date, user_categories, **kwargs
+            ):
+                yield item
+        except Exception as e:
+            # 与 parse_image 一致：图片失败不返回人工条目
+            logger.error(f"LLM 图片流式解析异常: {e}")
+
+    async def _stream_cached(
+        self,
+        kind: str,
+        content: str,
+        messages: List[Dict[str, Any]],
+        temperature: float,
+        system_prompt: str,
+        log_input: str,
+        current_date: str,
+        user_categories: Optional[List[Dict]] = None,
+        **kwargs
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """先查解析缓存，未命中则流式调用上游，完整结束后写入缓存"""
+        key = None
+        if settings.PARSE_CACHE_ENABLED:
+            key = self._cache_key(kind, content, current_date, user_categories, **kwargs)
+            cached = await parse_cache.get(key)
+            if cached is not None:
+                llm_metrics.record_skip(f"{kind}_parse_stream", kwargs.get("user_id", "unknown"), "cache")
+                for item in cached:
+                    yield item
+                return
+
+        metrics = self._new_metrics(
+            f"{kind}_parse_stream", system_prompt, content if kind == "text" else "", user_categories, **kwargs
+        )
+        items: List[Dict[str, Any]] = []
+        try:
+            async for item in self._chat_stream_items(messages, temperature, metrics):
+                items.append(item)
+                yield dict(item)
+        except BaseException as e:
+            # 客户端断开时生成器被关闭，单独记为 cancelled
+            metrics.finish("error" if isinstance(e, Exception) else "cancelled")
+            llm_metrics.record(metrics)
+            raise
+        metrics.finish()
+        llm_metrics.record(metrics)
+
+        await log_llm_conversation(
+            type=f"{kind}_parse_stream",
+            user_id=kwargs.get("user_id", "unknown"),
+            system_prompt=system_prompt,
+            user_input=log_input,
+            response={"items": items},
+            metrics=metrics.to_dict()
+        )
+        if key is not None:
+            await parse_cache.put(key, items)
+
+    async def _chat_stream_items(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float,
+        metrics: LLMCallMetrics
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """以 SSE 流式调用 chat completions，并增量解析 items 数组；首个内容分片到达时间记为 ttfb"""
+        items_parser = IncrementalItemsParser()
+        async with self.transport.stream({
+            "messages": messages,
+            "response_format": {"type": "json_object"},
+            "temperature": temperature,
+            "stream": True
+        }, metrics) as response:
+            async for line in response.aiter_lines():
+                # 忽略空行与 ": OPENROUTER PROCESSING" 之类的注释行
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                # 用量在最后一个分片中返回
+                metrics.set_usage(chunk.get("usage"))
+                choices = chunk.get("choices") or [{}]
+                delta = choices[0].get("delta", {}).get("content")
+                if not delta:
+                    continue
+                metrics.mark_first_byte()
+                for item in items_parser.feed(delta):
+                    yield item
 
     def _create_manual_item(self, content: str) -> List[Dict[str, Any]]:
         """解析失败时的兜底逻辑"""
@@ -164,3 +388,7 @@ class LLMParser:
             "remark": f"[解析失败] {content[:50]}",
             "confidence": 0.0
         }]
+
+def get_llm_parser() -> LLMParser:
+    """FastAPI 依赖：基于共享连接池构造解析器"""
+    return LLMParser()
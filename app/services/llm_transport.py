@@ -0,0 +1,312 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, List, NamedTuple, Optional
+
+import httpx
+
+from app.config import settings
+from app.services.llm_client import llm_client_manager
+from app.utils.llm_metrics import LLMCallMetrics
+
+logger = logging.getLogger(__name__)
+
+# 供应商限流或临时故障，值得重试
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+class LLMEndpoint(NamedTuple):
+    model: str
+    base_url: str
+
+class RetryableLLMError(Exception):
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class LLMUnavailableError(Exception):
+    """所有模型均不可用（熔断或重试耗尽）"""
+
+def configured_endpoints() -> List[LLMEndpoint]:
+    """
+    主模型 + LLM_FALLBACK_MODELS 中按顺序配置的备用模型
+    备用项格式为 "model" 或 "model@base_url"，未写 base_url 时沿用 OPENROUTER_BASE_URL
+    """
+    endpoints = [LLMEndpoint(settings.OPENROUTER_MODEL, settings.OPENROUTER_BASE_URL)]
+    for entry in settings.LLM_FALLBACK_MODELS.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        model, _, base_url = entry.partition("@")
+        endpoint = LLMEndpoint(model.strip(), base_url.strip() or settings.OPENROUTER_BASE_URL)
+        if endpoint not in endpoints:
+            endpoints.append(endpoint)
+    return endpoints
+
+class CircuitBreaker:
+    """
+    单个模型的熔断器
+    连续失败达到阈值后打开，冷却期内直接跳过该模型；冷却结束放行一次试探请求（半开）
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def release(self):
+        """结束本次放行：试探请求被取消或结果不计入熔断时，允许下一个请求继续试探"""
+        self._probing = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            # 半开试探失败或达到阈值：重新计时
+            self.opened_at = time.monotonic()
+
+class LatencyTracker:
+    """记录最近成功请求的耗时，用于计算对冲请求的触发延迟"""
+
+    def __init__(self, window: int = 200):
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def p95(self) -> Optional[float]:
+        # 样本太少时分位数不可靠，不做对冲
+        if len(self._samples) < 20:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+class LLMTransport:
+    """
+    带重试、对冲请求、熔断与多模型降级的 chat completions 调用层
+    - 429/5xx/超时按指数退避重试（尊重 Retry-After）
+    - 请求超过该模型近期 p95 耗时仍未返回时，再发一个相同请求，取先成功者
+    - 每个模型独立熔断，主模型不可用时按 LLM_FALLBACK_MODELS 顺序降级
+    """
+
+    def __init__(self, client: Optional[httpx.AsyncClient] = None):
+        # 指定 client 时所有模型都走该客户端（脚本/调试用）
+        self._client = client
+        self._breakers: Dict[LLMEndpoint, CircuitBreaker] = {}
+        self._latency: Dict[LLMEndpoint, LatencyTracker] = {}
+
+    def _client_for(self, endpoint: LLMEndpoint) -> httpx.AsyncClient:
+        return self._client or llm_client_manager.client_for(endpoint.base_url)
+
+    def breaker(self, endpoint: LLMEndpoint) -> CircuitBreaker:
+        if endpoint not in self._breakers:
+            self._breakers[endpoint] = CircuitBreaker(
+                settings.LLM_CIRCUIT_FAILURE_THRESHOLD, settings.LLM_CIRCUIT_RESET_SECONDS
+            )
+        return self._breakers[endpoint]
+
+    def _tracker(self, endpoint: LLMEndpoint) -> LatencyTracker:
+        return self._latency.setdefault(endpoint, LatencyTracker())
+
+    async def chat(self, payload: Dict[str, Any], metrics: Optional[LLMCallMetrics] = None) -> Dict[str, Any]:
+        """
+        发送 chat completions 请求（payload 不含 model），返回响应 JSON
+        传入 metrics 时记录实际使用的模型、请求次数、是否对冲及首字节时间
+        """
+        metrics = metrics or LLMCallMetrics("untracked")
+        primary = configured_endpoints()[0]
+        last_error: Optional[Exception] = None
+        for endpoint in configured_endpoints():
+            # 只对实际尝试的模型调用 allow()：半开状态下 allow() 会占用唯一的试探名额
+            breaker = self.breaker(endpoint)
+            probe = breaker.state == "half_open"
+            if not breaker.allow():
+                continue
+            metrics.model = endpoint.model
+            metrics.fallback = endpoint != primary
+            try:
+                result = await self._with_retries(endpoint, payload, metrics)
+            except Exception as e:
+                breaker.record_failure()
+                last_error = e
+                logger.warning(f"LLM 模型 {endpoint.model} 调用失败，尝试降级: {e}")
+                continue
+            finally:
+                # 请求被取消（CancelledError）时没有结果可记录，也要归还试探名额
+                if probe:
+                    breaker.release()
+            breaker.record_success()
+            return result
+        raise last_error or LLMUnavailableError("所有 LLM 模型均处于熔断状态")
+
+    @asynccontextmanager
+    async def stream(self, payload: Dict[str, Any], metrics: Optional[LLMCallMetrics] = None) -> AsyncIterator[httpx.Response]:
+        """
+        打开流式请求，返回已校验状态码的响应
+        重试与降级只发生在收到响应头之前；开始输出后出错由调用方处理
+        """
+        metrics = metrics or LLMCallMetrics("untracked")
+        primary = configured_endpoints()[0]
+        last_error: Optional[Exception] = None
+        for endpoint in configured_endpoints():
+            breaker = self.breaker(endpoint)
+            probe = breaker.state == "half_open"
+            if not breaker.allow():
+                continue
+            metrics.model = endpoint.model
+            metrics.fallback = endpoint != primary
+            try:
+                for attempt in range(settings.LLM_MAX_RETRIES + 1):
+                    metrics.attempts += 1
+                    client = self._client_for(endpoint)
+                    request = client.build_request(
+                        "POST", "/chat/completions", json={**payload, "model": endpoint.model}
+                    )
+                    try:
+                        response = await client.send(request, stream=True)
+                    except (httpx.TimeoutException, httpx.TransportError) as e:
+                        last_error = RetryableLLMError(str(e))
+                    else:
+                        if response.status_code in RETRYABLE_STATUS:
+                            await response.aclose()
+                            last_error = RetryableLLMError(
+                                f"HTTP {response.status_code}", _retry_after(response)
+                            )
+                        elif response.is_error:
+                            # 不可重试的状态码与 chat() 一致：记为该模型失败，降级到下一个模型
+                            await response.aclose()
+                            last_error = httpx.HTTPStatusError(
+                                f"HTTP {response.status_code}", request=request, response=response
+                            )
+                            logger.warning(f"LLM 模型 {endpoint.model} 流式调用失败，尝试降级: {last_error}")
+                            break
+                        else:
+                            # 收到正常响应头即视为模型可用，之后输出中断不计入熔断
+                            breaker.record_success()
+                            try:
+                                yield response
+                            finally:
+                                await response.aclose()
+                            return
+                    if attempt < settings.LLM_MAX_RETRIES:
+                        await asyncio.sleep(_backoff(attempt, last_error))
+                breaker.record_failure()
+            finally:
+                # 调用方在输出中途抛出异常或取消时同样归还试探名额
+                if probe:
+                    breaker.release()
+        raise last_error or LLMUnavailableError("所有 LLM 模型均处于熔断状态")
+
+    async def _with_retries(self, endpoint: LLMEndpoint, payload: Dict[str, Any], metrics: LLMCallMetrics) -> Dict[str, Any]:
+        for attempt in range(settings.LLM_MAX_RETRIES + 1):
+            try:
+                return await self._hedged(endpoint, payload, metrics)
+            except RetryableLLMError as e:
+                if attempt >= settings.LLM_MAX_RETRIES:
+                    raise
+                await asyncio.sleep(_backoff(attempt, e))
+        raise LLMUnavailableError("重试次数配置无效")
+
+    async def _hedged(self, endpoint: LLMEndpoint, payload: Dict[str, Any], metrics: LLMCallMetrics) -> Dict[str, Any]:
+        delay = self._hedge_delay(endpoint)
+        if delay is None:
+            return await self._send(endpoint, payload, metrics)
+
+        first = asyncio.create_task(self._send(endpoint, payload, metrics))
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait({first}, timeout=delay)
+            if done:
+                return first.result()
+
+            # 主请求落在长尾：追加一个相同请求，取先成功的结果
+            logger.info(f"LLM 请求超过 {delay:.1f}s 未返回，发起对冲请求 ({endpoint.model})")
+            metrics.hedged = True
+            tasks.append(asyncio.create_task(self._send(endpoint, payload, metrics)))
+            pending = set(tasks)
+            last_error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+            raise last_error
+        finally:
+            # 已有结果或调用方被取消时，未完成的请求一并取消
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def _hedge_delay(self, endpoint: LLMEndpoint) -> Optional[float]:
+        if not settings.LLM_HEDGE_ENABLED:
+            return None
+        p95 = self._tracker(endpoint).p95()
+        if p95 is None:
+            return None
+        return min(max(p95, settings.LLM_HEDGE_MIN_DELAY), settings.LLM_HEDGE_MAX_DELAY)
+
+    async def _send(self, endpoint: LLMEndpoint, payload: Dict[str, Any], metrics: LLMCallMetrics) -> Dict[str, Any]:
+        client = self._client_for(endpoint)
+        metrics.attempts += 1
+        started = time.monotonic()
+        request = client.build_request("POST", "/chat/completions", json={**payload, "model": endpoint.model})
+        try:
+            response = await client.send(request, stream=True)
+            try:
+                if response.is_success:
+                    metrics.mark_first_byte()
+                await response.aread()
+            finally:
+                await response.aclose()
+        except (httpx.TimeoutException, httpx.TransportError) as e:
+            raise RetryableLLMError(f"{type(e).__name__}: {e}")
+
+        if response.status_code in RETRYABLE_STATUS:
+            raise RetryableLLMError(f"HTTP {response.status_code}", _retry_after(response))
+        response.raise_for_status()
+        self._tracker(endpoint).add(time.monotonic() - started)
+        return response.json()
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+def _backoff(attempt: int, error: Optional[Exception]) -> float:
+    """指数退避 + 抖动；供应商给出 Retry-After 时以其为准（不超过上限）"""
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is not None:
+        return min(retry_after, settings.LLM_RETRY_BACKOFF_MAX)
+    base = settings.LLM_RETRY_BACKOFF_BASE * (2 ** attempt)
+    return min(base, settings.LLM_RETRY_BACKOFF_MAX) * random.uniform(0.5, 1.0)
+
+llm_transport = LLMTransport()
@@ -0,0 +1,190 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+def normalize_text(content: str) -> str:
+    """归一化文字输入：全角转半角、去首尾空白、合并连续空白"""
+    text = unicodedata.normalize("NFKC", content)
+    return re.sub(r"\s+", " ", text).strip()
+
+def fingerprint(*parts: Any) -> str:
+    """对用户配置（分类/成员/资产）等内容生成稳定指纹"""
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def make_cache_key(kind: str, content: str, config_fingerprint: str, model: str, current_date: str) -> str:
+    """
+    内容寻址的缓存键
+    - 输入内容归一化后参与计算
+    - 用户配置指纹变化即换键，配置修改后不会命中旧结果
+    - 含当前日期，避免"今天/昨天"跨天后命中旧日期
+    """
+    body = normalize_text(content) if kind == "text" else content
+    digest = hashlib.sha256(body.encode("utf-8")).hexdigest()
+    return fingerprint(kind, digest, config_fingerprint, model, current_date)
+
+class _SQLiteTier:
+    """可选的持久化缓存层（独立 SQLite 文件，进程重启后仍可命中）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS parse_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5.0)
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, expires_at FROM parse_cache WHERE key = ? AND expires_at > ?",
+                (key, time.time())
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set(self, key: str, value: str, expires_at: float):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO parse_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at)
+            )
+            # 顺带清理过期条目
+            conn.execute("DELETE FROM parse_cache WHERE expires_at <= ?", (time.time(),))
+
+class ParseCache:
+    """
+    LLM 解析结果缓存
+    内存 LRU + TTL，可选 SQLite 持久层；相同键的并发请求只触发一次上游调用
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, db_path: str = ""):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._persistent = _SQLiteTier(db_path) if db_path else None
+        self.hits = 0
+        self.misses = 0
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.time():
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return value
+
+    def _put_memory(self, key: str, value: str, expires_at: float):
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    async def _get_persistent(self, key: str) -> Optional[str]:
+        if not self._persistent:
+            return None
+        try:
+            entry = await asyncio.to_thread(self._persistent.get, key)
+        except Exception as e:
+            logger.warning(f"解析缓存持久层读取失败: {e}")
+            return None
+        if entry is None:
+            return None
+        value, expires_at = entry
+        self._put_memory(key, value, expires_at)
+        return value
+
+    async def _set(self, key: str, value: str):
+        expires_at = time.time() + self.ttl
+        self._put_memory(key, value, expires_at)
+        if self._persistent:
+            try:
+                await asyncio.to_thread(self._persistent.set, key, value, expires_at)
+            except Exception as e:
+                logger.warning(f"解析缓存持久层写入失败: {e}")
+
+    async def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """只读查询（流式解析先查缓存，未命中再走上游）"""
+        value = self._get_memory(key)
+        if value is None:
+            value = await self._get_persistent(key)
+        if value is None:
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    async def put(self, key: str, items: List[Dict[str, Any]]):
+        await self._set(key, json.dumps(items, ensure_ascii=False))
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[List[Dict[str, Any]]]]
+    ) -> List[Dict[str, Any]]:
+        """
+        命中缓存直接返回；未命中时调用 compute，并让同键的并发请求共享这一次结果
+        compute 在缓存持有的独立任务中执行，某个调用方取消（如客户端断开）不影响其它等待者
+        compute 抛出的异常不会被缓存
+        每次返回独立副本，调用方可放心修改
+        """
+        value = self._get_memory(key)
+        if value is not None:
+            self.hits += 1
+            return json.loads(value)
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.hits += 1
+        else:
+            task = asyncio.ensure_future(self._load(key, compute))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        return json.loads(await asyncio.shield(task))
+
+    async def _load(self, key: str, compute: Callable[[], Awaitable[List[Dict[str, Any]]]]) -> str:
+        value = await self._get_persistent(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        items = await compute()
+        value = json.dumps(items, ensure_ascii=False)
+        await self._set(key, value)
+        return value
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 标记异常已被读取，调用方都已离开时不会产生告警
+        if not task.cancelled():
+            task.exception()
+
+    def clear(self):
+        self._memory.clear()
+
+parse_cache = ParseCache(
+    max_entries=settings.PARSE_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.PARSE_CACHE_TTL_SECONDS,
+    db_path=settings.PARSE_CACHE_DB_PATH
+)
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.tables import Category, Payee, Asset
+from app.services.data_version import get_data_version
+from app.services.parse_cache import fingerprint
+from app.services.category_keywords import KeywordEntry, load_keywords, top_keywords, build_automaton
+from app.utils.aho_corasick import AhoCorasick
+
+logger = logging.getLogger(__name__)
+
+PROMPT_PATH = "prompts/system_prompt.md"
+
+# 模板文件缺失时的兜底 Prompt
+FALLBACK_PROMPT = "你是一个记账助手，请将用户输入解析为 JSON 格式的 items 列表。"
+
+class PromptTemplateStore:
+    """
+    系统提示词模板
+    按文件修改时间热加载：每隔 PROMPT_RELOAD_INTERVAL_SECONDS 最多检查一次 mtime，变化即重新读取
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._template = FALLBACK_PROMPT
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self.digest = ""
+        self._load()
+
+    def _load(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._template = f.read()
+            self._mtime = mtime
+        except FileNotFoundError:
+            self._template = FALLBACK_PROMPT
+            self._mtime = None
+        self.digest = hashlib.sha256(self._template.encode("utf-8")).hexdigest()[:16]
+
+    def get(self) -> str:
+        now = time.monotonic()
+        if now - self._checked_at >= settings.PROMPT_RELOAD_INTERVAL_SECONDS:
+            self._checked_at = now
+            try:
+                mtime = os.path.getmtime(self.path)
+            except FileNotFoundError:
+                mtime = None
+            if mtime != self._mtime:
+                self._load()
+                logger.info("系统提示词模板已重新加载")
+        return self._template
+
+prompt_template = PromptTemplateStore(PROMPT_PATH)
+
+class UserContext:
+    """单个用户的解析上下文：分类/成员/资产及其预序列化 JSON 与编译好的提示词"""
+
+    def __init__(self, user_id: str, categories: List[Dict], payees: List[str], assets: List[str], keywords: Optional[List[KeywordEntry]] = None, version: int = 0):
+        self.user_id = user_id
+        # 加载时的用户数据版本，UserContextCache 据此判断是否过期
+        self.version = version
+        self.categories = categories
+        # 全部关键词（本地分类用）；categories 中的 keywords 只含每类前 KEYWORD_PROMPT_LIMIT 个（提示词用）
+        self.keywords = keywords or []
+        self.payees = payees
+        self.assets = assets
+        self.categories_json = json.dumps(categories, ensure_ascii=False) if categories else "[]"
+        self.payees_json = json.dumps(payees, ensure_ascii=False)
+        self.assets_json = json.dumps(assets, ensure_ascii=False)
+        # 指令解析使用的分类列表不含关键词
+        self.instruction_categories_json = json.dumps(
+            [{"main": c["main"], "sub": c["sub"]} for c in categories], ensure_ascii=False
+        )
+        self.fingerprint = fingerprint(user_id, categories, payees, assets)
+        self._compiled: Optional[Tuple[Tuple[str, str], str]] = None
+        self._memo: Dict[str, Any] = {}
+
+    @property
+    def keyword_automaton(self) -> AhoCorasick:
+        """按需构建的关键词自动机，随上下文一起失效"""
+        return self.memoize("keyword_automaton", lambda ctx: build_automaton(ctx.keywords))
+
+    def memoize(self, name: str, build: Callable[["UserContext"], Any]) -> Any:
+        """缓存基于本上下文派生的内容（如指令解析提示词片段），随上下文一起失效"""
+        if name not in self._memo:
+            self._memo[name] = build(self)
+        return self._memo[name]
+
+    def system_prompt(self, current_date: str, categories: Optional[List[Dict]] = None) -> str:
+        """
+        按 (日期, 模板版本) 缓存填充后的系统提示词
+        传入 categories（如按历史频次精简的分类列表）时以其代替完整分类列表，不缓存
+        """
+        template = prompt_template.get()
+        if categories is not None:
+            return template.format(
+                current_date=current_date,
+                user_categories_json=json.dumps(categories, ensure_ascii=False),
+                user_payees_json=self.payees_json,
+                user_assets_json=self.assets_json
+            )
+        key = (current_date, prompt_template.digest)
+        if self._compiled is None or self._compiled[0] != key:
+            prompt = template.format(
+                current_date=current_date,
+                user_categories_json=self.categories_json,
+                user_payees_json=self.payees_json,
+                user_assets_json=self.assets_json
+            )
+            self._compiled = (key, prompt)
+        return self._compiled[1]
+
+class UserContextCache:
+    """
+    按用户缓存解析上下文，省去每次记账的三次配置查询与字符串拼接
+    每次取用前与数据库中的用户数据版本比对（一次主键查询）：分类/成员/资产、关键词的修改都会使版本加一，
+    其它 worker 进程的修改同样能及时生效；本进程的修改另在提交后直接失效
+    """
+
+    def __init__(self):
+        self._contexts: Dict[str, UserContext] = {}
+
+    async def get(self, db: AsyncSession, user_id: str) -> UserContext:
+        version = await get_data_version(db, user_id)
+        ctx = self._contexts.get(user_id)
+        if ctx is not None and ctx.version == version:
+            return ctx
+
+        ctx = await self._load(db, user_id, version)
+        # 加载期间版本变化（有修改提交）则不写入，避免缓存旧数据
+        if await get_data_version(db, user_id) == version:
+            self._contexts[user_id] = ctx
+        else:
+            self._contexts.pop(user_id, None)
+        return ctx
+
+    async def _load(self, db: AsyncSession, user_id: str, version: int) -> UserContext:
+        cat_result = await db.execute(select(Category).where(Category.user_id == user_id))
+        keywords = await load_keywords(db, user_id)
+        top = top_keywords(keywords, settings.KEYWORD_PROMPT_LIMIT)
+        categories = [{"main": c.main_name, "sub": c.sub_name, "keywords": top.get(c.id, "")} for c in cat_result.scalars().all()]
+
+        payee_result = await db.execute(select(Payee.name).where(Payee.user_id == user_id))
+        payees = list(payee_result.scalars().all())
+
+        asset_result = await db.execute(select(Asset.name).where(Asset.user_id == user_id))
+        assets = list(asset_result.scalars().all())
+        return UserContext(user_id, categories, payees, assets, keywords, version)
+
+    def invalidate(self, user_id: str):
+        self._contexts.pop(user_id, None)
+
+user_context_cache = UserContextCache()
+
+def invalidate_on_commit(db: AsyncSession, user_id: str):
+    """在当前事务提交后使用户上下文失效（用于尚未提交的修改，如关键词学习）"""
+    db.info.setdefault("invalidate_user_context", set()).add(user_id)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session):
+    for user_id in session.info.pop("invalidate_user_context", ()):
+        user_context_cache.invalidate(user_id)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session):
+    session.info.pop("invalidate_user_context", None)
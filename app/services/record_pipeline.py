@@ -0,0 +1,102 @@
+import asyncio
+from typing import Dict, List, NamedTuple, Set, Tuple, Union
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.services.llm_parser import LLMParser
+from app.services.auditor import Auditor
+from app.services.batch_manager import BatchManager
+from app.services.prompt_cache import user_context_cache
+from app.services.category_stats import category_predictor
+from app.services.image_dedupe import ImageDeduper, mark_similar
+from app.utils.image import preprocess_image
+
+class RecordResult(NamedTuple):
+    data: Dict
+    message: str = "操作成功"
+
+async def record_inputs(
+    db: AsyncSession,
+    user_id: str,
+    parser: LLMParser,
+    inputs: List[Tuple[str, Union[str, bytes]]]
+) -> RecordResult:
+    """
+    多份内容并发解析后合并为同一个暂存批次
+    图片在线程池并行预处理，LLM 解析在信号量限制下并发执行，结果按提交顺序编号
+    """
+    ctx = await user_context_cache.get(db, user_id)
+    semaphore = asyncio.Semaphore(settings.RECORD_BATCH_CONCURRENCY)
+    parse_kwargs = dict(user_payees=ctx.payees, user_assets=ctx.assets, user_id=user_id, user_context=ctx)
+
+    async def prepare(kind: str, content: Union[str, bytes]):
+        return await preprocess_image(content) if kind == "image" else content
+
+    # 1. 图片并行预处理
+    prepared = await asyncio.gather(*(prepare(kind, content) for kind, content in inputs), return_exceptions=True)
+
+    # 2. 截图去重：像素相同的复用解析结果，感知哈希相近的记下稍后提示（共用一个会话，逐个查询）
+    deduper = ImageDeduper(db)
+    reused: Dict[int, List[Dict]] = {}
+    similar: Set[int] = set()
+    for idx, ((kind, _), data) in enumerate(zip(inputs, prepared)):
+        if kind == "image" and not isinstance(data, Exception):
+            found = await deduper.find(user_id, data)
+            if found is not None:
+                reused[idx] = found
+            elif await deduper.similar(user_id, data):
+                similar.add(idx)
+
+    # 分类频次模型在并发解析前加载：同一个会话不能被多个任务并发使用，任务内只做内存计算
+    category_model = None
+    if settings.CATEGORY_PREDICT_ENABLED and any(kind == "text" for kind, _ in inputs):
+        category_model = await category_predictor.get(db, user_id)
+
+    # 3. 其余内容在信号量限制下并发解析
+    async def parse_one(idx: int, kind: str, data) -> List[Dict]:
+        if isinstance(data, Exception):
+            raise data
+        if idx in reused:
+            return reused[idx]
+        async with semaphore:
+            if kind == "text":
+                category_hint = category_model.prompt_categories(data, ctx.categories) if category_model else None
+                return await parser.parse(data, ctx.categories, category_hint=category_hint, **parse_kwargs)
+            return await parser.parse_image(data.base64, data.mime_type, ctx.categories, **parse_kwargs)
+
+    results = await asyncio.gather(
+        *(parse_one(idx, kind, data) for idx, ((kind, _), data) in enumerate(zip(inputs, prepared))),
+        return_exceptions=True
+    )
+    for idx, ((kind, _), data) in enumerate(zip(inputs, prepared)):
+        if kind == "image" and idx not in reused and not isinstance(results[idx], Exception):
+            deduper.remember(user_id, data, results[idx])
+            if idx in similar:
+                mark_similar(results[idx])
+
+    # 按提交顺序合并，保证 temp_id 编号稳定
+    items: List[Dict] = []
+    errors = []
+    for idx, result in enumerate(results):
+        if isinstance(result, Exception):
+            errors.append({"index": idx, "message": str(result)})
+            continue
+        for item in result:
+            item["source_index"] = idx
+            items.append(item)
+
+    if not items:
+        await db.commit()
+        return RecordResult({"items": [], "errors": errors}, "未识别到任何消费条目")
+
+    await category_predictor.apply(db, user_id, items)
+    items_with_meta = await Auditor(db).check_duplicates(user_id, items)
+    batch_id = await BatchManager(db).create_batch(user_id, items_with_meta)
+
+    return RecordResult({
+        "batch_id": batch_id,
+        "items": items_with_meta,
+        "errors": errors,
+        "summary": f"{len(inputs)} 份内容共识别出 {len(items_with_meta)} 条记录"
+    })
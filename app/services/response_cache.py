@@ -0,0 +1,84 @@
+import hashlib
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.services.data_version import get_data_version
+
+# 客户端每次都需带 If-None-Match 回源校验，响应只允许浏览器私有缓存
+CACHE_CONTROL = "private, no-cache"
+
+# (用户, 路径, 排序后的查询参数, 当天日期)；含日期是因为汇总、趋势等默认区间随当天变化
+CacheKey = Tuple[str, str, Tuple[Tuple[str, str], ...], str]
+
+class ResponseCache:
+    """
+    读接口响应缓存（LRU，最多 RESPONSE_CACHE_MAX_ENTRIES 条）
+    每条记录生成时的数据版本，版本不一致即视为未命中并覆盖，写入后无需逐条失效
+    """
+
+    def __init__(self):
+        self._entries: "OrderedDict[CacheKey, Tuple[int, Any]]" = OrderedDict()
+
+    def get(self, key: CacheKey, version: int):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != version:
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key: CacheKey, version: int, body: Any):
+        self._entries[key] = (version, body)
+        self._entries.move_to_end(key)
+        while len(self._entries) > settings.RESPONSE_CACHE_MAX_ENTRIES:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+response_cache = ResponseCache()
+
+def _etag(key: CacheKey, version: int) -> str:
+    # 含 user_id：不同用户数据版本相同时 ETag 也不能相同，共用客户端切换账号后不会误得 304
+    digest = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()[:16]
+    return f'"{version}-{digest}"'
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match 可能是逗号分隔的多个值或 *，弱比较（忽略 W/ 前缀）"""
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+async def cached(request: Request, response: Response, user_id: str, db: AsyncSession, handler: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    按用户数据版本为读接口生成 ETag：If-None-Match 一致时返回 304
+    启用响应缓存时相同请求在版本不变期间直接返回缓存的响应，不再执行 handler
+    """
+    # 每次查库取版本：多进程部署下其它进程的写入同样使 ETag 与缓存失效
+    version = await get_data_version(db, user_id)
+    key: CacheKey = (user_id, request.url.path, tuple(sorted(request.query_params.multi_items())), date.today().isoformat())
+    etag = _etag(key, version)
+    headers: Dict[str, str] = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    if settings.RESPONSE_CACHE_ENABLED:
+        body = response_cache.get(key, version)
+        if body is not None:
+            return JSONResponse(body, headers={**headers, "X-Cache": "hit"})
+
+    result = await handler()
+    if settings.RESPONSE_CACHE_ENABLED:
+        response_cache.put(key, version, jsonable_encoder(result))
+    response.headers.update(headers)
+    return result
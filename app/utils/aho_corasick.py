@@ -0,0 +1,66 @@
+from collections import deque
+from typing import Dict, Generic, Iterator, List, Tuple, TypeVar
+
+T = TypeVar("T")
+
+class AhoCorasick(Generic[T]):
+    """
+    多模式字符串匹配自动机：一次扫描文本即可找出所有出现的关键词，耗时与关键词数量无关
+    add() 全部关键词后调用 build()，之后只读，可在协程间共享
+    """
+
+    def __init__(self):
+        # 每个状态：字符 -> 下一状态
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # 每个状态结束的关键词（含经失败链可达的），(关键词, 值)
+        self._output: List[List[Tuple[str, T]]] = [[]]
+        self._size = 0
+        self._built = False
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, word: str, value: T):
+        if self._built:
+            raise RuntimeError("自动机已构建，不能再添加关键词")
+        if not word:
+            return
+        state = 0
+        for ch in word:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = nxt
+        self._output[state].append((word, value))
+        self._size += 1
+
+    def build(self) -> "AhoCorasick[T]":
+        """按 BFS 计算失败指针，并把失败链上的输出合并到每个状态"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._output[nxt] = self._output[nxt] + self._output[self._fail[nxt]]
+        self._built = True
+        return self
+
+    def iter(self, text: str) -> Iterator[Tuple[int, str, T]]:
+        """依次产出 (结束位置, 关键词, 值)，重叠的匹配全部返回"""
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            for word, value in self._output[state]:
+                yield i, word, value
@@ -2,7 +2,7 @@ import json
 import aiofiles
 import os
 from datetime import datetime
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 LOG_FILE = "data/llm_audit.log"
 
@@ -12,9 +12,10 @@ async def log_llm_conversation(
     system_prompt: str, 
     user_input: Any, 
     response: Any,
-    batch_id: str = None
+    batch_id: str = None,
+    metrics: Optional[Dict[str, Any]] = None
 ):
-    """记录 LLM 对话审计日志"""
+    """记录 LLM 对话审计日志，metrics 为该次调用的用量/耗时/模型等观测数据"""
     log_entry = {
         "timestamp": datetime.now().isoformat(),
         "type": type,
@@ -22,7 +23,8 @@ async def log_llm_conversation(
         "batch_id": batch_id,
         "system_prompt": system_prompt,
         "user_input": user_input,
-        "response": response
+        "response": response,
+        "metrics": metrics
     }
     
     # 确保目录存在
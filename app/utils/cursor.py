@@ -0,0 +1,24 @@
+import base64
+import json
+from typing import NamedTuple
+
+class Cursor(NamedTuple):
+    """列表游标：排序键 (date, id) 与翻页方向（next 向更早，prev 向更新）"""
+    date: str
+    id: int
+    direction: str = "next"
+
+def encode_cursor(date: str, id: int, direction: str = "next") -> str:
+    raw = json.dumps([date, id, direction], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(token: str) -> Cursor:
+    """解析客户端传回的游标，格式不对时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        date, id, direction = json.loads(raw)
+    except Exception:
+        raise ValueError("无效的游标")
+    if not isinstance(date, str) or not isinstance(id, int) or direction not in ("next", "prev"):
+        raise ValueError("无效的游标")
+    return Cursor(date, id, direction)
@@ -1,32 +1,117 @@
+import asyncio
 import base64
+import hashlib
 import io
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
-from typing import Tuple
+from typing import NamedTuple, Optional, Tuple, Union
 
-def validate_and_resize_image(image_base64: str, max_size: int = 1024) -> Tuple[str, str]:
+from app.config import settings
+
+# Pillow 的解码/缩放/编码会释放 GIL，线程池即可真正并行，且免去进程间拷贝图片字节
+_executor: Optional[ThreadPoolExecutor] = None
+
+# 手机拍照常见的 MPO 实为 JPEG
+_FORMAT_ALIASES = {"MPO": "JPEG"}
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS, thread_name_prefix="image")
+    return _executor
+
+def shutdown_image_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+class PreparedImage(NamedTuple):
+    base64: str
+    mime_type: str
+    # 差值感知哈希，用于提示疑似重复的截图：64 位用于索引召回，256 位用于相似度比对
+    dhash: int
+    dhash_fine: int
+    # 送给模型的像素的 sha256：只有完全相同时才能复用上次的解析结果
+    content_hash: str
+
+def dhash(img: Image.Image, hash_size: int = 8) -> int:
+    """
+    差值哈希 (dHash)：缩成 (hash_size+1) x hash_size 灰度图，逐行比较相邻像素明暗
+    重新裁剪、压缩后的同一张截图哈希值仅有少量位不同
+    """
+    small = img.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (1 if pixels[offset + col] > pixels[offset + col + 1] else 0)
+    return value
+
+def pixel_hash(img: Image.Image) -> str:
+    """解码后像素的 sha256（含模式与尺寸），与文件编码方式、元数据无关"""
+    digest = hashlib.sha256(f"{img.mode}:{img.size[0]}x{img.size[1]}:".encode("ascii"))
+    digest.update(img.tobytes())
+    return digest.hexdigest()
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+def prepare_image(image: Union[str, bytes], max_size: int = 1024) -> PreparedImage:
     """
-    验证并压缩图片，确保其适合 LLM 或存储
-    返回: (压缩后的 base64, mime_type)
+    验证并压缩图片，确保其适合 LLM 或存储，同时计算感知哈希
+    image 可以是 base64 字符串（可带 data URL 头）或原始字节
+    返回: PreparedImage(压缩后的 base64, mime_type, dhash, dhash_fine, content_hash)
     """
     # 解码
+    original_b64 = None
     try:
-        header, encoded = image_base64.split(",", 1) if "," in image_base64 else (None, image_base64)
-        img_data = base64.b64decode(encoded)
+        if isinstance(image, str):
+            header, encoded = image.split(",", 1) if "," in image else (None, image)
+            img_data = base64.b64decode(encoded)
+            original_b64 = encoded
+        else:
+            img_data = image
         img = Image.open(io.BytesIO(img_data))
     except Exception as e:
         raise ValueError(f"无效的图片数据: {e}")
 
     # 获取原始格式
     fmt = img.format if img.format else "JPEG"
+    fmt = _FORMAT_ALIASES.get(fmt, fmt)
     mime_type = f"image/{fmt.lower()}"
 
+    # 尺寸已达标：直接沿用原始数据，省去解码/重编码与 base64 往返
+    if max(img.size) <= max_size:
+        return PreparedImage(
+            original_b64 or base64.b64encode(img_data).decode("utf-8"),
+            mime_type,
+            dhash(img),
+            dhash(img, 16),
+            pixel_hash(img)
+        )
+
+    # JPEG 使用 draft 模式按 1/2、1/4、1/8 缩小解码，大图只解出接近目标尺寸的像素
+    if fmt == "JPEG":
+        img.draft(None, (max_size, max_size))
+
     # 缩放
-    if max(img.size) > max_size:
-        img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+    img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
 
     # 转换回 base64
     buffered = io.BytesIO()
     img.save(buffered, format=fmt)
     compressed_base64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
-    
-    return compressed_base64, mime_type
+
+    return PreparedImage(compressed_base64, mime_type, dhash(img), dhash(img, 16), pixel_hash(img))
+
+def validate_and_resize_image(image_base64: str, max_size: int = 1024) -> Tuple[str, str]:
+    """同步版本，保留给脚本等非异步调用方，返回 (base64, mime_type)"""
+    prepared = prepare_image(image_base64, max_size)
+    return prepared.base64, prepared.mime_type
+
+async def preprocess_image(image: Union[str, bytes], max_size: int = 1024) -> PreparedImage:
+    """在图片线程池中完成预处理，不阻塞事件循环"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), prepare_image, image, max_size)
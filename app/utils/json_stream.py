@@ -0,0 +1,75 @@
+import json
+from typing import Any, Dict, List
+
+class IncrementalItemsParser:
+    """
+    增量解析 LLM 流式输出中的 {"items": [ {...}, {...} ]}
+    每当数组中的一个对象完整闭合即返回该对象，无需等待整个 JSON 结束
+    """
+
+    def __init__(self, array_key: str = "items"):
+        self._key_token = f'"{array_key}"'
+        self._buffer = ""
+        self._pos = 0
+        self._in_array = False
+        self._done = False
+        self._depth = 0          # 数组内部对象的嵌套深度
+        self._in_string = False
+        self._escape = False
+        self._obj_start = -1
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """追加一段文本，返回本次新完成的条目"""
+        if self._done or not chunk:
+            return []
+        self._buffer += chunk
+        completed: List[Dict[str, Any]] = []
+
+        if not self._in_array:
+            key_at = self._buffer.find(self._key_token)
+            if key_at < 0:
+                return completed
+            bracket_at = self._buffer.find("[", key_at + len(self._key_token))
+            if bracket_at < 0:
+                return completed
+            self._in_array = True
+            self._pos = bracket_at + 1
+
+        buf = self._buffer
+        i = self._pos
+        while i < len(buf):
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                if self._depth == 0:
+                    self._obj_start = i
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0 and self._obj_start >= 0:
+                    try:
+                        completed.append(json.loads(buf[self._obj_start:i + 1]))
+                    except json.JSONDecodeError:
+                        pass
+                    self._obj_start = -1
+            elif ch == "]" and self._depth == 0:
+                self._done = True
+                i += 1
+                break
+            i += 1
+
+        # 丢弃已消费的内容，只保留未闭合对象的部分
+        keep_from = self._obj_start if self._obj_start >= 0 else i
+        self._buffer = buf[keep_from:]
+        if self._obj_start >= 0:
+            self._obj_start = 0
+        self._pos = i - keep_from
+        return completed
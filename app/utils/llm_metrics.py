@@ -0,0 +1,210 @@
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from app.config import settings
+
+# 延迟直方图分桶上界（毫秒），最后一个桶为 +Inf
+LATENCY_BUCKETS_MS = [50, 100, 250, 500, 1000, 2000, 3000, 5000, 8000, 13000, 20000, 30000, 60000]
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中文约 1 字 1 token，其余约 4 字符 1 token（仅用于对比，不替代上游 usage）"""
+    cjk = sum(1 for ch in text if "\u4e00" <= ch <= "\u9fff")
+    return cjk + (len(text) - cjk + 3) // 4
+
+class LLMCallMetrics:
+    """
+    单次 LLM 调用的观测数据
+    由解析器创建，调用层 (LLMTransport) 填写模型/重试/对冲/首字节时间，解析器填写用量与缓存状态
+    """
+
+    def __init__(self, kind: str, user_id: str = "unknown"):
+        self.kind = kind
+        self.user_id = user_id
+        self.model: Optional[str] = None
+        self.fallback = False  # 是否由备用模型完成
+        self.attempts = 0  # 实际发出的请求数（含重试与对冲）
+        self.hedged = False
+        self.cache = "miss"
+        self.status = "ok"
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost: Optional[float] = None
+        self.ttfb_ms: Optional[float] = None
+        self.latency_ms: Optional[float] = None
+        # 各提示词片段字符数，用于估算哪部分上下文在消耗 token
+        self.prompt_sections: Dict[str, int] = {}
+        self._started = time.perf_counter()
+
+    def mark_first_byte(self):
+        if self.ttfb_ms is None:
+            self.ttfb_ms = round((time.perf_counter() - self._started) * 1000, 1)
+
+    def set_usage(self, usage: Optional[Dict[str, Any]]):
+        if not usage:
+            return
+        self.prompt_tokens = usage.get("prompt_tokens") or 0
+        self.completion_tokens = usage.get("completion_tokens") or 0
+        # OpenRouter 开启用量统计时会直接返回费用
+        if usage.get("cost") is not None:
+            self.cost = float(usage["cost"])
+
+    def finish(self, status: str = "ok"):
+        self.status = status
+        self.latency_ms = round((time.perf_counter() - self._started) * 1000, 1)
+        if self.cost is None:
+            self.cost = (
+                self.prompt_tokens * settings.LLM_PROMPT_PRICE_PER_MTOK
+                + self.completion_tokens * settings.LLM_COMPLETION_PRICE_PER_MTOK
+            ) / 1_000_000
+
+    def section_tokens(self) -> Dict[str, float]:
+        """按字符占比把 prompt_tokens 分摊到各提示词片段（估算值）；图片 token 无法按字符分摊，不做估算"""
+        total = sum(self.prompt_sections.values())
+        if not total or not self.prompt_tokens or self.kind.startswith("image"):
+            return {}
+        return {name: self.prompt_tokens * chars / total for name, chars in self.prompt_sections.items()}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "fallback": self.fallback,
+            "attempts": self.attempts,
+            "hedged": self.hedged,
+            "cache": self.cache,
+            "status": self.status,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost_usd": round(self.cost, 6) if self.cost is not None else None,
+            "ttfb_ms": self.ttfb_ms,
+            "latency_ms": self.latency_ms,
+            "prompt_sections": self.prompt_sections,
+        }
+
+class Histogram:
+    """固定分桶直方图，分位数按桶上界近似"""
+
+    def __init__(self, buckets: List[float] = LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean": round(self.sum / self.count, 1) if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": {
+                **{f"le_{b}": c for b, c in zip(self.buckets, self.counts)},
+                "le_inf": self.counts[-1],
+            },
+        }
+
+def _new_counters() -> Dict[str, float]:
+    return {
+        "calls": 0,
+        "errors": 0,
+        "cache_hits": 0,
+        "fast_path": 0,
+        "fallbacks": 0,
+        "hedged": 0,
+        "retries": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "cost_usd": 0.0,
+    }
+
+class LLMMetricsRegistry:
+    """进程内 LLM 调用聚合：按调用类型的延迟直方图、按模型/用户的计数器、按提示词片段的 token 估算"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.started_at = time.time()
+        self._latency: Dict[str, Histogram] = defaultdict(Histogram)
+        self._ttfb: Dict[str, Histogram] = defaultdict(Histogram)
+        self._by_kind: Dict[str, Dict[str, float]] = defaultdict(_new_counters)
+        self._by_model: Dict[str, Dict[str, float]] = defaultdict(_new_counters)
+        self._by_user: Dict[str, Dict[str, float]] = defaultdict(_new_counters)
+        self._sections: Dict[str, Dict[str, Dict[str, float]]] = defaultdict(
+            lambda: defaultdict(lambda: {"chars": 0, "est_tokens": 0.0})
+        )
+
+    def record(self, m: LLMCallMetrics):
+        """记录一次实际发往上游的调用"""
+        with self._lock:
+            if m.latency_ms is not None:
+                self._latency[m.kind].observe(m.latency_ms)
+            if m.ttfb_ms is not None:
+                self._ttfb[m.kind].observe(m.ttfb_ms)
+            for counters in (self._by_kind[m.kind], self._by_model[m.model or "unknown"], self._by_user[m.user_id]):
+                counters["calls"] += 1
+                counters["errors"] += 1 if m.status != "ok" else 0
+                counters["fallbacks"] += 1 if m.fallback else 0
+                counters["hedged"] += 1 if m.hedged else 0
+                counters["retries"] += max(m.attempts - 1 - (1 if m.hedged else 0), 0)
+                counters["prompt_tokens"] += m.prompt_tokens
+                counters["completion_tokens"] += m.completion_tokens
+                counters["cost_usd"] += m.cost or 0.0
+            estimated = m.section_tokens()
+            for name, chars in m.prompt_sections.items():
+                section = self._sections[m.kind][name]
+                section["chars"] += chars
+                section["est_tokens"] += estimated.get(name, 0.0)
+
+    def record_skip(self, kind: str, user_id: str, reason: str):
+        """记录未调用上游的请求：reason 为 cache（解析缓存命中）或 fast_path（本地规则解析）"""
+        field = "cache_hits" if reason == "cache" else "fast_path"
+        with self._lock:
+            self._by_kind[kind][field] += 1
+            self._by_user[user_id][field] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "since": self.started_at,
+                "latency_ms": {k: h.snapshot() for k, h in self._latency.items()},
+                "ttfb_ms": {k: h.snapshot() for k, h in self._ttfb.items()},
+                "by_kind": {k: _rounded(v) for k, v in self._by_kind.items()},
+                "by_model": {k: _rounded(v) for k, v in self._by_model.items()},
+                "prompt_sections": {
+                    kind: {name: _rounded(v) for name, v in sections.items()}
+                    for kind, sections in self._sections.items()
+                },
+            }
+
+    def user_snapshot(self, user_id: str) -> Dict[str, Any]:
+        with self._lock:
+            return _rounded(self._by_user.get(user_id) or _new_counters())
+
+def _rounded(counters: Dict[str, float]) -> Dict[str, float]:
+    return {k: round(v, 6) if isinstance(v, float) else v for k, v in counters.items()}
+
+llm_metrics = LLMMetricsRegistry()
@@ -1,8 +1,9 @@
 import asyncio
 from datetime import datetime, timedelta
-from sqlalchemy import update
+from sqlalchemy import update, delete
+from app.config import settings
 from app.models.database import AsyncSessionLocal
-from app.models.tables import StagingArea
+from app.models.tables import StagingArea, ParseJob, IdempotencyRecord
 
 async def cleanup_expired_staging():
     """
@@ -25,3 +26,25 @@ async def cleanup_expired_staging():
             print(f"清理暂存区失败: {e}")
         
         await asyncio.sleep(600) # 每 10 分钟运行一次
+
+async def cleanup_finished_jobs():
+    """
+    后台清理任务：删除超过保留时长的已完成解析任务与 Idempotency-Key 记录
+    """
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                threshold = datetime.utcnow() - timedelta(hours=settings.PARSE_JOB_RETENTION_HOURS)
+                await db.execute(
+                    delete(ParseJob).where(
+                        ParseJob.status.in_(["succeeded", "failed"]),
+                        ParseJob.finished_at < threshold
+                    )
+                )
+                key_threshold = datetime.utcnow() - timedelta(hours=settings.IDEMPOTENCY_TTL_HOURS)
+                await db.execute(delete(IdempotencyRecord).where(IdempotencyRecord.created_at < key_threshold))
+                await db.commit()
+        except Exception as e:
+            print(f"清理解析任务/幂等记录失败: {e}")
+
+        await asyncio.sleep(3600) # 每小时运行一次
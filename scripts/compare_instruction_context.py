@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+对比指令解析提示词的两种批次上下文格式（json 原格式 / compact 紧凑表格）的大小
+
+    python scripts/compare_instruction_context.py --items 30 --confirmed 5 --rejected 2
+
+token 为按字符估算的近似值；线上真实用量见 GET /v1/metrics/llm 的 prompt_sections
+"""
+import argparse
+import random
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.config import settings
+from app.routers.config import DEFAULT_CATEGORIES
+from app.services.instruction_parser import InstructionParser
+from app.utils.hash import generate_hash_id
+from app.utils.llm_metrics import estimate_tokens
+
+REMARKS = ["午饭", "买菜", "打车", "纸巾洗衣液", "话费", "电影票", "感冒药", "加油", "水果", "咖啡"]
+PAYEES = ["美团", "物美超市", "滴滴出行", "京东", "中国移动", None]
+
+def build_context(items: int, confirmed: int, rejected: int) -> dict:
+    categories = [{"main": m, "sub": s} for m, s, _ in DEFAULT_CATEGORIES]
+    batch_items = []
+    for i in range(1, items + 1):
+        cat = random.choice(categories)
+        data = {
+            "date": "2026-10-18",
+            "amount": round(random.uniform(3, 300), random.choice([0, 1, 2])),
+            "main_category": cat["main"],
+            "sub_category": cat["sub"],
+            "payee": random.choice(PAYEES),
+            "remark": random.choice(REMARKS),
+            "consumer": random.choice([None, "老婆", "儿子"]),
+            "is_essential": random.choice([0, 1]),
+            "linked_asset": random.choice([None, "招行信用卡"]),
+            "confidence": round(random.uniform(0.7, 1.0), 2),
+        }
+        data["hash_id"] = generate_hash_id("u", data["date"], data["amount"], data["remark"], data["payee"])
+        status = "confirmed" if i <= confirmed else "rejected" if i <= confirmed + rejected else "pending"
+        batch_items.append({"temp_id": i, "status": status, "data": data})
+    return {
+        "batch_id": "00000000-0000-0000-0000-000000000000",
+        "items": batch_items,
+        "categories": categories,
+        "user_payees": ["老婆", "儿子", "我"],
+        "user_assets": ["招行信用卡", "支付宝", "微信"],
+    }
+
+def measure(context: dict, fmt: str) -> dict:
+    settings.INSTRUCTION_CONTEXT_FORMAT = fmt
+    sections = {}
+    prompt = InstructionParser(llm_parser=None)._build_system_prompt(context, sections)
+    return {"chars": len(prompt), "tokens": estimate_tokens(prompt), "sections": sections}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="对比指令解析上下文格式的提示词大小")
+    parser.add_argument("--items", type=int, default=30)
+    parser.add_argument("--confirmed", type=int, default=0)
+    parser.add_argument("--rejected", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+    random.seed(args.seed)
+
+    context = build_context(args.items, args.confirmed, args.rejected)
+    legacy = measure(context, "json")
+    compact = measure(context, "compact")
+
+    print(f"批次 {args.items} 条（已确认 {args.confirmed}，已删除 {args.rejected}）")
+    print(f"{'片段':<12}{'json 字符':>12}{'compact 字符':>14}")
+    for name in legacy["sections"]:
+        print(f"{name:<12}{legacy['sections'][name]:>12}{compact['sections'].get(name, 0):>14}")
+    print("-" * 38)
+    print(f"{'合计字符':<12}{legacy['chars']:>12}{compact['chars']:>14}")
+    print(f"{'估算 token':<12}{legacy['tokens']:>12}{compact['tokens']:>14}")
+    saved = 1 - compact["tokens"] / legacy["tokens"]
+    print(f"\ncompact 格式节省约 {saved:.0%} 的提示词 token")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+端到端压测工具：按目标 RPS 发起 记账 -> 指令交互 -> 确认入库 流程，统计各环节 p50/p95/p99 与吞吐
+
+    # 1. 启动模拟 LLM 与后端（注意调高限流，默认每 IP 每分钟 60 次）
+    python scripts/mock_openrouter.py --port 8001
+    OPENROUTER_BASE_URL=http://127.0.0.1:8001/v1 OPENROUTER_API_KEY=sk-mock \\
+        RATE_LIMIT_PER_MINUTE=100000 uvicorn app.main:app --port 8000
+
+    # 2. 创建压测用户并运行
+    python scripts/load_test.py --create-users 5 --rps 10 --duration 60
+
+注册接口已禁用，--create-users 直接写入 DATABASE_URL 指向的数据库（需与后端一致）
+"""
+import argparse
+import asyncio
+import json
+import random
+import secrets
+import sys
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+TEXT_TEMPLATES = [
+    "今天在物美买菜花了{a}元",
+    "午饭外卖{a}块，晚上打车{b}元",
+    "昨天加油{a}元",
+    "给手机充值{a}元，买了纸巾{b}元",
+    "看电影{a}元",
+    "买感冒药{a}块",
+]
+
+INSTRUCTIONS = ["全部确认", "1确认", "把1改成{a}元", "删除2", "全部确认"]
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="记账流程压测")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000/v1")
+    parser.add_argument("--api-key", action="append", default=[], help="压测用户的 API Key，可重复指定")
+    parser.add_argument("--create-users", type=int, default=0, help="直接在数据库中创建 N 个压测用户")
+    parser.add_argument("--rps", type=float, default=5.0, help="每秒发起的流程数")
+    parser.add_argument("--duration", type=float, default=30.0, help="发压时长（秒）")
+    parser.add_argument("--poisson", action="store_true", help="按泊松过程发起请求（默认匀速）")
+    parser.add_argument("--max-inflight", type=int, default=500, help="同时进行中的流程上限")
+    parser.add_argument("--flow", choices=["full", "record", "stream"], default="full",
+                        help="full: 记账+交互+确认；record: 仅记账；stream: 流式记账+确认")
+    parser.add_argument("--interact-rate", type=float, default=0.5, help="full 流程中先发指令交互的比例")
+    parser.add_argument("--repeat-inputs", action="store_true", help="使用固定金额，便于观察解析缓存命中")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--json-out", default=None, help="将统计结果写入 JSON 文件")
+    return parser.parse_args(argv)
+
+async def create_users(count: int) -> List[str]:
+    """创建压测用户并初始化默认分类，返回 API Key 列表"""
+    from app.models.database import AsyncSessionLocal, init_models
+    from app.models.tables import User
+    from app.routers.config import init_user_defaults
+
+    await init_models()
+    api_keys = []
+    async with AsyncSessionLocal() as db:
+        for _ in range(count):
+            user_id = str(uuid.uuid4())
+            api_key = f"fa_{secrets.token_hex(16)}"
+            db.add(User(id=user_id, username=f"load_{user_id[:8]}", password_hash="!", api_key=api_key))
+            await db.commit()
+            await init_user_defaults(user_id, db)
+            api_keys.append(api_key)
+    return api_keys
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """最近秩法分位数"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+class Stats:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.started = 0
+        self.completed = 0
+        self.dropped = 0
+
+    def ok(self, step: str, seconds: float):
+        self.latencies[step].append(seconds)
+
+    def error(self, step: str, reason: str):
+        self.errors[step][reason] += 1
+
+    def summary(self, elapsed: float) -> Dict:
+        steps = {}
+        for step in sorted(set(self.latencies) | set(self.errors)):
+            values = sorted(self.latencies.get(step, []))
+            steps[step] = {
+                "ok": len(values),
+                "errors": dict(self.errors.get(step, {})),
+                "mean_ms": round(sum(values) / len(values) * 1000, 1) if values else 0.0,
+                "p50_ms": round(percentile(values, 50) * 1000, 1),
+                "p95_ms": round(percentile(values, 95) * 1000, 1),
+                "p99_ms": round(percentile(values, 99) * 1000, 1),
+            }
+        return {
+            "elapsed_s": round(elapsed, 2),
+            "flows_started": self.started,
+            "flows_completed": self.completed,
+            "flows_dropped": self.dropped,
+            "throughput_flows_per_s": round(self.completed / elapsed, 2) if elapsed else 0.0,
+            "steps": steps,
+        }
+
+class FlowError(Exception):
+    pass
+
+async def timed_post(client: httpx.AsyncClient, stats: Stats, step: str, url: str, **kwargs) -> Dict:
+    started = time.perf_counter()
+    try:
+        response = await client.post(url, **kwargs)
+    except httpx.HTTPError as e:
+        stats.error(step, type(e).__name__)
+        raise FlowError(step)
+    if response.status_code != 200:
+        stats.error(step, f"HTTP {response.status_code}")
+        raise FlowError(step)
+    body = response.json()
+    stats.ok(step, time.perf_counter() - started)
+    return body
+
+async def timed_stream(client: httpx.AsyncClient, stats: Stats, url: str, **kwargs) -> Optional[str]:
+    """流式记账：分别统计首个条目到达时间与完整耗时，返回 batch_id"""
+    started = time.perf_counter()
+    batch_id = None
+    first_item = None
+    try:
+        async with client.stream("POST", url, **kwargs) as response:
+            if response.status_code != 200:
+                stats.error("record_stream", f"HTTP {response.status_code}")
+                raise FlowError("record_stream")
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event["event"] == "batch":
+                    batch_id = event["batch_id"]
+                elif event["event"] == "item" and first_item is None:
+                    first_item = time.perf_counter() - started
+                elif event["event"] == "error":
+                    stats.error("record_stream", "stream_error")
+                    raise FlowError("record_stream")
+    except httpx.HTTPError as e:
+        stats.error("record_stream", type(e).__name__)
+        raise FlowError("record_stream")
+    if first_item is not None:
+        stats.ok("record_stream_first_item", first_item)
+    stats.ok("record_stream", time.perf_counter() - started)
+    return batch_id
+
+def random_text(repeat: bool) -> str:
+    template = random.choice(TEXT_TEMPLATES)
+    if repeat:
+        return template.format(a=30, b=15)
+    return template.format(a=round(random.uniform(5, 300), 1), b=round(random.uniform(5, 80), 1))
+
+async def run_flow(client: httpx.AsyncClient, stats: Stats, args: argparse.Namespace, api_key: str):
+    headers = {"Authorization": f"Bearer {api_key}"}
+    started = time.perf_counter()
+    payload = {"type": "text", "content": random_text(args.repeat_inputs)}
+    try:
+        if args.flow == "stream":
+            batch_id = await timed_stream(client, stats, "/record/stream", json=payload, headers=headers)
+        else:
+            body = await timed_post(client, stats, "record", "/record", json=payload, headers=headers)
+            batch_id = body.get("data", {}).get("batch_id")
+        if args.flow == "record" or not batch_id:
+            stats.completed += 1
+            stats.ok("flow", time.perf_counter() - started)
+            return
+
+        if args.flow == "full" and random.random() < args.interact_rate:
+            instruction = random.choice(INSTRUCTIONS).format(a=random.randint(5, 200))
+            await timed_post(client, stats, "interact", "/record/interact",
+                             json={"batch_id": batch_id, "instruction": instruction}, headers=headers)
+
+        await timed_post(client, stats, "confirm", "/record/confirm",
+                         json={"batch_id": batch_id, "action": "confirm_all"}, headers=headers)
+        stats.completed += 1
+        stats.ok("flow", time.perf_counter() - started)
+    except FlowError as e:
+        stats.error("flow", f"failed_at_{e}")
+
+async def run(args: argparse.Namespace, api_keys: List[str]) -> Dict:
+    stats = Stats()
+    limits = httpx.Limits(max_connections=args.max_inflight, max_keepalive_connections=args.max_inflight)
+    inflight = set()
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        # 开环发压：按计划时间发起，不等待前一个流程结束，避免协调遗漏 (coordinated omission)
+        started = time.perf_counter()
+        next_at = started
+        while next_at - started < args.duration:
+            await asyncio.sleep(max(next_at - time.perf_counter(), 0))
+            if len(inflight) >= args.max_inflight:
+                stats.dropped += 1
+            else:
+                stats.started += 1
+                task = asyncio.create_task(run_flow(client, stats, args, random.choice(api_keys)))
+                inflight.add(task)
+                task.add_done_callback(inflight.discard)
+            interval = 1 / args.rps
+            next_at += random.expovariate(args.rps) if args.poisson else interval
+        if inflight:
+            await asyncio.gather(*inflight)
+        elapsed = time.perf_counter() - started
+    return stats.summary(elapsed)
+
+def print_report(summary: Dict):
+    print()
+    print(f"耗时 {summary['elapsed_s']}s  发起 {summary['flows_started']}  完成 {summary['flows_completed']}  "
+          f"丢弃 {summary['flows_dropped']}  吞吐 {summary['throughput_flows_per_s']} 流程/秒")
+    print("-" * 86)
+    print(f"{'环节':<26}{'成功':>8}{'平均ms':>10}{'p50ms':>10}{'p95ms':>10}{'p99ms':>10}  错误")
+    for step, s in summary["steps"].items():
+        errors = ", ".join(f"{k}x{v}" for k, v in s["errors"].items()) or "-"
+        print(f"{step:<26}{s['ok']:>8}{s['mean_ms']:>10}{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}  {errors}")
+    if any("HTTP 429" in s["errors"] for s in summary["steps"].values()):
+        print("\n提示: 出现 429，可调高后端 RATE_LIMIT_PER_MINUTE")
+
+def main(argv=None):
+    args = parse_args(argv)
+    api_keys = list(args.api_key)
+    if args.create_users:
+        created = asyncio.run(create_users(args.create_users))
+        print(f"已创建 {len(created)} 个压测用户")
+        api_keys.extend(created)
+    if not api_keys:
+        print("❌ 请通过 --api-key 指定用户，或使用 --create-users 创建")
+        return 1
+
+    print(f"压测 {args.base_url}  flow={args.flow}  rps={args.rps}  duration={args.duration}s  users={len(api_keys)}")
+    summary = asyncio.run(run(args, api_keys))
+    print_report(summary)
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+本地模拟 OpenRouter 服务 (OpenAI chat completions 兼容)
+用于压测与联调，不消耗真实额度：
+
+    python scripts/mock_openrouter.py --port 8001 --latency-ms 1200 --error-rate 0.02
+
+后端指向该服务（API Key 任意，但不能含 xxxxx，否则后端会走内置模拟解析）：
+
+    OPENROUTER_BASE_URL=http://127.0.0.1:8001/v1 OPENROUTER_API_KEY=sk-mock uvicorn app.main:app
+
+- 记账解析请求返回 items：从文字中提取金额，图片随机生成 1~4 条
+- 指令解析请求（系统提示词含 actions）返回 actions：按指令确认/删除/修改暂存条目
+- 支持 stream=true 的 SSE 输出、可配置的延迟分布、长尾延迟与错误率
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# 金额后允许的单位，用于从文字中粗略抽取消费条目
+AMOUNT_PATTERN = re.compile(r"(\d+(?:\.\d{1,2})?)\s*(?:元|块|rmb|RMB)?")
+INDEX_PATTERN = re.compile(r"\d+")
+
+SAMPLE_ITEMS = [
+    ("餐饮", "外卖", "美团", "午饭"),
+    ("餐饮", "食材采购", "物美超市", "买菜"),
+    ("交通", "打车", "滴滴出行", "打车"),
+    ("交通", "加油", "中石油", "加油"),
+    ("购物", "日用品", "京东", "纸巾洗衣液"),
+    ("休闲娱乐", "电影", "猫眼", "看电影"),
+    ("通讯", "话费", "中国移动", "手机充值"),
+    ("医疗", "药品", "大药房", "感冒药"),
+]
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="本地模拟 OpenRouter 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-dist", choices=["fixed", "uniform", "lognormal"], default="lognormal",
+                        help="首字节延迟分布")
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="延迟中位数（毫秒）")
+    parser.add_argument("--latency-jitter", type=float, default=0.4,
+                        help="uniform 为相对中位数的浮动比例，lognormal 为 sigma")
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="长尾请求比例")
+    parser.add_argument("--tail-ms", type=float, default=8000.0, help="长尾请求额外延迟（毫秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回错误的请求比例")
+    parser.add_argument("--error-status", default="429,500,503", help="错误时随机选用的状态码")
+    parser.add_argument("--stream-chunk-chars", type=int, default=12, help="流式输出每个分片的字符数")
+    parser.add_argument("--stream-chunk-ms", type=float, default=30.0, help="流式分片间隔（毫秒）")
+    parser.add_argument("--seed", type=int, default=None)
+    return parser.parse_args(argv)
+
+def sample_latency(args: argparse.Namespace) -> float:
+    """按配置的分布采样首字节延迟（秒）"""
+    median = args.latency_ms / 1000
+    if args.latency_dist == "fixed":
+        latency = median
+    elif args.latency_dist == "uniform":
+        latency = random.uniform(median * (1 - args.latency_jitter), median * (1 + args.latency_jitter))
+    else:
+        latency = median * random.lognormvariate(0, args.latency_jitter)
+    if args.tail_rate and random.random() < args.tail_rate:
+        latency += args.tail_ms / 1000
+    return max(latency, 0.0)
+
+def estimate_tokens(text: str) -> int:
+    # 粗略估算：中文约 1 字 1 token，其余约 4 字符 1 token
+    cjk = sum(1 for ch in text if "一" <= ch <= "鿿")
+    return cjk + (len(text) - cjk) // 4 + 1
+
+def message_text(message: Dict[str, Any]) -> str:
+    content = message.get("content")
+    if isinstance(content, str):
+        return content
+    return " ".join(part.get("text", "") for part in content or [] if part.get("type") == "text")
+
+def has_image(messages: List[Dict[str, Any]]) -> bool:
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list) and any(part.get("type") == "image_url" for part in content):
+            return True
+    return False
+
+def fake_item(amount: float, date: str) -> Dict[str, Any]:
+    main, sub, payee, remark = random.choice(SAMPLE_ITEMS)
+    return {
+        "date": date,
+        "amount": amount,
+        "main_category": main,
+        "sub_category": sub,
+        "payee": payee,
+        "remark": remark,
+        "consumer": None,
+        "is_essential": 1 if main in ("餐饮", "交通", "医疗") else 0,
+        "linked_asset": None,
+        "confidence": round(random.uniform(0.8, 0.99), 2),
+    }
+
+def build_items(messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    today = datetime.now()
+    user_text = message_text(messages[-1])
+    if has_image(messages):
+        amounts = [round(random.uniform(5, 300), 2) for _ in range(random.randint(1, 4))]
+    else:
+        amounts = [float(m.group(1)) for m in AMOUNT_PATTERN.finditer(user_text)] or [round(random.uniform(5, 100), 2)]
+    date = today.strftime("%Y-%m-%d")
+    if "昨天" in user_text:
+        date = (today - timedelta(days=1)).strftime("%Y-%m-%d")
+    return {"items": [fake_item(amount, date) for amount in amounts]}
+
+def build_actions(messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """根据系统提示词中的暂存条目与用户指令，生成与 InstructionParser 约定一致的 actions"""
+    system_text = message_text(messages[0])
+    instruction = message_text(messages[-1])
+    # 紧凑格式：表格每行以编号开头，只列待确认条目
+    pending = [int(tid) for tid in re.findall(r"^(\d+)\|", system_text, re.MULTILINE)]
+    if not pending:
+        pending = [
+            int(m.group(1))
+            for m in re.finditer(r'"temp_id":\s*(\d+)[^{}]*?"status":\s*"pending"', system_text)
+        ]
+    if not pending:
+        pending = [int(tid) for tid in re.findall(r'"temp_id":\s*(\d+)', system_text)]
+
+    if "取消" in instruction:
+        return {"actions": [{"type": "cancel_all"}]}
+    targets = [int(i) for i in INDEX_PATTERN.findall(instruction) if int(i) in pending]
+    if "删" in instruction:
+        return {"actions": [{"type": "delete", "targets": targets or pending[-1:]}]}
+    if "改" in instruction and targets:
+        amount = AMOUNT_PATTERN.findall(instruction.split("改", 1)[1])
+        modifications = {"amount": float(amount[0])} if amount else {"main_category": "其他"}
+        return {"actions": [{"type": "modify", "targets": targets[:1], "modifications": modifications}]}
+    return {"actions": [{"type": "confirm", "targets": targets or pending}]}
+
+def create_app(args: argparse.Namespace) -> FastAPI:
+    app = FastAPI(title="Mock OpenRouter")
+    error_status = [int(code) for code in args.error_status.split(",") if code.strip()]
+    stats = {"requests": 0, "errors": 0, "streams": 0, "started_at": time.time()}
+
+    @app.get("/v1/models")
+    async def models():
+        return {"data": [{"id": "mock/model"}]}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        model = body.get("model", "mock/model")
+        stats["requests"] += 1
+
+        latency = sample_latency(args)
+        if args.error_rate and random.random() < args.error_rate:
+            stats["errors"] += 1
+            await asyncio.sleep(latency / 2)
+            status = random.choice(error_status)
+            headers = {"Retry-After": "1"} if status == 429 else None
+            return JSONResponse({"error": {"message": "mock upstream error", "code": status}}, status_code=status, headers=headers)
+
+        is_instruction = bool(messages) and "actions" in message_text(messages[0])
+        payload = build_actions(messages) if is_instruction else build_items(messages)
+        content = json.dumps(payload, ensure_ascii=False)
+        usage = {
+            "prompt_tokens": sum(estimate_tokens(message_text(m)) for m in messages) + (765 if has_image(messages) else 0),
+            "completion_tokens": estimate_tokens(content),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        completion_id = f"gen-{uuid.uuid4().hex[:16]}"
+
+        if not body.get("stream"):
+            await asyncio.sleep(latency)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage,
+            }
+
+        stats["streams"] += 1
+
+        async def event_stream():
+            # 与 OpenRouter 一致：等待模型期间先发注释行保活
+            yield b": OPENROUTER PROCESSING\n\n"
+            await asyncio.sleep(latency)
+            size = max(args.stream_chunk_chars, 1)
+            for start in range(0, len(content), size):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": content[start:start + size]}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8")
+                await asyncio.sleep(args.stream_chunk_ms / 1000)
+            final = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                "usage": usage,
+            }
+            yield f"data: {json.dumps(final)}\n\n".encode("utf-8")
+            yield b"data: [DONE]\n\n"
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+    return app
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.seed is not None:
+        random.seed(args.seed)
+    print(f"Mock OpenRouter: http://{args.host}:{args.port}/v1 "
+          f"(latency={args.latency_dist}:{args.latency_ms}ms, error_rate={args.error_rate})")
+    uvicorn.run(create_app(args), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
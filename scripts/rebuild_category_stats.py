@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+按已入账账目重建历史分类频次表（category_stats）
+
+    python scripts/rebuild_category_stats.py            # 全部用户
+    python scripts/rebuild_category_stats.py --user <user_id>
+
+首次上线该功能、或直接改过数据库中的账目后执行；日常入账/修改/删除会增量维护，无需重建
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import delete, select
+
+from app.models.database import AsyncSessionLocal, init_models
+from app.models.tables import CategoryStat, Expense, User
+from app.services.category_stats import update_category_stats
+
+# 每次写入的账目数，避免单条 upsert 过大
+CHUNK_SIZE = 1000
+
+async def rebuild_user(db, user_id: str) -> int:
+    await db.execute(delete(CategoryStat).where(CategoryStat.user_id == user_id))
+    result = await db.stream(
+        select(Expense.payee, Expense.remark, Expense.consumer, Expense.main_category, Expense.sub_category)
+        .where(Expense.user_id == user_id)
+        .execution_options(yield_per=CHUNK_SIZE)
+    )
+    count = 0
+    async for rows in result.partitions():
+        await update_category_stats(db, user_id, [row._asdict() for row in rows], 1)
+        count += len(rows)
+    await db.commit()
+    return count
+
+async def rebuild(user_id: str = None):
+    await init_models()
+    async with AsyncSessionLocal() as db:
+        if user_id:
+            user_ids = [user_id]
+        else:
+            user_ids = (await db.execute(select(User.id))).scalars().all()
+        for uid in user_ids:
+            count = await rebuild_user(db, uid)
+            print(f"用户 {uid}: 已统计 {count} 条账目")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="重建历史分类频次表")
+    parser.add_argument("--user", help="只重建指定用户（user_id）")
+    args = parser.parse_args(argv)
+    asyncio.run(rebuild(args.user))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
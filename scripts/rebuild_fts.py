@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+重建账目全文索引（expenses_fts）
+
+    python scripts/rebuild_fts.py
+
+服务启动时会自动创建索引表与同步触发器，并为新建的索引导入已有账目；
+触发器建立之前（如直接拷贝旧数据库、手工导入账目）写入的数据需要执行本脚本补齐
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.models import search
+from app.models.database import engine, init_models
+
+async def rebuild():
+    await init_models()
+    if not search.fts_ready:
+        print("❌ 全文索引不可用（非 SQLite、未编译 FTS5 或 EXPENSE_FTS_ENABLED=false）")
+        return
+    async with engine.begin() as conn:
+        await conn.run_sync(search.rebuild_expense_fts)
+        await conn.exec_driver_sql(f"INSERT INTO {search.FTS_TABLE}({search.FTS_TABLE}) VALUES ('optimize')")
+    print("全文索引重建完成")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="重建账目全文索引")
+    parser.parse_args(argv)
+    asyncio.run(rebuild())
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+校验 / 重建月度支出汇总（expense_rollups）
+
+    python scripts/rebuild_rollups.py --verify          # 只校验，列出与账目实际聚合不一致的条目
+    python scripts/rebuild_rollups.py                   # 全部用户重建
+    python scripts/rebuild_rollups.py --user <user_id>
+
+服务启动时会为还没有汇总的用户自动构建；直接改过数据库中的账目后执行本脚本修正
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.models.database import AsyncSessionLocal, init_models
+from app.services.expense_rollups import rebuild_rollups, verify_rollups
+
+async def run(user_id: str = None, verify: bool = False) -> int:
+    await init_models()
+    async with AsyncSessionLocal() as db:
+        if verify:
+            mismatches = await verify_rollups(db, user_id)
+            for row in mismatches:
+                print(f"{row['key']}: 账目聚合 {row['expected']}，汇总表 {row['actual']}")
+            print(f"校验完成，不一致 {len(mismatches)} 条")
+            return 1 if mismatches else 0
+        await rebuild_rollups(db, user_id)
+        await db.commit()
+        print("月度汇总重建完成")
+        return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="校验 / 重建月度支出汇总")
+    parser.add_argument("--user", help="只处理指定用户（user_id）")
+    parser.add_argument("--verify", action="store_true", help="只校验不修改，有不一致时退出码为 1")
+    args = parser.parse_args(argv)
+    sys.exit(asyncio.run(run(args.user, args.verify)))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
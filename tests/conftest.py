@@ -0,0 +1,47 @@
+import os
+import sys
+import tempfile
+import uuid
+from pathlib import Path
+
+import pytest_asyncio
+from httpx import ASGITransport, AsyncClient
+
+# 测试使用临时数据库且不访问 LLM，须在导入 app 之前设置
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/test.db"
+os.environ["OPENROUTER_API_KEY"] = ""
+os.environ["LLM_WARMUP"] = "false"
+
+from app.models.database import AsyncSessionLocal, engine, init_models
+from app.models.tables import User
+from app.routers.config import init_user_defaults
+
+@pytest_asyncio.fixture
+async def db():
+    await init_models()
+    async with AsyncSessionLocal() as session:
+        yield session
+    # 每个测试使用独立的事件循环，连接池不能跨循环复用
+    await engine.dispose()
+
+@pytest_asyncio.fixture
+async def make_user(db):
+    """创建带默认分类的新用户，测试之间互不影响"""
+    async def create() -> User:
+        user = User(id=str(uuid.uuid4()), username=uuid.uuid4().hex, password_hash="x", api_key=f"fa_{uuid.uuid4().hex}")
+        db.add(user)
+        await db.commit()
+        await init_user_defaults(user.id, db)
+        return user
+    return create
+
+@pytest_asyncio.fixture
+async def user(make_user) -> User:
+    return await make_user()
+
+@pytest_asyncio.fixture
+async def client(db):
+    from app.main import app
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as c:
+        yield c
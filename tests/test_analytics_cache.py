@@ -0,0 +1,56 @@
+import pytest
+from sqlalchemy import func, select
+
+from app.models.tables import Expense
+from app.services.analytics import analytics_cache
+from app.services.data_version import bump_on_commit
+from app.services.expense_writer import expense_values, insert_expenses
+
+def auth_headers(user) -> dict:
+    return {"Authorization": f"Bearer {user.api_key}"}
+
+def expense(day: str, amount: float, main: str, remark: str) -> dict:
+    return {"date": f"2025-03-{day}", "amount": amount, "main_category": main, "sub_category": "其他", "remark": remark}
+
+async def add(db, user, *items):
+    await insert_expenses(db, user.id, [expense_values(user.id, item, "test") for item in items])
+    await db.commit()
+
+async def assert_matches_database(db, user):
+    """快照按一级分类的金额与笔数应与数据库聚合一致"""
+    columns = await analytics_cache.get(db, user.id)
+    snapshot = {g["key"]: (g["amount"], g["count"]) for g in columns.breakdown("main_category", columns.mask())}
+    result = await db.execute(
+        select(Expense.main_category, func.sum(Expense.amount), func.count())
+        .where(Expense.user_id == user.id)
+        .group_by(Expense.main_category)
+    )
+    assert snapshot == {main: (round(total, 2), count) for main, total, count in result.all()}
+    return columns
+
+@pytest.mark.asyncio
+async def test_incremental_changes_match_database(db, client, user):
+    await add(db, user, expense("01", 12.5, "餐饮", "午餐"), expense("02", 30, "交通", "打车"))
+    cached = await assert_matches_database(db, user)
+
+    await add(db, user, expense("03", 8, "餐饮", "早餐"), expense("03", 8, "餐饮", "早餐2"))
+    ids = (await db.execute(select(Expense.id).where(Expense.user_id == user.id).order_by(Expense.id))).scalars().all()
+    headers = auth_headers(user)
+    assert (await client.put(f"/v1/expenses/{ids[0]}", json={"amount": 20, "main_category": "购物"}, headers=headers)).status_code == 200
+    assert (await client.delete(f"/v1/expenses/{ids[1]}", headers=headers)).status_code == 200
+    assert (await client.delete(f"/v1/expenses/{ids[2]}", headers=headers)).status_code == 200
+
+    # 本进程的变动按版本增量并入，不重新加载
+    assert await assert_matches_database(db, user) is cached
+
+@pytest.mark.asyncio
+async def test_write_from_other_process_reloads(db, user):
+    await add(db, user, expense("01", 12.5, "餐饮", "午餐"))
+    cached = await assert_matches_database(db, user)
+
+    # 另一个进程入账：不经过本进程的提交钩子，只有库里的账目与数据版本变化
+    db.add(Expense(**expense_values(user.id, expense("05", 99, "医疗", "挂号"), "test")))
+    await bump_on_commit(db, user.id)
+    await db.commit()
+
+    assert await assert_matches_database(db, user) is not cached
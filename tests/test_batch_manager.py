@@ -0,0 +1,75 @@
+import pytest
+from sqlalchemy import select
+
+from app.models.tables import Expense, StagingArea
+from app.services.batch_manager import BatchManager
+from app.services.instruction_grammar import InstructionGrammar
+
+def items():
+    return [
+        {"date": "2025-03-01", "amount": 10.0 * i, "main_category": "餐饮", "sub_category": "外卖", "remark": f"午餐{i}"}
+        for i in (1, 2, 3)
+    ]
+
+async def statuses(db, batch_id):
+    result = await db.execute(select(StagingArea.temp_id, StagingArea.status).where(StagingArea.batch_id == batch_id))
+    return dict(result.all())
+
+async def expense_amounts(db, user_id):
+    result = await db.execute(select(Expense.amount).where(Expense.user_id == user_id).order_by(Expense.amount))
+    return list(result.scalars().all())
+
+async def apply_instruction(db, user_id, batch_id, instruction):
+    manager = BatchManager(db)
+    actions = InstructionGrammar(await manager.get_batch_context(user_id, batch_id)).parse(instruction)
+    return await manager.apply_actions(user_id, batch_id, actions)
+
+@pytest.mark.asyncio
+async def test_confirm_then_rest_delete(db, user):
+    batch_id = await BatchManager(db).create_batch(user.id, items())
+    await apply_instruction(db, user.id, batch_id, "1确认，其他删除")
+    assert await statuses(db, batch_id) == {1: "confirmed", 2: "rejected", 3: "rejected"}
+    assert await expense_amounts(db, user.id) == [10.0]
+
+@pytest.mark.asyncio
+async def test_confirm_all_except_deleted(db, user):
+    batch_id = await BatchManager(db).create_batch(user.id, items())
+    await apply_instruction(db, user.id, batch_id, "全部确认，3删除")
+    assert await statuses(db, batch_id) == {1: "confirmed", 2: "confirmed", 3: "rejected"}
+    assert await expense_amounts(db, user.id) == [10.0, 20.0]
+
+@pytest.mark.asyncio
+async def test_later_cancel_keeps_rows_confirmed_in_plan(db, user):
+    """LLM 给出的操作序列中，确认之后的 cancel_all/delete 不撤销本次已确认的条目"""
+    batch_id = await BatchManager(db).create_batch(user.id, items())
+    await BatchManager(db).apply_actions(user.id, batch_id, [
+        {"type": "confirm", "targets": [1]},
+        {"type": "delete", "targets": [1]},
+        {"type": "cancel_all"},
+    ])
+    assert await statuses(db, batch_id) == {1: "confirmed", 2: "rejected", 3: "rejected"}
+    assert await expense_amounts(db, user.id) == [10.0]
+
+@pytest.mark.asyncio
+async def test_inserted_data_matches_final_staging_data(db, user):
+    batch_id = await BatchManager(db).create_batch(user.id, items())
+    result = await BatchManager(db).apply_actions(user.id, batch_id, [
+        {"type": "confirm", "targets": [2]},
+        {"type": "modify", "targets": [2], "modifications": {"amount": 99.0}},
+    ])
+    assert next(r for r in result if r["temp_id"] == 2)["data"]["amount"] == 99.0
+    assert await expense_amounts(db, user.id) == [99.0]
+
+@pytest.mark.asyncio
+async def test_finished_rows_are_not_changed(db, user):
+    """之前请求已入账的条目不再被删除或修改"""
+    manager = BatchManager(db)
+    batch_id = await manager.create_batch(user.id, items())
+    await manager.apply_actions(user.id, batch_id, [{"type": "confirm", "targets": [1]}])
+    result = await manager.apply_actions(user.id, batch_id, [
+        {"type": "modify", "targets": [1], "modifications": {"amount": 1.0}},
+        {"type": "cancel_all"},
+    ])
+    assert next(r for r in result if r["temp_id"] == 1)["data"]["amount"] == 10.0
+    assert await statuses(db, batch_id) == {1: "confirmed", 2: "rejected", 3: "rejected"}
+    assert await expense_amounts(db, user.id) == [10.0]
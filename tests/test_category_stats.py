@@ -0,0 +1,22 @@
+import pytest
+
+from app.services.category_stats import category_predictor, update_category_stats
+from app.services.data_version import bump_on_commit
+
+EXPENSE = {"payee": "美团", "remark": "午餐", "consumer": None, "main_category": "餐饮", "sub_category": "外卖"}
+
+@pytest.mark.asyncio
+async def test_model_reloads_after_write_from_other_process(db, user, monkeypatch):
+    monkeypatch.setattr("app.config.settings.CATEGORY_PREDICT_MIN_SUPPORT", 1)
+    model = await category_predictor.get(db, user.id)
+    assert await category_predictor.get(db, user.id) is model
+    assert model.predict("美团", None, None) is None
+
+    # 另一个进程入账：统计与版本在库里变化，本进程的提交钩子不会触发
+    await update_category_stats(db, user.id, [EXPENSE] * 4, 1)
+    db.info.pop("invalidate_category_model", None)
+    await bump_on_commit(db, user.id)
+    await db.commit()
+
+    prediction = (await category_predictor.get(db, user.id)).predict("美团", None, None)
+    assert (prediction.main, prediction.sub) == ("餐饮", "外卖")
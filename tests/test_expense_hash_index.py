@@ -0,0 +1,36 @@
+import pytest
+
+from app.models.tables import Expense
+from app.services.auditor import Auditor
+from app.services.data_version import bump_on_commit
+from app.services.expense_hash_index import expense_hash_index
+from app.services.expense_writer import expense_values, insert_expenses
+
+ITEM = {"date": "2025-03-01", "amount": 12.5, "main_category": "餐饮", "sub_category": "外卖", "remark": "午餐"}
+
+@pytest.mark.asyncio
+async def test_write_from_other_process_is_not_reported_new(db, user, monkeypatch):
+    monkeypatch.setattr("app.config.settings.DUPLICATE_FILTER_ENABLED", True)
+    item = dict(ITEM)
+    assert not (await Auditor(db).check_duplicates(user.id, [item]))[0]["is_duplicate"]
+
+    # 另一个进程入账：不经过本进程的提交钩子，只有库里的账目与数据版本变化
+    db.add(Expense(**expense_values(user.id, item, "test")))
+    await bump_on_commit(db, user.id)
+    await db.commit()
+    # 绕过钩子后，本进程缓存仍是旧内容
+    assert user.id in expense_hash_index._users
+
+    again = (await Auditor(db).check_duplicates(user.id, [dict(ITEM)]))[0]
+    assert again["is_duplicate"]
+
+@pytest.mark.asyncio
+async def test_local_insert_updates_index_incrementally(db, user, monkeypatch):
+    monkeypatch.setattr("app.config.settings.DUPLICATE_FILTER_ENABLED", True)
+    await Auditor(db).check_duplicates(user.id, [dict(ITEM)])
+    version = expense_hash_index._users[user.id][0]
+
+    await insert_expenses(db, user.id, [expense_values(user.id, dict(ITEM), "test")])
+    await db.commit()
+    assert expense_hash_index._users[user.id][0] == version + 1
+    assert (await Auditor(db).check_duplicates(user.id, [dict(ITEM)]))[0]["is_duplicate"]
@@ -0,0 +1,47 @@
+import pytest
+
+from app.services.expense_writer import expense_values, insert_expenses
+
+def auth_headers(user) -> dict:
+    return {"Authorization": f"Bearer {user.api_key}"}
+
+async def add_expenses(db, user, count):
+    # 每天两条，(date, id) 排序需要在同一天内按 id 区分
+    rows = [
+        {"date": f"2025-03-{i // 2 + 1:02d}", "amount": float(i + 1), "main_category": "餐饮", "remark": f"第{i}笔"}
+        for i in range(count)
+    ]
+    await insert_expenses(db, user.id, [expense_values(user.id, row, "test") for row in rows])
+    await db.commit()
+
+@pytest.mark.asyncio
+async def test_cursor_pages_match_offset_pages(db, client, user):
+    headers = auth_headers(user)
+    await add_expenses(db, user, 11)
+
+    offset_ids = []
+    for page in (1, 2, 3):
+        data = (await client.get(f"/v1/expenses?page={page}&page_size=4", headers=headers)).json()["data"]
+        offset_ids.append([i["id"] for i in data["items"]])
+    assert data["pagination"]["has_more"] is False
+
+    cursor_ids, cursors = [], []
+    url = "/v1/expenses?page_size=4"
+    while url:
+        data = (await client.get(url, headers=headers)).json()["data"]
+        cursor_ids.append([i["id"] for i in data["items"]])
+        cursors.append(data["pagination"])
+        next_cursor = data["pagination"]["next_cursor"]
+        url = f"/v1/expenses?page_size=4&cursor={next_cursor}" if next_cursor else None
+    assert cursor_ids == offset_ids
+    assert "total" not in cursors[-1]
+
+    # 从最后一页往回翻
+    prev_cursor = cursors[-1]["prev_cursor"]
+    data = (await client.get(f"/v1/expenses?page_size=4&cursor={prev_cursor}", headers=headers)).json()["data"]
+    assert [i["id"] for i in data["items"]] == offset_ids[1]
+
+@pytest.mark.asyncio
+async def test_invalid_cursor_is_rejected(client, user):
+    response = await client.get("/v1/expenses?cursor=not-a-cursor", headers=auth_headers(user))
+    assert response.status_code == 400
@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException, Response
+from starlette.requests import Request
+
+from app.services.batch_manager import BatchManager
+from app.services.idempotency import idempotency_store, idempotent
+
+ITEM = {"date": "2025-03-01", "amount": 12.5, "main_category": "餐饮", "sub_category": "外卖", "remark": "午餐", "hash_id": "h-idem"}
+
+def auth_headers(user, key: str) -> dict:
+    return {"Authorization": f"Bearer {user.api_key}", "Idempotency-Key": key}
+
+def keyed_request(key: str) -> Request:
+    return Request({"type": "http", "method": "POST", "path": "/", "headers": [(b"idempotency-key", key.encode())]})
+
+@pytest.mark.asyncio
+async def test_retry_replays_first_response(db, client, user):
+    batch_id = await BatchManager(db).create_batch(user.id, [dict(ITEM)])
+    body = {"batch_id": batch_id, "action": "confirm_all"}
+
+    first = await client.post("/v1/record/confirm", json=body, headers=auth_headers(user, "confirm-1"))
+    replay = await client.post("/v1/record/confirm", json=body, headers=auth_headers(user, "confirm-1"))
+    assert first.status_code == replay.status_code == 200
+    assert replay.headers["Idempotent-Replayed"] == "true"
+    assert replay.json() == first.json()
+    assert first.json()["data"]["confirmed_count"] == 1
+
+@pytest.mark.asyncio
+async def test_same_key_with_different_body_is_rejected(db, client, user):
+    batch_id = await BatchManager(db).create_batch(user.id, [dict(ITEM)])
+    await client.post("/v1/record/confirm", json={"batch_id": batch_id, "action": "reject_all"}, headers=auth_headers(user, "confirm-2"))
+
+    response = await client.post("/v1/record/confirm", json={"batch_id": batch_id, "action": "confirm_all"}, headers=auth_headers(user, "confirm-2"))
+    assert response.status_code == 422
+
+@pytest.mark.asyncio
+async def test_concurrent_request_with_same_key_conflicts(user):
+    assert await idempotency_store.begin(user.id, "busy", "hash") is None
+    with pytest.raises(HTTPException) as exc:
+        await idempotency_store.begin(user.id, "busy", "hash")
+    assert exc.value.status_code == 409
+
+@pytest.mark.asyncio
+async def test_cancelled_request_releases_key(user):
+    async def handler():
+        raise asyncio.CancelledError()
+
+    with pytest.raises(asyncio.CancelledError):
+        await idempotent(keyed_request("cancelled"), Response(), user.id, "test", {}, handler)
+    # Key 已释放，客户端可以用同一个 Key 重试
+    assert await idempotency_store.begin(user.id, "cancelled", "hash") is None
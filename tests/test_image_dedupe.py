@@ -0,0 +1,46 @@
+import io
+
+import pytest
+from PIL import Image, ImageDraw
+
+from app.services.image_dedupe import ImageDeduper
+from app.utils.image import prepare_image
+
+def receipt(amount: str, day: str, fmt: str = "PNG") -> bytes:
+    img = Image.new("RGB", (320, 480), "white")
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((0, 0, 320, 60), fill=(30, 120, 200))
+    draw.text((20, 100), "Meituan", fill="black")
+    draw.text((20, 140), f"-{amount}", fill="black")
+    draw.text((20, 180), f"2025-03-{day}", fill="black")
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt)
+    return buffer.getvalue()
+
+ITEMS = [{"date": "2025-03-01", "amount": 12.5, "main_category": "餐饮", "sub_category": "外卖"}]
+
+async def remember(db, user, image_bytes: bytes):
+    ImageDeduper(db).remember(user.id, prepare_image(image_bytes), ITEMS)
+    await db.commit()
+
+@pytest.mark.asyncio
+async def test_identical_pixels_reuse_items(db, user):
+    await remember(db, user, receipt("12.50", "01"))
+    found = await ImageDeduper(db).find(user.id, prepare_image(receipt("12.50", "01")))
+    assert found == [{**ITEMS[0], "reused_from_image": True}]
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("amount, day", [("12.80", "01"), ("12.50", "02")])
+async def test_changed_amount_or_date_is_parsed_again(db, user, amount, day):
+    await remember(db, user, receipt("12.50", "01"))
+    changed = prepare_image(receipt(amount, day))
+    deduper = ImageDeduper(db)
+    assert await deduper.find(user.id, changed) is None
+    # 感知哈希相近只作为疑似重复提示
+    assert await deduper.similar(user.id, changed)
+
+@pytest.mark.asyncio
+async def test_other_users_screenshots_are_not_reused(db, user, make_user):
+    await remember(db, user, receipt("12.50", "01"))
+    other = await make_user()
+    assert await ImageDeduper(db).find(other.id, prepare_image(receipt("12.50", "01"))) is None
@@ -0,0 +1,48 @@
+from app.services.instruction_grammar import InstructionGrammar
+
+def grammar(pending=(1, 2, 3), done=()):
+    items = [{"temp_id": i, "status": "pending"} for i in pending]
+    items += [{"temp_id": i, "status": "confirmed"} for i in done]
+    return InstructionGrammar({"items": items, "categories": [{"main": "交通", "sub": "交通工具"}]})
+
+def test_confirm_all():
+    assert grammar().parse("全部确认") == [{"type": "confirm", "targets": [1, 2, 3]}]
+
+def test_delete_all_alone_cancels_batch():
+    assert grammar().parse("全部删除") == [{"type": "cancel_all"}]
+
+def test_rest_delete_excludes_confirmed_targets():
+    """ "1确认，其他删除" 只删除 1 以外的条目 """
+    assert grammar().parse("1确认，其他删除") == [
+        {"type": "confirm", "targets": [1]},
+        {"type": "delete", "targets": [2, 3]},
+    ]
+
+def test_confirm_all_excludes_deleted_targets():
+    assert grammar().parse("全部确认，3删除") == [
+        {"type": "confirm", "targets": [1, 2]},
+        {"type": "delete", "targets": [3]},
+    ]
+
+def test_rest_before_named_clause():
+    assert grammar().parse("剩下的确认，2删掉") == [
+        {"type": "confirm", "targets": [1, 3]},
+        {"type": "delete", "targets": [2]},
+    ]
+
+def test_rest_only_covers_pending():
+    assert grammar(pending=(2, 3), done=(1,)).parse("2删除，其余确认") == [
+        {"type": "delete", "targets": [2]},
+        {"type": "confirm", "targets": [3]},
+    ]
+
+def test_modify_does_not_narrow_rest():
+    assert grammar().parse("1金额改为80，全部确认") == [
+        {"type": "modify", "targets": [1], "modifications": {"amount": 80.0}},
+        {"type": "confirm", "targets": [1, 2, 3]},
+    ]
+
+def test_conflicting_verbs_fall_back_to_llm():
+    assert grammar().parse("1确认，1删除") is None
+    assert grammar().parse("除了3都确认，1删除") is None
+    assert grammar().parse("全部确认，全部删除") is None
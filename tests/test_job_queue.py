@@ -0,0 +1,53 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.tables import ParseJob
+from app.services.job_queue import ParseJobQueue
+
+async def add_job(db, user, status="queued", lease_until=None) -> str:
+    job = ParseJob(id=str(uuid.uuid4()), user_id=user.id, status=status, input_type="text", payload="午饭 20", attempts=0, lease_until=lease_until)
+    db.add(job)
+    await db.commit()
+    return job.id
+
+def started_queue() -> ParseJobQueue:
+    queue = ParseJobQueue()
+    queue._queue = asyncio.Queue()
+    return queue
+
+@pytest.mark.asyncio
+async def test_only_one_claim_wins(db, user):
+    from app.models.database import AsyncSessionLocal
+
+    job_id = await add_job(db, user)
+    # 两个进程的工作协程同时认领同一个任务
+    async def claim():
+        async with AsyncSessionLocal() as session:
+            return await ParseJobQueue()._claim(session, job_id)
+
+    assert sorted(await asyncio.gather(claim(), claim())) == [False, True]
+    db.expire_all()
+    job = await db.get(ParseJob, job_id)
+    assert (job.status, job.attempts) == ("running", 1)
+    assert job.lease_until > datetime.utcnow()
+
+@pytest.mark.asyncio
+async def test_resume_requeues_only_expired_leases(db, user):
+    live = await add_job(db, user, "running", datetime.utcnow() + timedelta(minutes=1))
+    expired = await add_job(db, user, "running", datetime.utcnow() - timedelta(seconds=1))
+
+    queue = started_queue()
+    await queue._resume()
+    assert expired in queue._queued_ids
+    assert live not in queue._queued_ids
+
+    db.expire_all()
+    assert (await db.get(ParseJob, live)).status == "running"
+    assert (await db.get(ParseJob, expired)).status == "queued"
+
+    # 再次扫描不会重复入队
+    await queue._resume()
+    assert queue._queue.qsize() == len(queue._queued_ids)
@@ -0,0 +1,158 @@
+import asyncio
+import time
+from contextlib import contextmanager
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.services.llm_transport import CircuitBreaker, LLMTransport, configured_endpoints
+
+COMPLETION = {"choices": [{"message": {"content": "{}"}}]}
+
+@pytest.fixture(autouse=True)
+def transport_settings(monkeypatch):
+    monkeypatch.setattr(settings, "OPENROUTER_MODEL", "primary")
+    monkeypatch.setattr(settings, "LLM_FALLBACK_MODELS", "backup")
+    monkeypatch.setattr(settings, "LLM_MAX_RETRIES", 0)
+    monkeypatch.setattr(settings, "LLM_HEDGE_ENABLED", False)
+
+def transport(handler) -> LLMTransport:
+    return LLMTransport(httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://llm"))
+
+def half_open(breaker: CircuitBreaker):
+    breaker.failures = breaker.failure_threshold
+    breaker.opened_at = time.monotonic() - breaker.reset_seconds - 1
+
+def endpoint(model: str):
+    return next(e for e in configured_endpoints() if e.model == model)
+
+def test_half_open_admits_a_single_probe():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    half_open(breaker)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+@pytest.mark.asyncio
+async def test_unused_fallback_probe_is_not_taken():
+    """主模型成功时不应占用备用模型的半开试探名额"""
+    client = transport(lambda request: httpx.Response(200, json=COMPLETION))
+    backup = client.breaker(endpoint("backup"))
+    half_open(backup)
+
+    assert await client.chat({"messages": []}) == COMPLETION
+    assert backup.state == "half_open"
+    assert backup.allow()
+
+@pytest.mark.asyncio
+async def test_cancelled_probe_is_released():
+    started = asyncio.Event()
+
+    async def handler(request):
+        started.set()
+        await asyncio.sleep(10)
+        return httpx.Response(200, json=COMPLETION)
+
+    client = transport(handler)
+    primary = client.breaker(endpoint("primary"))
+    half_open(primary)
+
+    task = asyncio.create_task(client.chat({"messages": []}))
+    await started.wait()
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert primary.allow()
+
+@pytest.mark.asyncio
+async def test_stream_error_after_yield_releases_probe():
+    client = transport(lambda request: httpx.Response(200, content=b"data: {}\n\n"))
+    primary = client.breaker(endpoint("primary"))
+    half_open(primary)
+
+    with pytest.raises(RuntimeError):
+        async with client.stream({"messages": []}):
+            raise RuntimeError("consumer failed")
+    assert primary.state == "closed"
+    assert primary.allow()
+
+@pytest.mark.asyncio
+async def test_stream_falls_back_on_non_retryable_status():
+    def handler(request):
+        if b'"primary"' in request.content:
+            return httpx.Response(400, json={"error": "model not supported"})
+        return httpx.Response(200, content=b"data: {}\n\n")
+
+    client = transport(handler)
+    async with client.stream({"messages": []}) as response:
+        assert response.status_code == 200
+        assert b'"backup"' in response.request.content
+    assert client.breaker(endpoint("primary")).failures == 1
+
+@pytest.mark.asyncio
+async def test_stream_raises_last_status_when_every_model_fails():
+    client = transport(lambda request: httpx.Response(400))
+    with pytest.raises(httpx.HTTPStatusError):
+        async with client.stream({"messages": []}):
+            pass
+
+@pytest.mark.asyncio
+async def test_failed_probe_falls_back_and_reopens():
+    def handler(request):
+        if b'"primary"' in request.content:
+            return httpx.Response(503)
+        return httpx.Response(200, json=COMPLETION)
+
+    client = transport(handler)
+    primary = client.breaker(endpoint("primary"))
+    half_open(primary)
+
+    assert await client.chat({"messages": []}) == COMPLETION
+    assert primary.state == "open"
+
+@pytest.mark.asyncio
+async def test_cancelling_caller_cancels_hedged_request(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_ENABLED", True)
+    monkeypatch.setattr(settings, "LLM_HEDGE_MIN_DELAY", 5.0)
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def handler(request):
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        return httpx.Response(200, json=COMPLETION)
+
+    client = transport(handler)
+    for _ in range(20):
+        client._tracker(endpoint("primary")).add(0.01)
+
+    task = asyncio.create_task(client.chat({"messages": []}))
+    await started.wait()
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    await asyncio.wait_for(cancelled.wait(), timeout=1)
+
+def test_openrouter_key_is_only_sent_to_its_host(monkeypatch):
+    from app.services.llm_client import api_key_for
+
+    monkeypatch.setattr(settings, "OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+    monkeypatch.setattr(settings, "OPENROUTER_API_KEY", "sk-or-secret")
+    monkeypatch.setattr(settings, "LLM_ENDPOINT_API_KEYS", "api.deepseek.com=sk-ds==")
+
+    assert api_key_for("https://openrouter.ai/api/v1") == "sk-or-secret"
+    assert api_key_for("https://api.deepseek.com/v1") == "sk-ds=="
+    assert api_key_for("https://api.groq.com/openai/v1") is None
@@ -0,0 +1,16 @@
+import pytest
+
+def auth_headers(user) -> dict:
+    return {"Authorization": f"Bearer {user.api_key}"}
+
+@pytest.mark.asyncio
+async def test_global_llm_metrics_are_admin_only(client, user, make_user, monkeypatch):
+    admin = await make_user()
+    monkeypatch.setattr("app.config.settings.METRICS_ADMIN_USERNAMES", admin.username)
+
+    mine = (await client.get("/v1/metrics/llm", headers=auth_headers(user))).json()["data"]
+    assert mine["global"] is None
+    assert isinstance(mine["user"], dict)
+
+    admin_view = (await client.get("/v1/metrics/llm", headers=auth_headers(admin))).json()["data"]
+    assert "by_model" in admin_view["global"]
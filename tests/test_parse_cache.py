@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from app.services.parse_cache import ParseCache
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_compute_once():
+    cache = ParseCache(max_entries=10, ttl_seconds=60)
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return [{"amount": 1}]
+
+    results = await asyncio.gather(*(cache.get_or_compute("k", compute) for _ in range(5)))
+    assert calls == 1
+    assert results == [[{"amount": 1}]] * 5
+    assert await cache.get_or_compute("k", compute) == [{"amount": 1}]
+    assert calls == 1
+
+@pytest.mark.asyncio
+async def test_leader_cancellation_does_not_cancel_waiters():
+    cache = ParseCache(max_entries=10, ttl_seconds=60)
+    started = asyncio.Event()
+
+    async def compute():
+        started.set()
+        await asyncio.sleep(0.05)
+        return [{"amount": 2}]
+
+    leader = asyncio.create_task(cache.get_or_compute("k", compute))
+    await started.wait()
+    waiter = asyncio.create_task(cache.get_or_compute("k", compute))
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    assert await waiter == [{"amount": 2}]
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+    # 结果照常写入缓存
+    assert await cache.get("k") == [{"amount": 2}]
+
+@pytest.mark.asyncio
+async def test_errors_are_shared_but_not_cached():
+    cache = ParseCache(max_entries=10, ttl_seconds=60)
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream")
+
+    results = await asyncio.gather(*(cache.get_or_compute("k", failing) for _ in range(3)), return_exceptions=True)
+    assert all(isinstance(r, ValueError) for r in results)
+
+    async def compute():
+        return [{"amount": 3}]
+
+    assert await cache.get_or_compute("k", compute) == [{"amount": 3}]
@@ -0,0 +1,19 @@
+import pytest
+
+from app.models.tables import Payee
+from app.services.data_version import bump_on_commit
+from app.services.prompt_cache import user_context_cache
+
+@pytest.mark.asyncio
+async def test_context_is_reused_until_data_version_changes(db, user):
+    ctx = await user_context_cache.get(db, user.id)
+    assert await user_context_cache.get(db, user.id) is ctx
+
+    # 另一个进程新增成员：本进程没有调用 invalidate，只有库里的数据与版本变化
+    db.add(Payee(user_id=user.id, name="老王"))
+    await bump_on_commit(db, user.id)
+    await db.commit()
+
+    fresh = await user_context_cache.get(db, user.id)
+    assert fresh is not ctx
+    assert "老王" in fresh.payees
@@ -0,0 +1,100 @@
+import pytest
+
+from app.services.expense_writer import expense_values, insert_expenses
+
+def auth_headers(user) -> dict:
+    return {"Authorization": f"Bearer {user.api_key}"}
+
+async def add_expense(db, user, **fields):
+    data = {"date": "2025-03-01", "amount": 12.5, "main_category": "餐饮", "sub_category": "外卖", "remark": "午餐", **fields}
+    await insert_expenses(db, user.id, [expense_values(user.id, data, "test")])
+    await db.commit()
+
+@pytest.mark.asyncio
+async def test_conditional_get_and_cache_hit(client, user):
+    headers = auth_headers(user)
+    first = await client.get("/v1/config/payees", headers=headers)
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "private, no-cache"
+
+    second = await client.get("/v1/config/payees", headers=headers)
+    assert second.headers.get("X-Cache") == "hit"
+    assert second.json() == first.json()
+
+    not_modified = await client.get("/v1/config/payees", headers={**headers, "If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+
+@pytest.mark.asyncio
+async def test_query_order_does_not_change_etag(client, user):
+    headers = auth_headers(user)
+    a = await client.get("/v1/expenses?page=1&page_size=5", headers=headers)
+    b = await client.get("/v1/expenses?page_size=5&page=1", headers=headers)
+    assert a.headers["ETag"] == b.headers["ETag"]
+    assert b.headers.get("X-Cache") == "hit"
+
+@pytest.mark.asyncio
+async def test_etag_is_scoped_to_user(client, user, make_user):
+    other = await make_user()
+    mine = await client.get("/v1/config/payees", headers=auth_headers(user))
+    theirs = await client.get("/v1/config/payees", headers=auth_headers(other))
+    assert mine.headers["ETag"] != theirs.headers["ETag"]
+
+    # 共用客户端切换账号时带着上一个账号的 ETag
+    switched = await client.get("/v1/config/payees", headers={**auth_headers(other), "If-None-Match": mine.headers["ETag"]})
+    assert switched.status_code == 200
+
+@pytest.mark.asyncio
+async def test_config_write_invalidates(client, user):
+    headers = auth_headers(user)
+    etag = (await client.get("/v1/config/payees", headers=headers)).headers["ETag"]
+    await client.post("/v1/config/payees", json={"name": "老王"}, headers=headers)
+
+    response = await client.get("/v1/config/payees", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers.get("X-Cache") is None
+    assert [p["name"] for p in response.json()["data"]] == ["老王"]
+
+@pytest.mark.asyncio
+async def test_expense_writes_invalidate(db, client, user):
+    headers = auth_headers(user)
+    await add_expense(db, user)
+    listing = await client.get("/v1/expenses", headers=headers)
+    expense_id = listing.json()["data"]["items"][0]["id"]
+
+    # 只改不参与统计的 linked_asset 也要让列表失效
+    await client.put(f"/v1/expenses/{expense_id}", json={"linked_asset": "支付宝"}, headers=headers)
+    response = await client.get("/v1/expenses", headers={**headers, "If-None-Match": listing.headers["ETag"]})
+    assert response.status_code == 200
+    assert response.json()["data"]["items"][0]["linked_asset"] == "支付宝"
+
+    await client.delete(f"/v1/expenses/{expense_id}", headers=headers)
+    response = await client.get("/v1/expenses", headers={**headers, "If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 200
+    assert response.json()["data"]["items"] == []
+
+@pytest.mark.asyncio
+async def test_unchanged_put_keeps_etag(db, client, user):
+    headers = auth_headers(user)
+    await add_expense(db, user, linked_asset="现金")
+    listing = await client.get("/v1/expenses", headers=headers)
+    expense_id = listing.json()["data"]["items"][0]["id"]
+
+    await client.put(f"/v1/expenses/{expense_id}", json={"linked_asset": "现金"}, headers=headers)
+    response = await client.get("/v1/expenses", headers={**headers, "If-None-Match": listing.headers["ETag"]})
+    assert response.status_code == 304
+
+@pytest.mark.asyncio
+async def test_version_bumped_by_other_process_invalidates(db, client, user):
+    from app.services.data_version import bump_on_commit
+
+    headers = auth_headers(user)
+    etag = (await client.get("/v1/config/payees", headers=headers)).headers["ETag"]
+    # 模拟另一个 worker 进程的写入：只改库里的版本，本进程没有收到任何通知
+    await bump_on_commit(db, user.id)
+    await db.commit()
+
+    response = await client.get("/v1/config/payees", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers.get("X-Cache") is None
+    assert response.headers["ETag"] != etag